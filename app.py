@@ -1,24 +1,193 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, request, jsonify, send_file, stream_with_context, after_this_request
 import os
 import subprocess
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge, UnprocessableEntity
 import uuid
-import shutil
-import tempfile
 import logging
-from PIL import Image, ImageColor
 import io
-import cv2
-import numpy as np
 import time
+import threading
+import hashlib
+import math
+import json
+import mimetypes
+import zipfile
+import zlib
+import itertools
+import functools
+import importlib
+import importlib.util
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import fcntl
+from collections import namedtuple
+from cache import LRUCache, DiskCache, ResultCache
+import jobs
+import layout
+from magick_pool import MagickBatchPool
+from costmodel import CostModel, megapixel_bucket
+import benchmark
+import encoding
+import metrics
+import uploads
+from engines import EngineRegistry, lazy_import
+
+# Optional Pillow plugins providing the AVIF and JPEG XL encoders
+PILLOW_FORMAT_PLUGINS = {'avif': 'pillow_avif', 'jxl': 'pillow_jxl'}
+
+def _configure_pillow(module):
+    # Pillow's own decompression bomb check follows the pixel budget
+    module.MAX_IMAGE_PIXELS = app.config['MAX_IMAGE_PIXELS']
+    # The plugins register their formats when imported
+    for output_format, plugin in PILLOW_FORMAT_PLUGINS.items():
+        if _pillow_plugin_installed(output_format):
+            importlib.import_module(plugin)
+
+@functools.lru_cache(maxsize=None)
+def _pillow_plugin_installed(output_format):
+    # Found without importing it (nor Pillow)
+    return importlib.util.find_spec(PILLOW_FORMAT_PLUGINS[output_format]) is not None
+
+# Heavy libraries are imported on first use (or at startup with PRELOAD_ENGINES)
+Image = lazy_import('PIL.Image', on_load=_configure_pillow)
+ImageColor = lazy_import('PIL.ImageColor')
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+iio = lazy_import('imageio.v3')
+skimage_io = lazy_import('skimage.io')
+ndi = lazy_import('scipy.ndimage')
+resample = lazy_import('resample')
+frames = lazy_import('frames')
+
+class ImageRequest(Request):
+    @property
+    def max_content_length(self):
+        # Batch uploads carry many images, they get their own limit
+        if self.endpoint == 'process_batch':
+            return app.config['BATCH_MAX_CONTENT_LENGTH']
+        # Checked against Content-Length before anything is read
+        tool = (self.view_args or {}).get('tool')
+        return app.config['TOOL_MAX_CONTENT_LENGTH'].get(tool, app.config['MAX_CONTENT_LENGTH'])
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Uploads are written as they arrive: in memory up to UPLOAD_SPOOL_SIZE, then in UPLOAD_FOLDER
+        return uploads.SpooledUpload(app.config['UPLOAD_FOLDER'], app.config['UPLOAD_SPOOL_SIZE'],
+                                     sniff=_sniff_upload if filename and allowed_file(filename) else None,
+                                     track=_track_temp_files, remove=_remove_temp_files)
+
+class ImageTooLarge(RequestEntityTooLarge):
+    pass
 
 app = Flask(__name__)
+app.request_class = ImageRequest
 
 # Configuration
 UPLOAD_FOLDER = '/tmp/image_processing'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp', 'tiff'}
+# Output only formats, written by the engines whose optional encoder is installed
+MODERN_FORMATS = {'avif', 'jxl'}
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/jxl', '.jxl')
+# Engines encoding with Pillow write them when its plugin is installed
+PILLOW_OPTIONAL_FORMATS = {fmt: functools.partial(_pillow_plugin_installed, fmt) for fmt in MODERN_FORMATS}
+# Tools register themselves with their capabilities next to their processing functions
+ENGINES = EngineRegistry()
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16 MB max
+# Per tool upload limits ("tool=bytes,..."), the CLI engines never hold the upload in memory
+app.config['TOOL_MAX_CONTENT_LENGTH'] = {
+    tool: int(limit) for tool, limit in (
+        item.split('=', 1) for item in os.environ.get(
+            'TOOL_MAX_CONTENT_LENGTH', 'imagemagick=268435456,graphicsmagick=268435456,ffmpeg=268435456'
+        ).split(',') if item
+    )
+}
+# Uploads larger than this are spooled to UPLOAD_FOLDER and processed from there
+app.config['UPLOAD_SPOOL_SIZE'] = int(os.environ.get('UPLOAD_SPOOL_SIZE', 8 * 1024 * 1024))
+# Pixel budget: images declaring more pixels (per frame) than MAX_IMAGE_PIXELS, or whose decoded frames would
+# take more than MAX_IMAGE_MEMORY bytes, are rejected from their header before any decode. The CLI engines get
+# the matching resource limits
+app.config['MAX_IMAGE_PIXELS'] = int(os.environ.get('MAX_IMAGE_PIXELS', 100_000_000))
+app.config['MAX_IMAGE_MEMORY'] = int(os.environ.get('MAX_IMAGE_MEMORY', 1024 * 1024 * 1024))
+# Sources of at least TILED_RESIZE_PIXELS pixels are resized strip by strip by the pillow, opencv, imageio
+# and skimage engines (0 disables it): TIFF strips/tiles are read one band at a time (memory-mapped when
+# uncompressed), other formats only by the numpy engines after a plain 8-bit decode
+app.config['TILED_RESIZE_PIXELS'] = int(os.environ.get('TILED_RESIZE_PIXELS', 50_000_000))
+# Animated GIF/WebP and multi-page TIFF sources written as GIF, WebP or TIFF keep every frame: frames are
+# resized by FRAME_WORKERS threads, with at most FRAME_WINDOW frames decoded and not yet written at once
+app.config['FRAME_WORKERS'] = int(os.environ.get('FRAME_WORKERS', os.cpu_count() or 1))
+app.config['FRAME_WINDOW'] = int(os.environ.get('FRAME_WINDOW', 2 * app.config['FRAME_WORKERS']))
+# Per thread float32 work buffers of the imageio and skimage engines, kept between requests up to this size
+# (larger images get temporary buffers)
+app.config['NUMPY_SCRATCH_BYTES'] = int(os.environ.get('NUMPY_SCRATCH_BYTES', 256 * 1024 * 1024))
+# Encoder settings applied by every engine when the request does not give them, so that the engines write
+# comparable files: JPEG/WebP quality (0 keeps each library's default) and PNG zlib level (-1 idem)
+app.config['DEFAULT_QUALITY'] = int(os.environ.get('DEFAULT_QUALITY', 85))
+app.config['DEFAULT_PNG_COMPRESSION'] = int(os.environ.get('DEFAULT_PNG_COMPRESSION', 6))
+# Encoder threads: parallel encodes of /renditions and qualities tried at once by max_bytes (encoders release
+# the GIL), also the internal threads given to the AVIF encoder
+app.config['ENCODE_THREADS'] = int(os.environ.get('ENCODE_THREADS', os.cpu_count() or 1))
+# Decode/encode in memory (or through pipes for the CLI engines) instead of going through UPLOAD_FOLDER
+app.config['IN_MEMORY_PROCESSING'] = os.environ.get('IN_MEMORY_PROCESSING', 'true').lower() == 'true'
+
+# Timeouts (seconds) for the CLI engines
+SUBPROCESS_TIMEOUTS = {
+    'imagemagick': int(os.environ.get('IMAGEMAGICK_TIMEOUT', 60)),
+    'graphicsmagick': int(os.environ.get('GRAPHICSMAGICK_TIMEOUT', 60)),
+    'ffmpeg': int(os.environ.get('FFMPEG_TIMEOUT', 60)),
+}
+
+# Long-lived `gm batch` processes running the GraphicsMagick commands (0 to fork/exec gm for every image),
+# each one is restarted after GM_POOL_MAX_JOBS commands
+app.config['GM_POOL_SIZE'] = int(os.environ.get('GM_POOL_SIZE', os.cpu_count() or 1))
+app.config['GM_POOL_MAX_JOBS'] = int(os.environ.get('GM_POOL_MAX_JOBS', 500))
+
+# Temp files janitor: orphans older than TEMP_FILE_MAX_AGE seconds are removed every JANITOR_INTERVAL
+# seconds, looking at no more than JANITOR_BATCH_SIZE directory entries per sweep
+app.config['TEMP_FILE_MAX_AGE'] = int(os.environ.get('TEMP_FILE_MAX_AGE', 600))
+# Longest time a temp file can be in use (gunicorn --timeout of the Dockerfile): no sweep removes younger
+# files, other processes (gunicorn workers, batch and job workers, gm pool) may still be using them
+app.config['TEMP_FILE_MIN_AGE'] = int(os.environ.get('TEMP_FILE_MIN_AGE', 300))
+app.config['JANITOR_INTERVAL'] = int(os.environ.get('JANITOR_INTERVAL', 60))
+app.config['JANITOR_BATCH_SIZE'] = int(os.environ.get('JANITOR_BATCH_SIZE', 1000))
+
+# Result cache keyed on the upload hash + normalized parameters: LRU memory tier and optional disk tier
+app.config['RESULT_CACHE_ENABLED'] = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+app.config['RESULT_CACHE_MEMORY_BYTES'] = int(os.environ.get('RESULT_CACHE_MEMORY_BYTES', 64 * 1024 * 1024))
+app.config['RESULT_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1024))
+app.config['RESULT_CACHE_DIR'] = os.environ.get('RESULT_CACHE_DIR', '')  # empty: no disk tier
+app.config['RESULT_CACHE_DISK_BYTES'] = int(os.environ.get('RESULT_CACHE_DISK_BYTES', 1024 * 1024 * 1024))
+app.config['RESULT_CACHE_MAX_AGE'] = int(os.environ.get('RESULT_CACHE_MAX_AGE', 86400))  # Cache-Control max-age
+# Decoded sources uploaded through /sources, evicted by bytes (raw upload + decoded pixel buffers)
+app.config['SOURCE_CACHE_BYTES'] = int(os.environ.get('SOURCE_CACHE_BYTES', 512 * 1024 * 1024))
+# Batch processing: process pool size, images in flight at once, images per batch, upload size
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+app.config['BATCH_MAX_IN_FLIGHT'] = int(os.environ.get('BATCH_MAX_IN_FLIGHT', 2 * app.config['BATCH_WORKERS']))
+app.config['BATCH_MAX_ITEMS'] = int(os.environ.get('BATCH_MAX_ITEMS', 1000))
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+# Asynchronous jobs: SQLite queue in JOBS_DIR processed by JOB_WORKERS processes
+app.config['JOBS_DIR'] = os.environ.get('JOBS_DIR', '/tmp/image_jobs')
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOBS_MAX_QUEUED'] = int(os.environ.get('JOBS_MAX_QUEUED', 100))
+app.config['JOBS_RESULT_TTL'] = int(os.environ.get('JOBS_RESULT_TTL', 3600))  # finished jobs are kept 1h
+# Pillow resizes first reduce() by an integer factor while the image stays reducing_gap times larger than
+# the target (3.0 is visually indistinguishable from a full resample)
+PILLOW_REDUCING_GAP = float(os.environ.get('PILLOW_REDUCING_GAP', 3.0))
+# Maximum number of renditions per /renditions request
+app.config['MAX_RENDITIONS'] = int(os.environ.get('MAX_RENDITIONS', 16))
+# Engines whose libraries are imported when the app loads: comma separated names or 'all'. With gunicorn
+# --preload the imports happen once in the master and the forked workers share them
+app.config['PRELOAD_ENGINES'] = [name.strip() for name in os.environ.get('PRELOAD_ENGINES', '').split(',') if name.strip()]
+# /process/auto: every AUTO_EXPLORE_EVERY requests of a given input shape re-measure the oldest engine timing
+app.config['AUTO_EXPLORE_EVERY'] = int(os.environ.get('AUTO_EXPLORE_EVERY', 50))
+# /benchmark: maximum number of engine runs (images x tools x (repeat + warmup)) per request
+app.config['BENCHMARK_MAX_RUNS'] = int(os.environ.get('BENCHMARK_MAX_RUNS', 500))
+# /benchmark: maximum number of synthetic image sizes per request, each one within the pixel budget
+app.config['BENCHMARK_MAX_SIZES'] = int(os.environ.get('BENCHMARK_MAX_SIZES', 8))
+# Bump when an engine change alters its output, so persisted entries are not served anymore
+RESULT_CACHE_VERSION = 11
 
 # Create upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -27,183 +196,933 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Temp files still used by a request (being written, processed or streamed to the client)
+_active_files = set()
+_active_files_lock = threading.Lock()
+_janitor_pid = None
+_janitor_entries = None
+_sweep_lock = threading.Lock()
+
+# Timings of /process/auto by input shape, per process
+auto_cost_model = CostModel(explore_every=app.config['AUTO_EXPLORE_EVERY'])
+
+result_cache = ResultCache(
+    LRUCache(app.config['RESULT_CACHE_MEMORY_BYTES'], app.config['RESULT_CACHE_MAX_ENTRIES']),
+    DiskCache(app.config['RESULT_CACHE_DIR'], app.config['RESULT_CACHE_DISK_BYTES'])
+    if app.config['RESULT_CACHE_DIR'] else None
+)
+
+# Per process metrics, exposed by /metrics
+metrics_registry = metrics.Registry()
+STAGE_SECONDS = metrics_registry.histogram('image_stage_seconds', 'Time spent in each processing stage',
+                                           ['tool', 'stage'])
+REQUEST_SECONDS = metrics_registry.histogram('image_request_seconds', 'Request duration until the response is sent',
+                                             ['endpoint', 'tool', 'status'])
+BYTES_RECEIVED = metrics_registry.counter('image_received_bytes_total', 'Request body bytes', ['endpoint'])
+BYTES_SENT = metrics_registry.counter('image_sent_bytes_total', 'Response body bytes (known lengths only)',
+                                      ['endpoint'])
+IN_FLIGHT = metrics_registry.gauge('image_requests_in_flight', 'Requests being processed or streamed')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Leading bytes of the accepted formats
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'BM', b'II*\x00', b'MM\x00*')
+
+def _sniff_upload(head):
+    # Called while the upload is still being received: a rejected file is not kept (see _upload_bytes)
+    is_webp = head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+    if not is_webp and not head.startswith(IMAGE_SIGNATURES):
+        raise UnprocessableEntity("Unsupported image format")
+    # A header that does not fit in the sniffed bytes is checked once the upload is complete
+    info = _probe_image(head)
+    if info is not None:
+        _check_pixel_budget(info)
+
+def _upload_bytes(file):
+    # Content of an uploaded file, or the 422/413 its header got while it was received
+    if isinstance(file.stream, uploads.SpooledUpload) and file.stream.rejection is not None:
+        raise file.stream.rejection
+    return file.read()
+
+def _output_format(output_path):
+    return os.path.splitext(output_path)[1][1:].lower()
+
+def _track_temp_files(*paths):
+    with _active_files_lock:
+        _active_files.update(paths)
+
+def _remove_temp_files(*paths):
+    for path in paths:
+        with _active_files_lock:
+            _active_files.discard(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error cleaning up {path}: {str(e)}")
+
+def sweep_temp_files(max_age, limit=None):
+    """
+    Supprime les fichiers orphelins de UPLOAD_FOLDER plus vieux que max_age secondes (au moins
+    TEMP_FILE_MIN_AGE : seuls les fichiers utilisés par ce processus sont connus). Retourne le
+    nombre de fichiers supprimés.
+    
+    Le parcours du dossier reprend là où le passage précédent s'était arrêté, chaque passage
+    examine au plus `limit` entrées : le coût reste borné quelle que soit la taille du dossier.
+    Sans limite, tout le dossier est parcouru.
+    """
+    global _janitor_entries
+    max_age = max(max_age, app.config['TEMP_FILE_MIN_AGE'])
+    with _sweep_lock:
+        now = time.time()
+        inspected = removed = 0
+        
+        if limit is None and _janitor_entries is not None:
+            # Unbounded sweeps cover the whole directory
+            _janitor_entries.close()
+            _janitor_entries = None
+        
+        while limit is None or inspected < limit:
+            if _janitor_entries is None:
+                _janitor_entries = os.scandir(app.config['UPLOAD_FOLDER'])
+            entry = next(_janitor_entries, None)
+            if entry is None:
+                # End of the directory, the next sweep starts over
+                _janitor_entries.close()
+                _janitor_entries = None
+                break
+            inspected += 1
+            
+            with _active_files_lock:
+                if entry.path in _active_files:
+                    continue
+            try:
+                if entry.is_file(follow_symlinks=False) and now - entry.stat().st_mtime >= max_age:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        
+        return removed
+
+def _janitor_loop():
+    while True:
+        time.sleep(app.config['JANITOR_INTERVAL'])
+        try:
+            removed = sweep_temp_files(app.config['TEMP_FILE_MAX_AGE'], app.config['JANITOR_BATCH_SIZE'])
+            if removed:
+                logger.info(f"Janitor removed {removed} orphaned temp files")
+        except Exception as e:
+            logger.error(f"Janitor error: {str(e)}")
+
+@app.before_request
+def start_janitor():
+    # Started lazily so that each (forked) worker process gets its own thread
+    global _janitor_pid
+    if _janitor_pid != os.getpid() and app.config['JANITOR_INTERVAL'] > 0:
+        _janitor_pid = os.getpid()
+        threading.Thread(target=_janitor_loop, name='temp-janitor', daemon=True).start()
+
+@app.before_request
+def start_request_timer():
+    metrics.start_request(request.view_args.get('tool') if request.view_args else None)
+    IN_FLIGHT.inc()
+
+@app.after_request
+def add_server_timing(response):
+    # Stages measured so far go in the header, streaming the body is measured when the response closes
+    timer = metrics.finish_request()
+    if timer is None:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    tool = timer.tool or ''
+    response.headers['Server-Timing'] = timer.server_timing()
+    BYTES_RECEIVED.inc(request.content_length or 0, endpoint=endpoint)
+    if response.content_length is not None and not response.is_streamed:
+        BYTES_SENT.inc(response.content_length, endpoint=endpoint)
+    for stage, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, tool=tool, stage=stage)
+    
+    send_start = time.perf_counter()
+    status = response.status_code
+    
+    def finish():
+        now = time.perf_counter()
+        if response.is_streamed and response.content_length is not None:
+            BYTES_SENT.inc(response.content_length, endpoint=endpoint)
+        STAGE_SECONDS.observe(now - send_start, tool=tool, stage='send')
+        REQUEST_SECONDS.observe(now - timer.start, endpoint=endpoint, tool=tool, status=status)
+        IN_FLIGHT.dec()
+    
+    if response.direct_passthrough and hasattr(response.response, 'close'):
+        # send_file hands the file wrapper straight to the server (sendfile), response.close is not called
+        close_wrapper = response.response.close
+        
+        def close():
+            try:
+                close_wrapper()
+            finally:
+                finish()
+        response.response.close = close
+    else:
+        response.call_on_close(finish)
+    return response
+
+def _result_cache_key(data, tool, output_format, width, height, resize_mode, keep_ratio,
+                      resampling, crop_position, bg_color, bg_alpha, encoder=None):
+    # Parameters that cannot change the output are dropped so that equivalent requests share an entry
+    mode = layout.normalize_mode(resize_mode, keep_ratio)
+    params = (
+        RESULT_CACHE_VERSION, tool, output_format, width, height, mode, resampling,
+        crop_position if mode != 'stretch' else None,
+        (bg_color, bg_alpha) if mode == 'fit' else None,
+        sorted(encoding.for_format(encoder, output_format).items()),
+    )
+    if isinstance(data, uploads.SpooledUpload):
+        # Hashed while it was received
+        digest = data.hash.copy()
+    else:
+        digest = hashlib.blake2b(data, digest_size=20)
+    digest.update(repr(params).encode())
+    return digest.hexdigest()
+
+def _send_result(result, download_name, etag=None):
+    response = send_file(io.BytesIO(result), as_attachment=True, download_name=download_name)
+    if etag is not None:
+        response.set_etag(etag)
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['RESULT_CACHE_MAX_AGE']
+    return response
+
+def _not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['RESULT_CACHE_MAX_AGE']
+    return response
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy"})
 
-@app.route('/process/<tool>', methods=['POST'])
-def process_image(tool):
+@app.route('/engines', methods=['GET'])
+def list_engines():
+    # Formats, transparency, native resamplers and whether the libraries are already imported
+    return jsonify(ENGINES.capabilities())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Metrics of the worker process answering the request
+    return metrics_registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@metrics_registry.collector
+def _collect_usage():
+    temp_files = metrics.Gauge('image_temp_files', 'Files in the upload folder')
+    temp_bytes = metrics.Gauge('image_temp_bytes', 'Bytes used by the upload folder')
+    count = size = 0
+    with os.scandir(app.config['UPLOAD_FOLDER']) as entries:
+        for entry in entries:
+            try:
+                size += entry.stat().st_size
+                count += 1
+            except FileNotFoundError:
+                pass
+    temp_files.set(count)
+    temp_bytes.set(size)
+    
+    hit_ratio = metrics.Gauge('image_cache_hit_ratio', 'Cache hits over lookups', ['cache'])
+    lookups = metrics.Counter('image_cache_lookups_total', 'Cache lookups', ['cache', 'result'])
+    caches = {'result_memory': result_cache.memory, 'result_disk': result_cache.disk, 'source': source_cache}
+    for name, cache in caches.items():
+        if cache is None:
+            continue
+        stats = cache.stats()
+        hit_ratio.set(stats['hit_ratio'], cache=name)
+        lookups.inc(stats['hits'], cache=name, result='hit')
+        lookups.inc(stats['misses'], cache=name, result='miss')
+    return [temp_files, temp_bytes, hit_ratio, lookups]
+
+def _unknown_tool(tool):
+    return jsonify({"error": f"Unknown tool: {tool}. Available tools: {', '.join(ENGINES.names())}"}), 400
+
+def _read_source(spooled=False):
+    """
+    Retourne (data, filename, source_id) pour la requête courante : soit l'image envoyée dans le
+    champ `image`, soit une source déjà envoyée à /sources (`source=<id>`).
+    Retourne (None, réponse d'erreur, None) si aucune image n'est exploitable ; une image
+    illisible ou hors budget lève une erreur 422 ou 413 (voir _guard_image).
+    
+    Avec spooled=True, un envoi écrit sur disque est retourné tel quel (SpooledUpload, avec son
+    chemin et son hash) au lieu d'être relu en mémoire.
+    """
+    # Parsing the form reads the upload
+    with metrics.stage('receive'):
+        source_id = request.values.get('source')
+        files = request.files
+    
+    # A source previously uploaded to /sources can be used instead of an image file
+    if source_id:
+        data = source_cache.get((source_id, 'raw'))
+        if data is None:
+            return None, (jsonify({"error": f"Unknown or expired source: {source_id}"}), 404), None
+        return data, secure_filename(source_id), source_id
+    
     # Check if an image file was uploaded
-    if 'image' not in request.files:
-        return jsonify({"error": "No image file provided"}), 400
+    if 'image' not in files:
+        return None, (jsonify({"error": "No image file provided"}), 400), None
     
-    file = request.files['image']
+    file = files['image']
     if file.filename == '':
-        return jsonify({"error": "No image selected"}), 400
+        return None, (jsonify({"error": "No image selected"}), 400), None
     
     if not allowed_file(file.filename):
-        return jsonify({"error": f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
+        return None, (jsonify({"error": f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"}), 400), None
+    
+    if spooled and isinstance(file.stream, uploads.SpooledUpload) and file.stream.path is not None:
+        _guard_image(file.stream.path)
+        return file.stream, secure_filename(file.filename), None
+    data = _upload_bytes(file)
+    _guard_image(data)
+    return data, secure_filename(file.filename), None
+
+def _output_format_param(tool, value):
+    # Output format, checked against what the engine (any engine for 'auto') can write
+    output_format = str(value).lower()
+    if tool == 'auto':
+        formats = set().union(*(engine.writable_formats() for engine in ENGINES))
+    else:
+        formats = ENGINES[tool].writable_formats()
+    if output_format == 'auto':
+        return _negotiate_format(formats)
+    if output_format not in formats:
+        raise ValueError(f"{tool} cannot write {output_format} (supported: {', '.join(sorted(formats))})")
+    return output_format
+
+# format=auto: formats in order of preference, picked when the client lists their type in Accept
+NEGOTIATED_FORMATS = (('avif', 'image/avif'), ('jxl', 'image/jxl'), ('webp', 'image/webp'))
+# Format of format=auto for clients accepting none of them
+NEGOTIATED_FALLBACK = 'jpg'
+
+def _negotiate_format(formats):
+    # Wildcards (*/*, image/*) do not count: browsers send them without decoding every format
+    accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+    
+    @after_this_request
+    def vary_on_accept(response):
+        # Caches must keep one response per Accept header
+        response.vary.add('Accept')
+        return response
+    
+    for output_format, mimetype in NEGOTIATED_FORMATS:
+        if mimetype in accepted and output_format in formats:
+            return output_format
+    return NEGOTIATED_FALLBACK
+
+def _processing_params(values, defaults=None):
+    # Resize parameters shared by every engine, `defaults` supplies values missing from `values`
+    defaults = defaults or {}
+    
+    def get(key, default, type=str):
+        value = values.get(key)
+        if value is None:
+            return defaults.get(key, default)
+        return type(value)
     
     # Get basic parameters
-    width = request.form.get('width', 1000, type=int)
-    height = request.form.get('height', 1500, type=int)
-    output_format = request.form.get('format', 'jpg').lower()
+    width = get('width', 1000, int)
+    height = get('height', 1500, int)
     
     # Get additional parameters (avec valeurs par défaut selon XnConvert)
-    resize_mode = request.form.get('resize_mode', 'fit')  # 'fit' correspond à "Ajuster"
-    keep_ratio = request.form.get('keep_ratio', 'true').lower() == 'true'  # Conservation du ratio
-    resampling = request.form.get('resampling', 'hanning')  # Méthode Hanning
-    crop_position = request.form.get('crop_position', 'center')  # Position de recadrage centrée
-    bg_color = request.form.get('bg_color', 'white')  # Couleur de fond blanche
-    bg_alpha = request.form.get('bg_alpha', 255, type=int)  # Alpha 255
+    return {
+        'width': width,
+        'height': height,
+        'resize_mode': get('resize_mode', 'fit').lower(),  # 'fit' correspond à "Ajuster"
+        'keep_ratio': get('keep_ratio', True, lambda v: str(v).lower() == 'true'),  # Conservation du ratio
+        'resampling': get('resampling', 'hanning').lower(),  # Méthode Hanning
+        'crop_position': layout.normalize_gravity(get('crop_position', 'center')),  # Position de recadrage centrée
+        'bg_color': get('bg_color', 'white').lower(),  # Couleur de fond blanche
+        'bg_alpha': get('bg_alpha', 255, int),  # Alpha 255
+        # Encoder options (quality, progressive, subsampling, compress_level, webp_method, strip_metadata,
+        # max_bytes), mapped by every engine to the flags of its library
+        'encoder': encoding.parse(values, defaults.get('encoder', _encoder_defaults())),
+    }
+
+def _encoder_defaults():
+    defaults = {}
+    if app.config['DEFAULT_QUALITY'] > 0:
+        defaults['quality'] = app.config['DEFAULT_QUALITY']
+    if app.config['DEFAULT_PNG_COMPRESSION'] >= 0:
+        defaults['compress_level'] = app.config['DEFAULT_PNG_COMPRESSION']
+    return defaults
+
+@app.route('/process/<tool>', methods=['POST'])
+def process_image(tool):
+    # 'auto' picks the engine per request from the recorded timings
+    if tool not in ENGINES and tool != 'auto':
+        return _unknown_tool(tool)
+    
+    data, filename, source_id = _read_source(spooled=True)
+    if data is None:
+        return filename
+    # Large uploads stay on disk and go through the file based engines
+    upload = data if isinstance(data, uploads.SpooledUpload) else None
+    
+    try:
+        output_format = _output_format_param(tool, request.form.get('format', 'jpg'))
+        params = _processing_params(request.form)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
     
     # Create a unique filename to avoid collisions
-    filename = secure_filename(file.filename)
     unique_id = str(uuid.uuid4())
-    input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_input_{filename}")
+    input_path = upload.path if upload else os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_input_{filename}")
     output_filename = f"{unique_id}_output.{output_format}"
     output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
     
     # Log the parameters
-    logger.info(f"Processing with {tool}: width={width}, height={height}, resize_mode={resize_mode}, "
-                f"keep_ratio={keep_ratio}, resampling={resampling}, crop_position={crop_position}")
+    logger.info(f"Processing with {tool}: width={params['width']}, height={params['height']}, "
+                f"resize_mode={params['resize_mode']}, keep_ratio={params['keep_ratio']}, "
+                f"resampling={params['resampling']}, crop_position={params['crop_position']}")
+    
+    # Same upload bytes + same normalized parameters always give the same output
+    etag = None
+    if app.config['RESULT_CACHE_ENABLED']:
+        etag = _result_cache_key(data, tool, output_format, **params)
+        if etag in request.if_none_match:
+            return _not_modified(etag)
+        cached = result_cache.get(etag)
+        if cached is not None:
+            return _with_selection(_send_result(cached, output_filename, etag),
+                                   tool, "cached result" if tool == 'auto' else None)
     
-    # Save the input file
-    file.save(input_path)
+    auto_key = None
+    reason = None
+    if tool == 'auto':
+        tool, reason, auto_key = _select_engine(input_path if upload else data, output_format, params)
+        if tool is None:
+            return jsonify({"error": f"No available engine can process this request: {reason}"}), 422
+        logger.info(f"Auto selected {tool}: {reason}")
+        metrics.current().tool = tool
+    
+    # In-memory path: request stream -> decoder -> encoder -> response, nothing written to disk
+    engine = ENGINES[tool]
+    if app.config['IN_MEMORY_PROCESSING'] and engine.process_bytes is not None and upload is None:
+        start = time.perf_counter()
+        try:
+            if source_id and tool in SOURCE_RENDERERS:
+                # Reuse the decoded pixels of the source (not a comparable timing for auto)
+                decoder, render = SOURCE_RENDERERS[tool]
+                result = render(_decoded_source(source_id, decoder, data), output_format, **params)
+                auto_key = None
+            else:
+                result = engine.process_bytes(data, output_format, **params)
+            _record_timing(auto_key, tool, time.perf_counter() - start)
+            if etag is not None:
+                result_cache.put(etag, result)
+            return _with_selection(_send_result(result, output_filename, etag), tool, reason)
+        except HTTPException:
+            # Budget checks of the engines (413), not a failure of the engine
+            raise
+        except Exception as e:
+            _record_timing(auto_key, tool, None)
+            logger.error(f"Error processing with {tool}: {str(e)}")
+            return jsonify({"error": f"Processing error: {str(e)}"}), 500
+    
+    # Save the input file (spooled uploads are already there)
+    _track_temp_files(input_path, output_path)
+    if upload is None:
+        with metrics.stage('save'), open(input_path, 'wb') as f:
+            f.write(data)
     
     try:
         # Process based on selected tool with all parameters
-        if tool == 'imagemagick':
-            process_imagemagick(input_path, output_path, width, height, resize_mode, keep_ratio, 
-                               resampling, crop_position, bg_color, bg_alpha)
-        elif tool == 'graphicsmagick':
-            process_graphicsmagick(input_path, output_path, width, height, resize_mode, keep_ratio, 
-                                  resampling, crop_position, bg_color, bg_alpha)
-        elif tool == 'ffmpeg':
-            process_ffmpeg(input_path, output_path, width, height, resize_mode, keep_ratio, 
-                          resampling, crop_position, bg_color, bg_alpha)
-        elif tool == 'pillow':
-            process_pillow(input_path, output_path, width, height, resize_mode, keep_ratio, 
-                          resampling, crop_position, bg_color, bg_alpha)
-        elif tool == 'opencv':
-            process_opencv(input_path, output_path, width, height, resize_mode, keep_ratio, 
-                          resampling, crop_position, bg_color, bg_alpha)
-        elif tool == 'imageio':
-            process_imageio(input_path, output_path, width, height, resize_mode, keep_ratio, 
-                           resampling, crop_position, bg_color, bg_alpha)
-        elif tool == 'skimage':
-            process_skimage(input_path, output_path, width, height, resize_mode, keep_ratio, 
-                           resampling, crop_position, bg_color, bg_alpha)
-        else:
-            return jsonify({"error": f"Unknown tool: {tool}. Available tools: imagemagick, graphicsmagick, ffmpeg, pillow, opencv, imageio, skimage"}), 400
+        start = time.perf_counter()
+        engine.process(input_path, output_path, **params)
+        _record_timing(auto_key, tool, time.perf_counter() - start)
         
-        # Return the processed image
-        return send_file(output_path, as_attachment=True, download_name=output_filename)
+        if etag is not None:
+            with open(output_path, 'rb') as f:
+                result = f.read()
+            result_cache.put(etag, result)
+            return _with_selection(_send_result(result, output_filename, etag), tool, reason)
+        
+        # Stream the processed image from an open handle: the file is unlinked in the finally
+        # block and its space is reclaimed as soon as the response closes the handle
+        result_file = open(output_path, 'rb')
+        return _with_selection(send_file(result_file, as_attachment=True, download_name=output_filename),
+                               tool, reason)
+    
+    except HTTPException:
+        raise
     
     except Exception as e:
+        _record_timing(auto_key, tool, None)
         logger.error(f"Error processing with {tool}: {str(e)}")
         return jsonify({"error": f"Processing error: {str(e)}"}), 500
     
     finally:
-        # Clean up files after sending response
-        try:
-            if os.path.exists(input_path):
-                os.remove(input_path)
-            # We don't remove output_path here as it's being sent to the client
-        except Exception as e:
-            logger.error(f"Error cleaning up files: {str(e)}")
+        # Clean up files after sending response, the spooled upload is removed with the request
+        if upload is None:
+            _remove_temp_files(input_path)
+        _remove_temp_files(output_path)
 
-# Les fonctions de traitement pour chaque outil
-def process_imagemagick(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
-                       resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255):
-    # Map resampling methods to ImageMagick filter
-    filter_map = {
-        'nearest': 'Point',
-        'bilinear': 'Bilinear',
-        'bicubic': 'Cubic',
-        'lanczos': 'Lanczos',
-        'hanning': 'Hanning'
-    }
-    filter_type = filter_map.get(resampling.lower(), 'Lanczos')
-    
-    # Build the command based on resize_mode
-    cmd = ['convert', input_path]
-    
-    if resize_mode == 'fit' and keep_ratio:
-        # Fit within dimensions and keep ratio
-        cmd.extend([
-            '-filter', filter_type,
-            '-resize', f'{width}x{height}',
-            '-background', bg_color,
-            '-alpha', 'remove',
-            '-alpha', 'off',
-            '-gravity', crop_position,
-            '-extent', f'{width}x{height}'
-        ])
-    elif resize_mode == 'stretch':
-        # Stretch to fit exactly
-        cmd.extend([
-            '-filter', filter_type,
-            '-resize', f'{width}x{height}!',
-        ])
-    else:
-        # Default to fill mode (crop)
-        cmd.extend([
-            '-filter', filter_type,
-            '-resize', f'{width}x{height}^',
-            '-gravity', crop_position,
-            '-extent', f'{width}x{height}'
-        ])
+# Output formats able to carry transparency
+ALPHA_FORMATS = {'png', 'webp', 'tiff', 'gif', 'avif', 'jxl'}
+# Timing recorded for an engine that failed, so that auto stops picking it until it is re-measured
+AUTO_FAILURE_PENALTY = 60.0
+
+def _select_engine(data, output_format, params):
+    """
+    Choisit l'outil de /process/auto pour cette image et ces paramètres.
     
-    # Add output path
-    cmd.append(output_path)
+    Les candidats sont les outils disponibles qui savent écrire le format demandé, qui conservent
+    la transparence quand la source et le format de sortie en ont, et qui appliquent la méthode de
+    rééchantillonnage sans l'approcher par une autre ; si aucun outil ne l'a nativement, tous les
+    autres restent candidats. Le modèle de coût choisit ensuite parmi eux.
     
-    # Run the command
-    subprocess.run(cmd, check=True)
+    Retourne (outil, raison, clé du modèle), ou (None, raison, None) si aucun outil ne convient.
+    """
+    info = _probe_image(data)
+    if info is None:
+        return None, "unreadable image", None
+    input_format, (src_w, src_h), mode = info.format, info.size, info.mode
+    has_alpha = mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La')
+    resampling = params['resampling']
+    
+    candidates = [engine for engine in ENGINES if engine.available() and engine.writes(output_format)]
+    if has_alpha and output_format in ALPHA_FORMATS:
+        candidates = [engine for engine in candidates if engine.alpha] or candidates
+    native = [engine for engine in candidates if resampling in engine.resamplers]
+    if not candidates:
+        return None, f"no engine writes {output_format}", None
+    
+    notes = []
+    if native:
+        candidates = native
+    else:
+        notes.append(f"no engine has native {resampling}, approximated")
+    
+    key = (input_format, megapixel_bucket(src_w, src_h), has_alpha,
+           layout.normalize_mode(params['resize_mode'], params['keep_ratio']), resampling, output_format)
+    tool, reason = auto_cost_model.choose(key, [engine.name for engine in candidates])
+    return tool, '; '.join([reason, *notes]), key
+
+def _record_timing(key, tool, seconds):
+    # Only /process/auto requests feed the model, failures count as a slow run
+    if key is not None:
+        auto_cost_model.record(key, tool, AUTO_FAILURE_PENALTY if seconds is None else seconds)
+
+def _with_selection(response, tool, reason):
+    # Engine picked by /process/auto and why
+    if reason is not None:
+        response.headers['X-Engine'] = tool
+        response.headers['X-Engine-Reason'] = reason
+    return response
+
+@app.route('/process/auto/timings', methods=['GET'])
+def auto_timings():
+    return jsonify(auto_cost_model.snapshot())
+
+# Header-only description of an image, shared by every engine
+ImageInfo = namedtuple('ImageInfo', ['format', 'size', 'mode', 'bit_depth', 'frames'])
+# Bits per sample of the Pillow modes that are not 8 bits
+MODE_BIT_DEPTHS = {'1': 1, 'I;16': 16, 'I;16B': 16, 'I;16L': 16, 'I;16N': 16, 'I': 32, 'F': 32}
+
+# Les fonctions de traitement pour chaque outil
+def _probe_image(source):
+    # Header-only probe (path or bytes), None if unreadable. Pillow only parses headers here, counting the
+    # frames of an animation skips over their data without decompressing it
+    try:
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+            return ImageInfo(img.format, img.size, img.mode, MODE_BIT_DEPTHS.get(img.mode, 8),
+                             getattr(img, 'n_frames', 1))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(f"Image too large: {str(e)}")
+    except Exception:
+        return None
+
+def _decoded_bytes(info):
+    # Upper bound of the decoded pixels: palettes are expanded to RGBA by most engines
+    bands = 4 if info.mode == 'P' else Image.getmodebands(info.mode)
+    return info.size[0] * info.size[1] * bands * math.ceil(info.bit_depth / 8) * info.frames
+
+def _check_pixel_budget(info):
+    # 413 for images over the pixel budget
+    width, height = info.size
+    if width * height > app.config['MAX_IMAGE_PIXELS']:
+        raise ImageTooLarge(f"Image too large: {width}x{height} pixels, at most "
+                            f"{app.config['MAX_IMAGE_PIXELS']} allowed")
+    if _decoded_bytes(info) > app.config['MAX_IMAGE_MEMORY']:
+        raise ImageTooLarge(f"Image too large: {width}x{height}, {info.frames} frame(s) would take "
+                            f"{_decoded_bytes(info)} bytes once decoded, at most {app.config['MAX_IMAGE_MEMORY']} allowed")
+
+def _guard_image(source):
+    """
+    Vérifie l'en-tête d'une image (chemin ou octets) avant tout décodage : 422 si elle est
+    illisible, 413 si elle dépasse le budget de pixels ou de mémoire. Retourne son ImageInfo.
+    """
+    info = _probe_image(source)
+    if info is None:
+        raise UnprocessableEntity("Unsupported or unreadable image")
+    _check_pixel_budget(info)
+    return info
+
+def _magick_limits(area):
+    # Resource limits for ImageMagick (area) and GraphicsMagick (pixels), before the input
+    memory = app.config['MAX_IMAGE_MEMORY']
+    return ['-limit', 'memory', str(memory), '-limit', 'map', str(2 * memory),
+            '-limit', area, str(app.config['MAX_IMAGE_PIXELS'])]
+
+def _decode_hint(src_size, width, height, resize_mode='fit', keep_ratio=True):
+    # Smallest decoded size that still covers what the resize step needs
+    return layout.plan(*src_size, width, height, resize_mode, keep_ratio).resize
+
+def _probe_layout(info, width, height, resize_mode, keep_ratio, crop_position):
+    # The CLI engines get absolute geometry, computed from the header of the source
+    if info is None:
+        raise ValueError("Unsupported or unreadable image")
+    return layout.plan(*info.size, width, height, resize_mode, keep_ratio, crop_position)
+
+def _jpeg_scale_factor(src_size, hint):
+    # Largest libjpeg scale denominator whose output still covers the hint
+    for factor in (8, 4, 2):
+        if math.ceil(src_size[0] / factor) >= hint[0] and math.ceil(src_size[1] / factor) >= hint[1]:
+            return factor
+    return 1
+
+def _run_command(tool, cmd, input_data=None):
+    # Run a CLI engine with its timeout, stderr is captured to report meaningful errors
+    timeout = SUBPROCESS_TIMEOUTS[tool]
+    try:
+        # Decoding, resizing and encoding all happen in the child process
+        with metrics.stage('exec'):
+            result = subprocess.run(cmd, input=input_data, capture_output=True, check=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"{tool} timed out after {timeout}s")
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"{tool} exited with code {e.returncode}: {stderr}")
+    return result.stdout
+
+def process_imagemagick(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
+                       resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    info = _probe_image(input_path)
+    plan = _probe_layout(info, width, height, resize_mode, keep_ratio, crop_position)
+    cmd = ['convert', *_magick_limits('area'), *_imagemagick_decode_hint(info, plan), input_path]
+    cmd.extend(_imagemagick_args(plan, resampling, bg_color))
+    output_format = _output_format(output_path)
+    if encoding.target_size(encoder, output_format) is None or output_format in MAGICK_TARGET_SIZE_DEFINES:
+        cmd.extend(_imagemagick_encode_args(encoder, output_format))
+        cmd.append(output_path)
+        _run_command('imagemagick', cmd)
+        return
+    # No size target in the AVIF and JPEG XL coders: one run per quality tried
+    _run_sized(lambda options: _run_command('imagemagick', [*cmd, *_imagemagick_encode_args(options, output_format),
+                                                            output_path]),
+               output_path, encoder)
+
+def process_imagemagick_bytes(data, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                             resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Read from stdin and write the encoded result to stdout
+    info = _probe_image(data)
+    plan = _probe_layout(info, width, height, resize_mode, keep_ratio, crop_position)
+    cmd = ['convert', *_magick_limits('area'), *_imagemagick_decode_hint(info, plan), '-']
+    cmd.extend(_imagemagick_args(plan, resampling, bg_color))
+    if encoding.target_size(encoder, output_format) is None or output_format in MAGICK_TARGET_SIZE_DEFINES:
+        return _run_command('imagemagick', [*cmd, *_imagemagick_encode_args(encoder, output_format),
+                                            f'{output_format}:-'], data)
+    return _fit_size(
+        lambda options: _run_command('imagemagick', [*cmd, *_imagemagick_encode_args(options, output_format),
+                                                     f'{output_format}:-'], data),
+        encoder, output_format, 'exec')
+
+def _imagemagick_decode_hint(info, plan):
+    # Must precede the input: lets the JPEG decoder shrink on load
+    if info.format != 'JPEG':
+        return []
+    return ['-define', 'jpeg:size={}x{}'.format(*plan.resize)]
+
+# Map resampling methods to the ImageMagick / GraphicsMagick filters
+MAGICK_FILTERS = {
+    'nearest': 'Point',
+    'bilinear': 'Bilinear',
+    'bicubic': 'Cubic',
+    'lanczos': 'Lanczos',
+    'hanning': 'Hanning',
+    'mitchell': 'Mitchell',
+    'catmull-rom': 'Catrom',
+}
+
+def _magick_args(plan, resampling, bg_color, repage):
+    # Absolute geometry only: '!' resize to the planned size, then crop and/or pad at the planned offsets
+    args = ['-filter', MAGICK_FILTERS.get(resampling.lower(), 'Lanczos'), '-resize', '{}x{}!'.format(*plan.resize)]
+    if plan.cropped:
+        left, top = plan.crop[:2]
+        args.extend(['-crop', '{}x{}+{}+{}'.format(*plan.region, left, top), repage])
+    if plan.mode == 'fit':
+        args.extend(['-background', bg_color])
+    if plan.padded:
+        args.extend(_magick_pad_args(plan, bg_color, repage))
+    return args
+
+def _magick_pad_args(plan, bg_color, repage):
+    # Canvas padding with options both Magicks have (GraphicsMagick has no -splice): a border as wide as
+    # the largest margin of each axis, then the planned canvas cropped out of it. The Copy composition
+    # keeps the transparent pixels of the image as they are
+    (left, top), (width, height) = plan.offset, plan.size
+    region_w, region_h = plan.region
+    border_x = max(left, width - region_w - left)
+    border_y = max(top, height - region_h - top)
+    return ['-bordercolor', bg_color, '-compose', 'Copy', '-border', f'{border_x}x{border_y}',
+            '-crop', f'{width}x{height}+{border_x - left}+{border_y - top}', repage]
+
+def _imagemagick_args(plan, resampling, bg_color):
+    args = _magick_args(plan, resampling, bg_color, '+repage')
+    if plan.mode == 'fit':
+        # Fit flattens the image on the background color
+        args.extend(['-alpha', 'remove', '-alpha', 'off'])
+    return args
+
+# Chroma subsampling as horizontal x vertical sampling factors, the syntax both Magicks accept
+MAGICK_SAMPLING_FACTORS = {'4:4:4': '1x1', '4:2:2': '2x1', '4:2:0': '2x2'}
+# The AVIF coder (heic) of ImageMagick takes the subsampling as a define
+MAGICK_AVIF_CHROMA = {'4:4:4': '444', '4:2:2': '422', '4:2:0': '420'}
+
+def _magick_encode_args(encoder, output_format):
+    # Output settings shared by ImageMagick and GraphicsMagick, placed before the output file
+    options = encoding.for_format(encoder, output_format)
+    args = []
+    if 'quality' in options:
+        args.extend(['-quality', str(options['quality'])])
+    if 'compress_level' in options:
+        # PNG quality: zlib level in the tens, filter in the units (5 = adaptive)
+        args.extend(['-quality', str(options['compress_level'] * 10 + 5)])
+    if 'progressive' in options:
+        args.extend(['-interlace', 'Plane' if options['progressive'] else 'None'])
+    if 'subsampling' in options and output_format == 'avif':
+        args.extend(['-define', f"heic:chroma={MAGICK_AVIF_CHROMA[options['subsampling']]}"])
+    elif 'subsampling' in options:
+        args.extend(['-sampling-factor', MAGICK_SAMPLING_FACTORS[options['subsampling']]])
+    if 'webp_method' in options:
+        args.extend(['-define', f"webp:method={options['webp_method']}"])
+    if 'avif_speed' in options:
+        args.extend(['-define', f"heic:speed={options['avif_speed']}"])
+    if 'jxl_effort' in options:
+        args.extend(['-define', f"jxl:effort={options['jxl_effort']}"])
+    if options.get('strip_metadata'):
+        args.append('-strip')
+    return args
+
+# The JPEG and WebP coders of ImageMagick search the quality for max_bytes themselves, in a single run
+MAGICK_TARGET_SIZE_DEFINES = {'jpg': 'jpeg:extent', 'jpeg': 'jpeg:extent', 'webp': 'webp:target-size'}
+
+def _imagemagick_encode_args(encoder, output_format):
+    args = _magick_encode_args(encoder, output_format)
+    max_bytes = encoding.target_size(encoder, output_format)
+    if max_bytes is not None and output_format in MAGICK_TARGET_SIZE_DEFINES:
+        args.extend(['-define', f'{MAGICK_TARGET_SIZE_DEFINES[output_format]}={max_bytes}'])
+    return args
+
+@functools.lru_cache(maxsize=None)
+def _imagemagick_coders():
+    # Formats the installed ImageMagick can write: AVIF and JPEG XL depend on its build (libheif, libjxl)
+    try:
+        listing = subprocess.run(['convert', '-list', 'format'], capture_output=True, check=True,
+                                 timeout=SUBPROCESS_TIMEOUTS['imagemagick']).stdout.decode('utf-8', errors='replace')
+    except (OSError, subprocess.SubprocessError):
+        return frozenset()
+    coders = set()
+    for line in listing.splitlines():
+        # "      AVIF  HEIC      rw+   AV1 Image File Format (1.17.6)"
+        fields = line.split()
+        if len(fields) >= 3 and len(fields[2]) == 3 and fields[2][0] in 'r-' and fields[2][1] == 'w':
+            coders.add(fields[0].rstrip('*').lower())
+    return frozenset(coders)
+
+def _imagemagick_writes(output_format):
+    return output_format in _imagemagick_coders()
+
+# The source header is probed with Pillow to compute the geometry; fit mode flattens transparency
+ENGINES.register('imagemagick', process_imagemagick, process_imagemagick_bytes,
+                 formats=ALLOWED_EXTENSIONS, alpha=False, resamplers=MAGICK_FILTERS, modules=('PIL.Image',),
+                 executable='convert',
+                 optional_formats={fmt: functools.partial(_imagemagick_writes, fmt) for fmt in MODERN_FORMATS})
 
 def process_graphicsmagick(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
-                          resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255):
+                          resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
     # Similar to ImageMagick but with gm prefix
-    filter_map = {
-        'nearest': 'Point',
-        'bilinear': 'Bilinear',
-        'bicubic': 'Cubic',
-        'lanczos': 'Lanczos',
-        'hanning': 'Hanning'
-    }
-    filter_type = filter_map.get(resampling.lower(), 'Lanczos')
-    
-    cmd = ['gm', 'convert', input_path]
-    
-    if resize_mode == 'fit' and keep_ratio:
-        cmd.extend([
-            '-filter', filter_type,
-            '-resize', f'{width}x{height}',
-            '-background', bg_color,
-            '-gravity', crop_position,
-            '-extent', f'{width}x{height}'
-        ])
-    elif resize_mode == 'stretch':
-        cmd.extend([
-            '-filter', filter_type,
-            '-resize', f'{width}x{height}!'
-        ])
+    info = _probe_image(input_path)
+    plan = _probe_layout(info, width, height, resize_mode, keep_ratio, crop_position)
+    cmd = ['convert', *_magick_limits('pixels'), *_graphicsmagick_decode_hint(info, plan), input_path]
+    cmd.extend(_graphicsmagick_args(plan, resampling, bg_color))
+    output_format = _output_format(output_path)
+    _run_sized(lambda options: _run_graphicsmagick([*cmd, *_magick_encode_args(options, output_format), output_path]),
+               output_path, encoder)
+
+def _run_graphicsmagick(cmd):
+    pool = _get_gm_pool()
+    if pool is not None:
+        with metrics.stage('exec'):
+            pool.run(cmd)
     else:
-        cmd.extend([
-            '-filter', filter_type,
-            '-resize', f'{width}x{height}^',
-            '-gravity', crop_position,
-            '-extent', f'{width}x{height}'
-        ])
+        _run_command('graphicsmagick', ['gm', *cmd])
+
+def process_graphicsmagick_bytes(data, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                                resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    info = _probe_image(data)
+    plan = _probe_layout(info, width, height, resize_mode, keep_ratio, crop_position)
+    hint = [*_magick_limits('pixels'), *_graphicsmagick_decode_hint(info, plan)]
+    args = _graphicsmagick_args(plan, resampling, bg_color)
+    # GraphicsMagick has no target size: every quality tried by max_bytes is a full run
+    return _fit_size(
+        lambda options: _graphicsmagick_bytes(data, output_format, hint,
+                                              [*args, *_magick_encode_args(options, output_format)]),
+        encoder, output_format, 'exec')
+
+def _graphicsmagick_bytes(data, output_format, hint, args):
+    pool = _get_gm_pool()
+    if pool is None:
+        # Read from stdin and write the encoded result to stdout
+        return _run_command('graphicsmagick', ['gm', 'convert', *hint, '-', *args, f'{output_format}:-'], data)
     
-    cmd.append(output_path)
-    subprocess.run(cmd, check=True)
+    # Batch workers answer on stdout, images go through temp files
+    unique_id = uuid.uuid4().hex
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_gm_input")
+    output_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_gm_output.{output_format}")
+    _track_temp_files(input_path, output_path)
+    try:
+        with metrics.stage('save'), open(input_path, 'wb') as f:
+            f.write(data)
+        with metrics.stage('exec'):
+            pool.run(['convert', *hint, input_path, *args, f'{output_format}:{output_path}'])
+        with open(output_path, 'rb') as f:
+            return f.read()
+    finally:
+        _remove_temp_files(input_path, output_path)
+
+_gm_pool = None
+_gm_pool_lock = threading.Lock()
+
+def _get_gm_pool():
+    # Created on first use, in the process that runs the commands
+    global _gm_pool
+    if app.config['GM_POOL_SIZE'] <= 0:
+        return None
+    with _gm_pool_lock:
+        if _gm_pool is None:
+            _gm_pool = MagickBatchPool(app.config['GM_POOL_SIZE'], app.config['GM_POOL_MAX_JOBS'],
+                                       SUBPROCESS_TIMEOUTS['graphicsmagick'])
+    return _gm_pool
+
+def _graphicsmagick_decode_hint(info, plan):
+    # GraphicsMagick uses -size before the input as the JPEG shrink-on-load hint
+    if info.format != 'JPEG':
+        return []
+    return ['-size', '{}x{}'.format(*plan.resize)]
+
+def _graphicsmagick_args(plan, resampling, bg_color):
+    # GraphicsMagick resets the page geometry with +page
+    return _magick_args(plan, resampling, bg_color, '+page')
+
+ENGINES.register('graphicsmagick', process_graphicsmagick, process_graphicsmagick_bytes,
+                 formats=ALLOWED_EXTENSIONS, resamplers=MAGICK_FILTERS, modules=('PIL.Image',), executable='gm')
+
+# Encoders used by ffmpeg when writing to a pipe (no file extension to guess from)
+FFMPEG_PIPE_CODECS = {
+    'jpg': 'mjpeg',
+    'jpeg': 'mjpeg',
+    'png': 'png',
+    'webp': 'libwebp',
+    'bmp': 'bmp',
+    'tiff': 'tiff',
+    'gif': 'gif',
+}
 
 def process_ffmpeg(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
-                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255):
+                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    plan = _probe_layout(_probe_image(input_path), width, height, resize_mode, keep_ratio, crop_position)
+    video_filter = _ffmpeg_filter(plan, resampling, bg_color)
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', *_ffmpeg_limits(),
+        '-i', input_path,
+        '-vf', video_filter,
+    ]
+    output_format = _output_format(output_path)
+    _run_sized(lambda options: _run_command('ffmpeg', [*cmd, *_ffmpeg_encode_args(options, output_format),
+                                                       '-y', output_path]),
+               output_path, encoder)
+
+def process_ffmpeg_bytes(data, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                        resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    if output_format not in FFMPEG_PIPE_CODECS:
+        raise ValueError(f"ffmpeg cannot pipe {output_format} output")
+    
+    plan = _probe_layout(_probe_image(data), width, height, resize_mode, keep_ratio, crop_position)
+    video_filter = _ffmpeg_filter(plan, resampling, bg_color)
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', *_ffmpeg_limits(),
+        '-f', 'image2pipe', '-i', 'pipe:0',
+        '-vf', video_filter,
+        '-frames:v', '1',
+        '-f', 'image2pipe', '-c:v', FFMPEG_PIPE_CODECS[output_format],
+    ]
+    return _fit_size(
+        lambda options: _run_command('ffmpeg', [*cmd, *_ffmpeg_encode_args(options, output_format), 'pipe:1'], data),
+        encoder, output_format, 'exec')
+
+# Full range YUV formats of the mjpeg encoder for each chroma subsampling
+FFMPEG_JPEG_PIX_FMTS = {'4:4:4': 'yuvj444p', '4:2:2': 'yuvj422p', '4:2:0': 'yuvj420p'}
+
+def _ffmpeg_encode_args(encoder, output_format):
+    # Output options, mjpeg has no progressive mode
+    options = encoding.for_format(encoder, output_format)
+    args = []
+    if output_format in ('jpg', 'jpeg'):
+        if 'quality' in options:
+            # mjpeg quantizer scale: 2 (best) to 31
+            args.extend(['-q:v', str(round(31 - (options['quality'] - 1) * 29 / 99))])
+        if 'subsampling' in options:
+            args.extend(['-pix_fmt', FFMPEG_JPEG_PIX_FMTS[options['subsampling']]])
+    elif output_format == 'webp':
+        if 'quality' in options:
+            args.extend(['-quality', str(options['quality'])])
+        if 'webp_method' in options:
+            args.extend(['-compression_level', str(options['webp_method'])])
+    elif 'compress_level' in options:
+        args.extend(['-compression_level', str(options['compress_level'])])
+    if options.get('strip_metadata'):
+        args.extend(['-map_metadata', '-1'])
+    return args
+
+def _run_sized(run, output_path, encoder):
+    """
+    Encodage d'un outil CLI vers un fichier : `run(options)` écrit output_path avec ces options.
+    
+    Avec max_bytes, chaque qualité essayée est un passage complet de l'outil et l'encodage
+    retenu est réécrit à la fin (le dernier essai n'est pas forcément celui qui est gardé). Les
+    essais écrivent le même fichier, ils sont faits l'un après l'autre.
+    """
+    output_format = _output_format(output_path)
+    if encoding.target_size(encoder, output_format) is None:
+        run(encoder)
+        return
+    
+    def encode(options):
+        run(options)
+        with open(output_path, 'rb') as f:
+            return f.read()
+    result = encoding.fit_size(encode, encoder, output_format)
+    with open(output_path, 'wb') as f:
+        f.write(result)
+
+def _ffmpeg_limits():
+    # Largest single allocation, ffmpeg has no pixel count limit
+    return ['-max_alloc', str(app.config['MAX_IMAGE_MEMORY'])]
+
+def _ffmpeg_filter(plan, resampling, bg_color):
     # Map resampling to ffmpeg flags
     filter_map = {
         'nearest': 'neighbor',
@@ -214,55 +1133,304 @@ def process_ffmpeg(input_path, output_path, width, height, resize_mode='fit', ke
     }
     filter_type = filter_map.get(resampling.lower(), 'lanczos')
     
-    # Map crop position to ffmpeg parameters
-    crop_x = "(iw-ow)/2"
-    crop_y = "(ih-oh)/2"
-    
-    if crop_position == 'top':
-        crop_y = "0"
-    elif crop_position == 'bottom':
-        crop_y = "ih-oh"
-    elif crop_position == 'left':
-        crop_x = "0"
-    elif crop_position == 'right':
-        crop_x = "iw-ow"
-    
-    # Build the ffmpeg command based on resize_mode
-    if resize_mode == 'fit' and keep_ratio:
+    filters = ['scale={}:{}:flags={}'.format(*plan.resize, filter_type)]
+    if plan.cropped:
+        filters.append('crop={}:{}:{}:{}'.format(*plan.region, *plan.crop[:2]))
+    if plan.padded:
         # Utiliser pad pour ajouter des bordures
         bg_hex = bg_color if bg_color.startswith('#') else 'white'
-        if bg_color == 'white':
-            bg_hex = 'white'
-        elif bg_color == 'black':
+        if bg_color == 'black':
             bg_hex = 'black'
-        
-        cmd = [
-            'ffmpeg', '-i', input_path,
-            '-vf', f'scale={width}:{height}:force_original_aspect_ratio=decrease:flags={filter_type},'
-                   f'pad={width}:{height}:{crop_x}:{crop_y}:color={bg_hex}',
-            '-y', output_path
-        ]
-    elif resize_mode == 'stretch':
-        cmd = [
-            'ffmpeg', '-i', input_path,
-            '-vf', f'scale={width}:{height}:flags={filter_type}',
-            '-y', output_path
-        ]
-    else:
-        cmd = [
-            'ffmpeg', '-i', input_path,
-            '-vf', f'scale={width}:{height}:force_original_aspect_ratio=increase:flags={filter_type},'
-                   f'crop={width}:{height}:{crop_x}:{crop_y}',
-            '-y', output_path
-        ]
+        filters.append('pad={}:{}:{}:{}:color={}'.format(*plan.size, *plan.offset, bg_hex))
+    return ','.join(filters)
+
+ENGINES.register('ffmpeg', process_ffmpeg, process_ffmpeg_bytes, formats=FFMPEG_PIPE_CODECS,
+                 resamplers=('nearest', 'bilinear', 'bicubic', 'lanczos'), modules=('PIL.Image',),
+                 executable='ffmpeg')
+
+def _tiled(process, encode, full_decode=False):
+    # File based processing function whose large sources go through the strip pipeline
+    @functools.wraps(process)
+    def wrapper(input_path, output_path, **params):
+        result = _render_tiled(input_path, _output_format(output_path), encode, full_decode, **params)
+        if result is None:
+            return process(input_path, output_path, **params)
+        with open(output_path, 'wb') as f:
+            f.write(result)
+    return wrapper
+
+def _tiled_bytes(process_bytes, encode, full_decode=False):
+    # Same for the in-memory processing functions
+    @functools.wraps(process_bytes)
+    def wrapper(data, output_format, **params):
+        result = _render_tiled(data, output_format, encode, full_decode, **params)
+        return process_bytes(data, output_format, **params) if result is None else result
+    return wrapper
+
+def _tiled_reader(source, info, full_decode):
+    # (shape, dtype, bands) of the source, None when it cannot be read by bands
+    if info.format == 'TIFF':
+        try:
+            reader = resample.tiff_bands(source if isinstance(source, str) else io.BytesIO(source))
+        except Exception as e:
+            logger.warning(f"TIFF not readable by strips, decoding it whole: {str(e)}")
+            reader = None
+        if reader is not None:
+            return reader
+    # JPEG sources are better served by the DCT scaling of the engines
+    if not full_decode or info.format == 'JPEG' or info.frames > 1:
+        return None
+    with metrics.stage('decode'):
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+            pixels = _pillow_pixels(img)
+    return pixels.shape, pixels.dtype, resample.array_bands(pixels)
+
+def _pillow_pixels(img):
+    # 8 bits (or 16 bits gray) array of a Pillow image, palettes and other modes as RGB(A)
+    if img.mode == 'I':
+        # Pillow decodes 16 bits gray PNG as 32 bits integers
+        pixels = np.asarray(img)
+        if pixels.min() >= 0 and pixels.max() <= 65535:
+            return pixels.astype(np.uint16)
+    if img.mode not in ('L', 'LA', 'RGB', 'RGBA', 'I;16'):
+        img = img.convert('RGBA' if img.mode == 'PA' or 'transparency' in img.info else 'RGB')
+    return np.asarray(img)
+
+def _sample_ceiling(pixels):
+    """
+    Valeur maximale de la profondeur de la source (255, 65535), ramenée à 255 en sortie.
+    
+    Les entiers plus larges que 16 bits (imageio lit les PNG 16 bits gris en int32) sont tenus
+    à 16 bits si leurs valeurs y tiennent, à leur maximum sinon ; les flottants à 255.
+    """
+    if not np.issubdtype(pixels.dtype, np.integer):
+        return 255
+    if pixels.dtype.itemsize <= 2:
+        return int(np.iinfo(pixels.dtype).max)
+    return max(int(pixels.max()), 65535)
+
+def _render_tiled(source, output_format, encode, full_decode, width, height, resize_mode='fit', keep_ratio=True,
+                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    """
+    Redimensionne une grande image bande par bande (voir resample.resize_bands) puis compose et
+    encode le résultat avec `encode(pixels, output_format, encoder)` (pixels RGB(A) ou gris, uint8).
+    
+    Retourne None quand la source est sous TILED_RESIZE_PIXELS ou ne se lit pas par bandes :
+    l'outil la traite alors normalement.
+    """
+    threshold = app.config['TILED_RESIZE_PIXELS']
+    if not threshold:
+        return None
+    info = _probe_image(source)
+    if info is None or info.size[0] * info.size[1] < threshold:
+        return None
+    reader = _tiled_reader(source, info, full_decode)
+    if reader is None:
+        return None
+    shape, dtype, bands = reader
+    
+    plan = layout.plan(shape[1], shape[0], width, height, resize_mode, keep_ratio, crop_position)
+    # Decoding happens band by band inside the resize
+    with metrics.stage('resize'):
+        pixels = resample.resize_bands(bands, shape, plan.region, plan.src_box, _native_kernel(resampling),
+                                       max_value=np.iinfo(dtype).max)
+    return encode(_numpy_compose(pixels, plan, output_format, bg_color, bg_alpha), output_format, encoder)
+
+def _numpy_compose(pixels, plan, output_format, bg_color, bg_alpha):
+    # Planned canvas around a resized region (uint8 gray, gray + alpha, RGB or RGBA), in RGB order
+    with metrics.stage('composite'):
+        if pixels.ndim == 3 and pixels.shape[2] == 2:
+            # Gray + alpha, composited as RGBA
+            pixels = pixels[:, :, [0, 0, 0, 1]]
+        has_alpha = pixels.ndim == 3 and pixels.shape[2] == 4
+        if plan.padded or (plan.mode == 'fit' and has_alpha):
+            pixels = _plan_canvas(pixels, plan, _parse_background(bg_color, bg_alpha),
+                                  _numpy_blend_over if has_alpha else None)
+        if output_format in ('jpg', 'jpeg') and has_alpha:
+            pixels = pixels[:, :, :3]
+    return np.ascontiguousarray(pixels)
+
+def _parse_background(bg_color, bg_alpha):
+    # Any Pillow color, like the pillow engine
+    try:
+        return [*ImageColor.getrgb(bg_color)[:3], bg_alpha]
+    except (ValueError, AttributeError):
+        return [255, 255, 255, bg_alpha]
+
+def _native_kernel(resampling):
+    # Filter of resample.py for a resampling method, Lanczos for unknown methods like the other engines
+    resampling = resampling.lower()
+    return resampling if resampling in resample.KERNELS else 'lanczos'
+
+# Output formats written with every frame of an animated or multi-page source
+MULTI_FRAME_FORMATS = {'gif', 'webp', 'tiff', 'tif'}
+# Bytes per pixel of each resized frame that Pillow's writer keeps until the last one (TIFF is written page by page)
+RETAINED_FRAME_BYTES = {'gif': 1, 'webp': 4}
+
+_frame_pool = None
+
+def _get_frame_pool():
+    # Frames are resized in threads: Pillow, OpenCV and NumPy release the GIL while they work
+    global _frame_pool
+    if _frame_pool is None:
+        _frame_pool = ThreadPoolExecutor(max_workers=app.config['FRAME_WORKERS'], thread_name_prefix='frame')
+    return _frame_pool
+
+def _animated(process, render_frame):
+    # File based processing function whose animated / multi-page sources keep all their frames
+    @functools.wraps(process)
+    def wrapper(input_path, output_path, **params):
+        result = _render_animated(input_path, _output_format(output_path), render_frame, params)
+        if result is None:
+            return process(input_path, output_path, **params)
+        with open(output_path, 'wb') as f:
+            f.write(result)
+    return wrapper
+
+def _animated_bytes(process_bytes, render_frame):
+    # Same for the in-memory processing functions
+    @functools.wraps(process_bytes)
+    def wrapper(data, output_format, **params):
+        result = _render_animated(data, output_format, render_frame, params)
+        return process_bytes(data, output_format, **params) if result is None else result
+    return wrapper
+
+def _render_animated(source, output_format, render_frame, params):
+    """
+    Redimensionne chaque image d'une animation (GIF, WebP) ou chaque page d'un TIFF avec
+    `render_frame(image, output_format, **params)` et les réécrit dans une seule sortie.
+    
+    Les images sont décodées une à une et réparties sur le pool de threads : au plus
+    FRAME_WINDOW images sont en cours de rendu, l'encodeur reçoit chacune dès qu'elle est prête.
+    Un TIFF est écrit page par page ; les writers GIF et WebP de Pillow gardent toutes les images
+    redimensionnées jusqu'à la dernière (en palette pour GIF, RGB(A) pour WebP) : une sortie dont
+    ces images dépasseraient MAX_IMAGE_MEMORY est refusée (413). Durées, boucle et modes de
+    disposition (GIF vers GIF) sont conservés.
+    
+    Retourne None pour une source d'une seule image ou un format de sortie sans animation :
+    l'outil la traite alors normalement (première image).
+    """
+    if output_format not in MULTI_FRAME_FORMATS:
+        return None
+    info = _probe_image(source)
+    if info is None or info.frames < 2:
+        return None
+    if output_format in RETAINED_FRAME_BYTES:
+        retained = info.frames * params['width'] * params['height'] * RETAINED_FRAME_BYTES[output_format]
+        if retained > app.config['MAX_IMAGE_MEMORY']:
+            raise ImageTooLarge(f"Animation too large: {info.frames} {output_format.upper()} frames of "
+                                f"{params['width']}x{params['height']} would take {retained} bytes, "
+                                f"at most {app.config['MAX_IMAGE_MEMORY']} allowed")
+    
+    # Encoder options apply to the whole sequence, max_bytes is not searched for animations
+    params = dict(params)
+    encoder = params.pop('encoder', None)
     
-    subprocess.run(cmd, check=True)
+    durations, disposals = [], []
+    buffer = io.BytesIO()
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+        options = _pillow_save_options(encoder, output_format)
+        if output_format in ('gif', 'webp'):
+            # Filled while the frames are read, each duration is there before its frame is written
+            options['duration'] = durations
+            if 'loop' in img.info:
+                options['loop'] = img.info['loop']
+        if output_format == 'gif' and img.format == 'GIF':
+            options['disposal'] = disposals
+        
+        rendered = frames.windowed_map(lambda frame: render_frame(frame, output_format, **params),
+                                       frames.decoded_frames(img, durations, disposals),
+                                       _get_frame_pool(), app.config['FRAME_WINDOW'])
+        # Decoding, resizing and encoding overlap, they are measured as one stage
+        with metrics.stage('frames'):
+            frames.save_frames(rendered, buffer, _pillow_format(output_format), **options)
+    return buffer.getvalue()
+
+def _array_frame(transform, to_array=None, from_array=None):
+    # Frame renderer of an engine working on arrays: Pillow frame -> array -> transform -> Pillow frame
+    def render_frame(frame, output_format, **params):
+        pixels = np.asarray(frame)
+        if to_array is not None:
+            pixels = to_array(pixels)
+        pixels = transform(pixels, output_format, **params)
+        return Image.fromarray(pixels if from_array is None else from_array(pixels))
+    return render_frame
 
 def process_pillow(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
-                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255):
-    # Open image with Pillow
-    img = Image.open(input_path)
+                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Open image with Pillow, JPEG sources are decoded at the smallest DCT scale covering the target
+    with metrics.stage('decode'):
+        img = Image.open(input_path)
+        _pillow_draft(img, _decode_hint(img.size, width, height, resize_mode, keep_ratio))
+        img.load()
+    output_format = _output_format(output_path)
+    img = _pillow_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                            resampling, crop_position, bg_color, bg_alpha)
     
+    # Save the result
+    result = _pillow_encode(img, output_format, encoder)
+    with open(output_path, 'wb') as f:
+        f.write(result)
+
+def process_pillow_bytes(data, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                        resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Decode straight from the uploaded bytes
+    with metrics.stage('decode'):
+        img = Image.open(io.BytesIO(data))
+        _pillow_draft(img, _decode_hint(img.size, width, height, resize_mode, keep_ratio))
+        img.load()
+    return render_pillow(img, output_format, width, height, resize_mode, keep_ratio,
+                         resampling, crop_position, bg_color, bg_alpha, encoder)
+
+def render_pillow(img, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    img = _pillow_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                            resampling, crop_position, bg_color, bg_alpha)
+    return _pillow_encode(img, output_format, encoder)
+
+def _pillow_encode(img, output_format, encoder=None):
+    # Encode into an in-memory buffer, as many times as max_bytes needs
+    def encode(options):
+        buffer = io.BytesIO()
+        with metrics.stage('encode'):
+            img.save(buffer, format=_pillow_format(output_format), **_pillow_save_options(options, output_format))
+        return buffer.getvalue()
+    return _fit_size(encode, encoder, output_format)
+
+def _pillow_save_options(encoder, output_format):
+    # Writer options of Pillow, also understood by the Pillow plugin of imageio
+    options = encoding.for_format(encoder, output_format)
+    save = {}
+    for name, option in (('quality', 'quality'), ('progressive', 'progressive'), ('subsampling', 'subsampling'),
+                         ('compress_level', 'compress_level'), ('webp_method', 'method'),
+                         ('avif_speed', 'speed'), ('jxl_effort', 'effort')):
+        if name in options:
+            save[option] = options[name]
+    if output_format == 'avif':
+        save['max_threads'] = app.config['ENCODE_THREADS']
+    if options.get('strip_metadata'):
+        # Some writers copy the ICC profile and EXIF of the source, kept in the image info
+        save['icc_profile'] = None
+        save['exif'] = b''
+    return save
+
+def _pillow_draft(img, hint):
+    # Shrink-on-load: libjpeg decodes directly at 1/2, 1/4 or 1/8 when it still covers `hint`
+    if img.format == 'JPEG':
+        img.draft(img.mode, hint)
+
+def decode_pillow(data, hint=None):
+    img = Image.open(io.BytesIO(data))
+    if hint is not None:
+        _pillow_draft(img, hint)
+    img.load()
+    return img
+
+def _pillow_format(output_format):
+    # Map a file extension to the Pillow format name (jpg -> JPEG, tif -> TIFF...)
+    return Image.registered_extensions().get(f'.{output_format}', output_format.upper())
+
+def _pillow_resample(resampling):
     # Map resampling methods to Pillow constants
     resampling_methods = {
         'nearest': Image.NEAREST,
@@ -271,7 +1439,11 @@ def process_pillow(input_path, output_path, width, height, resize_mode='fit', ke
         'lanczos': Image.LANCZOS,
         'hanning': Image.LANCZOS  # Pillow n'a pas de méthode Hanning, utiliser Lanczos
     }
-    resample = resampling_methods.get(resampling.lower(), Image.LANCZOS)
+    return resampling_methods.get(resampling.lower(), Image.LANCZOS)
+
+def _pillow_transform(img, output_format, width, height, resize_mode, keep_ratio, 
+                      resampling, crop_position, bg_color, bg_alpha):
+    resample = _pillow_resample(resampling)
     
     # Handle background color
     bg = bg_color
@@ -284,99 +1456,151 @@ def process_pillow(input_path, output_path, width, height, resize_mode='fit', ke
             # Fallback to white
             bg = (255, 255, 255, bg_alpha)
     
-    # Process resize based on mode
-    if resize_mode == 'fit' and keep_ratio:
-        # Calculate dimensions to maintain aspect ratio
-        img_width, img_height = img.size
-        ratio = min(width/img_width, height/img_height)
-        new_size = (int(img_width * ratio), int(img_height * ratio))
-        
-        # Resize image to fit within the target dimensions
-        img = img.resize(new_size, resample)
-        
-        # Create new image with background color
-        new_img = Image.new('RGBA', (width, height), bg)
-        
-        # Calculate position based on crop_position
-        if crop_position == 'center':
-            paste_x = (width - new_size[0]) // 2
-            paste_y = (height - new_size[1]) // 2
-        elif crop_position == 'top':
-            paste_x = (width - new_size[0]) // 2
-            paste_y = 0
-        elif crop_position == 'bottom':
-            paste_x = (width - new_size[0]) // 2
-            paste_y = height - new_size[1]
-        elif crop_position == 'left':
-            paste_x = 0
-            paste_y = (height - new_size[1]) // 2
-        elif crop_position == 'right':
-            paste_x = width - new_size[0]
-            paste_y = (height - new_size[1]) // 2
-        else:  # default to center
-            paste_x = (width - new_size[0]) // 2
-            paste_y = (height - new_size[1]) // 2
-        
-        # Paste resized image onto background
-        if img.mode == 'RGBA':
-            new_img.paste(img, (paste_x, paste_y), img)
-        else:
-            new_img.paste(img, (paste_x, paste_y))
-        img = new_img
-    
-    elif resize_mode == 'stretch':
-        # Stretch to fit dimensions without keeping ratio
-        img = img.resize((width, height), resample)
-    
-    else:  # Default to crop (fill mode)
-        # Calculate dimensions to maintain aspect ratio
-        img_width, img_height = img.size
-        ratio = max(width/img_width, height/img_height)
-        new_size = (int(img_width * ratio), int(img_height * ratio))
-        
-        # Resize image to cover the target dimensions
-        img = img.resize(new_size, resample)
-        
-        # Calculate crop box (center crop by default)
-        if crop_position == 'center':
-            left = (new_size[0] - width) / 2
-            top = (new_size[1] - height) / 2
-        elif crop_position == 'top':
-            left = (new_size[0] - width) / 2
-            top = 0
-        elif crop_position == 'bottom':
-            left = (new_size[0] - width) / 2
-            top = new_size[1] - height
-        elif crop_position == 'left':
-            left = 0
-            top = (new_size[1] - height) / 2
-        elif crop_position == 'right':
-            left = new_size[0] - width
-            top = (new_size[1] - height) / 2
-        else:  # default to center
-            left = (new_size[0] - width) / 2
-            top = (new_size[1] - height) / 2
-            
-        right = left + width
-        bottom = top + height
-        img = img.crop((int(left), int(top), int(right), int(bottom)))
+    # A single resize of the planned source region, cropped parts are never resampled
+    plan = layout.plan(img.width, img.height, width, height, resize_mode, keep_ratio, crop_position)
+    with metrics.stage('resize'):
+        img = img.resize(plan.region, resample, box=plan.src_box, reducing_gap=PILLOW_REDUCING_GAP)
     
-    # Convert to RGB if saving as JPG
-    if output_path.lower().endswith(('.jpg', '.jpeg')):
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
+    with metrics.stage('composite'):
+        # Fit pads the free space and composites transparency over the background color
+        if plan.padded or (plan.mode == 'fit' and img.mode == 'RGBA'):
+            new_img = Image.new('RGBA', plan.size, bg)
+            if img.mode == 'RGBA':
+                new_img.paste(img, plan.offset, img)
+            else:
+                new_img.paste(img, plan.offset)
+            img = new_img
+        
+        # Convert to RGB if saving as JPG
+        if output_format in ('jpg', 'jpeg'):
+            if img.mode == 'RGBA':
+                img = img.convert('RGB')
     
-    # Save the result
-    img.save(output_path)
+    return img
+
+def _pillow_encode_array(pixels, output_format, encoder=None):
+    return _pillow_encode(Image.fromarray(pixels), output_format, encoder)
+
+ENGINES.register('pillow', _animated(_tiled(process_pillow, _pillow_encode_array), _pillow_transform),
+                 _animated_bytes(_tiled_bytes(process_pillow_bytes, _pillow_encode_array), _pillow_transform),
+                 formats=ALLOWED_EXTENSIONS,
+                 resamplers=('nearest', 'bilinear', 'bicubic', 'lanczos'), modules=('PIL.Image',),
+                 optional_formats=PILLOW_OPTIONAL_FORMATS)
 
 def process_opencv(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
-                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255):
-    # Read the image
-    img = cv2.imread(input_path, cv2.IMREAD_UNCHANGED)
+                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Read the image, JPEG sources are decoded at the smallest DCT scale covering the target
+    info = _probe_image(input_path)
+    flags = _opencv_read_flags(info, width, height, resize_mode, keep_ratio)
+    with metrics.stage('decode'):
+        img = cv2.imread(input_path, flags)
+    output_format = _output_format(output_path)
+    img_result = _opencv_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                                   resampling, crop_position, bg_color, bg_alpha)
     
-    # Check if image has alpha channel
-    has_alpha = img.shape[2] == 4 if len(img.shape) == 3 else False
+    result = _opencv_encode(img_result, output_format, encoder)
+    with open(output_path, 'wb') as f:
+        f.write(result)
+
+def process_opencv_bytes(data, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                        resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Decode straight from the uploaded bytes
+    info = _probe_image(data)
+    hint = _decode_hint(info.size, width, height, resize_mode, keep_ratio) if info else None
+    img = decode_opencv(data, hint)
+    return render_opencv(img, output_format, width, height, resize_mode, keep_ratio,
+                         resampling, crop_position, bg_color, bg_alpha, encoder)
+
+def _opencv_read_flags(info, width, height, resize_mode='fit', keep_ratio=True, hint=None):
+    # IMREAD_REDUCED_* let libjpeg scale in the DCT domain, only worth it (and alpha-safe) for JPEG
+    if info is None or info.format != 'JPEG':
+        return cv2.IMREAD_UNCHANGED
+    if hint is None:
+        hint = _decode_hint(info.size, width, height, resize_mode, keep_ratio)
+    factor = _jpeg_scale_factor(info.size, hint)
+    if factor == 1:
+        return cv2.IMREAD_UNCHANGED
+    # IMREAD_UNCHANGED ignores EXIF orientation, keep doing so with the reduced modes
+    return getattr(cv2, OPENCV_REDUCED_FLAGS[(factor, info.mode == 'L')]) | cv2.IMREAD_IGNORE_ORIENTATION
+
+def decode_opencv(data, hint=None):
+    flags = cv2.IMREAD_UNCHANGED
+    if hint is not None:
+        flags = _opencv_read_flags(_probe_image(data), None, None, hint=hint)
+    with metrics.stage('decode'):
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if img is None:
+        raise ValueError("OpenCV could not decode the image")
+    return img
+
+def render_opencv(img, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    img_result = _opencv_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                                   resampling, crop_position, bg_color, bg_alpha)
+    return _opencv_encode(img_result, output_format, encoder)
+
+def _blend_over(roi, src):
+    """
+    Compose `src` (BGRA, uint8) sur `roi` (BGRA, uint8) en place : les canaux couleur reçoivent
+    src * a / 255 + roi * (255 - a) / 255 et l'alpha celui de `src`.
+    
+    Les produits sont sommés en uint16 (au plus 255 * 255) puis divisés par 255 et arrondis une
+    seule fois, sans copie flottante de l'image.
+    """
+    alpha = cv2.cvtColor(src[:, :, 3], cv2.COLOR_GRAY2BGR)
+    color = cv2.multiply(cv2.cvtColor(src, cv2.COLOR_BGRA2BGR), alpha, dtype=cv2.CV_16U)
+    background = cv2.multiply(cv2.cvtColor(roi, cv2.COLOR_BGRA2BGR), cv2.bitwise_not(alpha), dtype=cv2.CV_16U)
+    cv2.add(color, background, dst=color)
     
+    roi[:, :, :3] = cv2.convertScaleAbs(color, alpha=1 / 255)
+    roi[:, :, 3] = src[:, :, 3]
+
+# Names of the OpenCV flags, resolved on use so that cv2 is only imported by the OpenCV engine
+OPENCV_REDUCED_FLAGS = {
+    (2, False): 'IMREAD_REDUCED_COLOR_2',
+    (4, False): 'IMREAD_REDUCED_COLOR_4',
+    (8, False): 'IMREAD_REDUCED_COLOR_8',
+    (2, True): 'IMREAD_REDUCED_GRAYSCALE_2',
+    (4, True): 'IMREAD_REDUCED_GRAYSCALE_4',
+    (8, True): 'IMREAD_REDUCED_GRAYSCALE_8',
+}
+
+# Names of the OpenCV JPEG sampling factors
+OPENCV_SAMPLING_FACTORS = {
+    '4:4:4': 'IMWRITE_JPEG_SAMPLING_FACTOR_444',
+    '4:2:2': 'IMWRITE_JPEG_SAMPLING_FACTOR_422',
+    '4:2:0': 'IMWRITE_JPEG_SAMPLING_FACTOR_420',
+}
+
+def _opencv_encode(img, output_format, encoder=None):
+    # Encode into an in-memory buffer, as many times as max_bytes needs
+    def encode(options):
+        with metrics.stage('encode'):
+            ok, encoded = cv2.imencode(f'.{output_format}', img, _opencv_write_params(options, output_format))
+        if not ok:
+            raise ValueError(f"OpenCV could not encode to {output_format}")
+        return encoded.tobytes()
+    return _fit_size(encode, encoder, output_format)
+
+def _opencv_write_params(encoder, output_format):
+    # imencode flags; OpenCV writes no metadata and has no WebP method setting
+    options = encoding.for_format(encoder, output_format)
+    params = []
+    if output_format in ('jpg', 'jpeg'):
+        if 'quality' in options:
+            params.extend([cv2.IMWRITE_JPEG_QUALITY, options['quality']])
+        if 'progressive' in options:
+            params.extend([cv2.IMWRITE_JPEG_PROGRESSIVE, int(options['progressive'])])
+        if 'subsampling' in options:
+            params.extend([cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+                           getattr(cv2, OPENCV_SAMPLING_FACTORS[options['subsampling']])])
+    elif output_format == 'webp' and 'quality' in options:
+        params.extend([cv2.IMWRITE_WEBP_QUALITY, options['quality']])
+    elif 'compress_level' in options:
+        params.extend([cv2.IMWRITE_PNG_COMPRESSION, options['compress_level']])
+    return params
+
+def _opencv_interpolation(resampling):
     # Map resampling methods to OpenCV interpolation
     interp_map = {
         'nearest': cv2.INTER_NEAREST,
@@ -385,7 +1609,14 @@ def process_opencv(input_path, output_path, width, height, resize_mode='fit', ke
         'lanczos': cv2.INTER_LANCZOS4,
         'hanning': cv2.INTER_LINEAR  # OpenCV doesn't have Hanning
     }
-    interpolation = interp_map.get(resampling.lower(), cv2.INTER_LANCZOS4)
+    return interp_map.get(resampling.lower(), cv2.INTER_LANCZOS4)
+
+def _opencv_transform(img, output_format, width, height, resize_mode, keep_ratio, 
+                      resampling, crop_position, bg_color, bg_alpha):
+    # Check if image has alpha channel
+    has_alpha = img.shape[2] == 4 if len(img.shape) == 3 else False
+    
+    interpolation = _opencv_interpolation(resampling)
     
     # Map background color
     if isinstance(bg_color, str):
@@ -409,395 +1640,975 @@ def process_opencv(input_path, output_path, width, height, resize_mode='fit', ke
     if has_alpha:
         bg.append(bg_alpha)
     
-    # Process the image based on resize mode
-    if resize_mode == 'fit' and keep_ratio:
-        # Calculate dimensions to maintain aspect ratio
-        h, w = img.shape[:2]
-        ratio = min(width/w, height/h)
-        new_size = (int(w * ratio), int(h * ratio))
-        
-        # Resize image to fit within the target dimensions
-        img_resized = cv2.resize(img, new_size, interpolation=interpolation)
-        
-        # Create new image with background color
-        if has_alpha:
-            # Create BGRA image
-            new_img = np.full((height, width, 4), bg, dtype=np.uint8)
-        else:
-            # Create BGR image
-            new_img = np.full((height, width, 3), bg[:3], dtype=np.uint8)
-        
-        # Calculate position based on crop_position
-        if crop_position == 'center':
-            start_x = (width - new_size[0]) // 2
-            start_y = (height - new_size[1]) // 2
-        elif crop_position == 'top':
-            start_x = (width - new_size[0]) // 2
-            start_y = 0
-        elif crop_position == 'bottom':
-            start_x = (width - new_size[0]) // 2
-            start_y = height - new_size[1]
-        elif crop_position == 'left':
-            start_x = 0
-            start_y = (height - new_size[1]) // 2
-        elif crop_position == 'right':
-            start_x = width - new_size[0]
-            start_y = (height - new_size[1]) // 2
-        else:
-            start_x = (width - new_size[0]) // 2
-            start_y = (height - new_size[1]) // 2
-        
-        # Paste resized image onto background
-        end_x = start_x + new_size[0]
-        end_y = start_y + new_size[1]
-        
-        if has_alpha:
-            # Alpha blending
-            alpha = img_resized[:, :, 3] / 255.0
-            for c in range(3):
-                new_img[start_y:end_y, start_x:end_x, c] = (
-                    img_resized[:, :, c] * alpha + 
-                    new_img[start_y:end_y, start_x:end_x, c] * (1 - alpha)
-                ).astype(np.uint8)
-            new_img[start_y:end_y, start_x:end_x, 3] = img_resized[:, :, 3]
-        else:
-            new_img[start_y:end_y, start_x:end_x] = img_resized
-        
-        img_result = new_img
-    
-    elif resize_mode == 'stretch':
-        # Stretch to fit dimensions without keeping ratio
-        img_result = cv2.resize(img, (width, height), interpolation=interpolation)
+    # One resize, then the planned region is cropped out as a view and copied once into the canvas
+    plan = layout.plan(img.shape[1], img.shape[0], width, height, resize_mode, keep_ratio, crop_position)
+    with metrics.stage('resize'):
+        img_resized = cv2.resize(img, plan.resize, interpolation=interpolation)
+    img_result = _plan_region(img_resized, plan)
     
-    else:  # Default to crop (fill mode)
-        # Calculate dimensions to maintain aspect ratio
-        h, w = img.shape[:2]
-        ratio = max(width/w, height/h)
-        new_size = (int(w * ratio), int(h * ratio))
+    with metrics.stage('composite'):
+        if plan.padded or (plan.mode == 'fit' and has_alpha):
+            img_result = _plan_canvas(img_result, plan, bg, _blend_over if has_alpha else None)
         
-        # Resize image to cover the target dimensions
-        img_resized = cv2.resize(img, new_size, interpolation=interpolation)
-        
-        # Calculate crop coordinates
-        if crop_position == 'center':
-            start_x = (new_size[0] - width) // 2
-            start_y = (new_size[1] - height) // 2
-        elif crop_position == 'top':
-            start_x = (new_size[0] - width) // 2
-            start_y = 0
-        elif crop_position == 'bottom':
-            start_x = (new_size[0] - width) // 2
-            start_y = new_size[1] - height
-        elif crop_position == 'left':
-            start_x = 0
-            start_y = (new_size[1] - height) // 2
-        elif crop_position == 'right':
-            start_x = new_size[0] - width
-            start_y = (new_size[1] - height) // 2
-        else:
-            start_x = (new_size[0] - width) // 2
-            start_y = (new_size[1] - height) // 2
-        
-        # Crop the image
-        end_x = start_x + width
-        end_y = start_y + height
-        img_result = img_resized[start_y:end_y, start_x:end_x]
+        # Save the result
+        if output_format in ('jpg', 'jpeg') and has_alpha:
+            # Convert BGRA to BGR for JPG
+            img_result = cv2.cvtColor(img_result, cv2.COLOR_BGRA2BGR)
     
-    # Save the result
-    if output_path.lower().endswith(('.jpg', '.jpeg')) and has_alpha:
-        # Convert BGRA to BGR for JPG
-        img_result = cv2.cvtColor(img_result, cv2.COLOR_BGRA2BGR)
-    
-    cv2.imwrite(output_path, img_result)
+    return img_result
+
+def _opencv_encode_array(pixels, output_format, encoder=None):
+    return _opencv_encode(_opencv_from_rgb(pixels), output_format, encoder)
+
+# cv2.imencode has no GIF writer
+def _opencv_from_rgb(pixels):
+    # RGB(A) to the BGR(A) order of OpenCV, and back
+    if pixels.ndim == 3:
+        pixels = cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGRA if pixels.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+    return pixels
+
+def _opencv_to_rgb(pixels):
+    if pixels.ndim == 3:
+        pixels = cv2.cvtColor(pixels, cv2.COLOR_BGRA2RGBA if pixels.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+    return pixels
+
+_opencv_frame = _array_frame(_opencv_transform, _opencv_from_rgb, _opencv_to_rgb)
+
+ENGINES.register('opencv', _animated(_tiled(process_opencv, _opencv_encode_array), _opencv_frame),
+                 _animated_bytes(_tiled_bytes(process_opencv_bytes, _opencv_encode_array), _opencv_frame),
+                 formats=ALLOWED_EXTENSIONS - {'gif'},
+                 resamplers=('nearest', 'bilinear', 'bicubic', 'lanczos'), modules=('cv2', 'numpy', 'PIL.Image'))
 
 def process_imageio(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
-                   resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255):
-    import imageio.v3 as iio
-    from skimage.transform import resize
-    import numpy as np
+                   resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Read image (first frame of an animation, the v3 API would stack them all)
+    with metrics.stage('decode'):
+        img = iio.imread(input_path, index=0)
+    output_format = _output_format(output_path)
+    img_result = _imageio_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                                    resampling, crop_position, bg_color, bg_alpha)
     
-    # Read image
-    img = iio.imread(input_path)
+    result = _imageio_encode_array(img_result, output_format, encoder)
+    with open(output_path, 'wb') as f:
+        f.write(result)
+
+def process_imageio_bytes(data, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                         resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Decode straight from the uploaded bytes
+    img = decode_imageio(data)
+    return render_imageio(img, output_format, width, height, resize_mode, keep_ratio,
+                          resampling, crop_position, bg_color, bg_alpha, encoder)
+
+def decode_imageio(data):
+    with metrics.stage('decode'):
+        return iio.imread(data, index=0)
+
+def render_imageio(img, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                   resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    img_result = _imageio_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                                    resampling, crop_position, bg_color, bg_alpha)
     
+    # Encode into an in-memory buffer
+    return _imageio_encode_array(img_result, output_format, encoder)
+
+def _imageio_transform(img, output_format, width, height, resize_mode, keep_ratio, 
+                       resampling, crop_position, bg_color, bg_alpha):
     # Check if image has alpha channel
     has_alpha = img.shape[2] == 4 if len(img.shape) == 3 else False
     
-    # Process the image based on resize mode
-    if resize_mode == 'fit' and keep_ratio:
-        # Calculate dimensions to maintain aspect ratio
-        h, w = img.shape[:2]
-        ratio = min(width/w, height/h)
-        new_h, new_w = int(h * ratio), int(w * ratio)
-        
-        # Resize image
-        img_resized = resize(img, (new_h, new_w), order=3, anti_aliasing=True, 
-                            preserve_range=True).astype(img.dtype)
-        
-        # Parse background color
-        if isinstance(bg_color, str):
-            if bg_color == 'white':
-                bg = np.array([255, 255, 255])
-            elif bg_color == 'black':
-                bg = np.array([0, 0, 0])
-            else:
-                bg = np.array([255, 255, 255])
-        else:
-            bg = np.array([255, 255, 255])
-        
-        # Create new canvas with background color
-        if has_alpha:
-            canvas = np.zeros((height, width, 4), dtype=img.dtype)
-            canvas[:, :, :3] = bg
-            canvas[:, :, 3] = bg_alpha
-        else:
-            canvas = np.zeros((height, width, 3), dtype=img.dtype)
-            canvas[:, :, :] = bg
-        
-        # Calculate position based on crop_position
-        if crop_position == 'center':
-            start_x = (width - new_w) // 2
-            start_y = (height - new_h) // 2
-        elif crop_position == 'top':
-            start_x = (width - new_w) // 2
-            start_y = 0
-        elif crop_position == 'bottom':
-            start_x = (width - new_w) // 2
-            start_y = height - new_h
-        elif crop_position == 'left':
-            start_x = 0
-            start_y = (height - new_h) // 2
-        elif crop_position == 'right':
-            start_x = width - new_w
-            start_y = (height - new_h) // 2
-        else:
-            start_x = (width - new_w) // 2
-            start_y = (height - new_h) // 2
-        
-        # Place resized image on canvas
-        end_x = start_x + new_w
-        end_y = start_y + new_h
-        
-        if has_alpha and img_resized.shape[2] == 4:
-            # Alpha compositing
-            alpha = img_resized[:, :, 3:4] / 255.0
-            canvas[start_y:end_y, start_x:end_x, :3] = (
-                img_resized[:, :, :3] * alpha + 
-                canvas[start_y:end_y, start_x:end_x, :3] * (1 - alpha)
-            )
-            canvas[start_y:end_y, start_x:end_x, 3] = img_resized[:, :, 3]
-        else:
-            canvas[start_y:end_y, start_x:end_x] = img_resized
-        
-        img_result = canvas
-    
-    elif resize_mode == 'stretch':
-        # Stretch to fit dimensions without keeping ratio
-        img_result = resize(img, (height, width), order=3, anti_aliasing=True, 
-                           preserve_range=True).astype(img.dtype)
-    
-    else:  # Default to crop (fill mode)
-        # Calculate dimensions to maintain aspect ratio
-        h, w = img.shape[:2]
-        ratio = max(width/w, height/h)
-        new_h, new_w = int(h * ratio), int(w * ratio)
-        
-        # Resize image
-        img_resized = resize(img, (new_h, new_w), order=3, anti_aliasing=True, 
-                            preserve_range=True).astype(img.dtype)
+    plan = layout.plan(img.shape[1], img.shape[0], width, height, resize_mode, keep_ratio, crop_position)
+    with metrics.stage('resize'):
+        img_result = _numpy_engine_resize(img, plan, resampling)
+    
+    with metrics.stage('composite'):
+        if plan.padded or (plan.mode == 'fit' and has_alpha):
+            img_result = _plan_canvas(img_result, plan, _numpy_background(bg_color, bg_alpha),
+                                      _numpy_blend_over if has_alpha else None)
         
-        # Calculate crop coordinates
-        if crop_position == 'center':
-            start_x = (new_w - width) // 2
-            start_y = (new_h - height) // 2
-        elif crop_position == 'top':
-            start_x = (new_w - width) // 2
-            start_y = 0
-        elif crop_position == 'bottom':
-            start_x = (new_w - width) // 2
-            start_y = new_h - height
-        elif crop_position == 'left':
-            start_x = 0
-            start_y = (new_h - height) // 2
-        elif crop_position == 'right':
-            start_x = new_w - width
-            start_y = (new_h - height) // 2
-        else:
-            start_x = (new_w - width) // 2
-            start_y = (new_h - height) // 2
+        # Convertir RGBA en RGB pour les fichiers JPEG
+        if output_format in ('jpg', 'jpeg') and len(img_result.shape) == 3 and img_result.shape[2] == 4:
+            img_result = img_result[:, :, :3]
         
-        # Crop the image
-        end_x = start_x + width
-        end_y = start_y + height
-        img_result = img_resized[start_y:end_y, start_x:end_x]
+        # Single conversion of the float32 result to uint8
+        img_result = _numpy_to_uint8(img_result)
     
-    # Save the result (convert to uint8 if necessary)
-    if img_result.dtype != np.uint8:
-        img_result = np.clip(img_result, 0, 255).astype(np.uint8)
+    return img_result
+
+# Spline orders of the skimage/scipy interpolation
+SPLINE_ORDERS = {
+    'nearest': 0,
+    'bilinear': 1,
+    'bicubic': 3,
+}
+# Filters that the splines do not have, applied by resample.py instead
+NATIVE_KERNELS = ('hanning', 'lanczos', 'mitchell', 'catmull-rom')
+
+def _numpy_engine_resize(img, plan, resampling):
+    """
+    Redimensionnement des outils imageio et scikit-image : les filtres à fenêtre (Hanning,
+    Lanczos, Mitchell, Catmull-Rom) passent par resample.py, directement de la zone source du
+    plan à la région planifiée ; les autres méthodes par les splines de scipy (float32).
+    """
+    resampling = resampling.lower()
+    max_value = _sample_ceiling(img)
+    if resampling in NATIVE_KERNELS or resampling not in SPLINE_ORDERS:
+        return resample.resize(img, plan.region, plan.src_box, _native_kernel(resampling), max_value)
+    # Resize the whole image to the planned size, then keep the planned region
+    resized = _numpy_resize(img, plan.resize, SPLINE_ORDERS[resampling])
+    if max_value != 255:
+        # 16 bits sources are brought to the 8 bits range of the compositing
+        resized *= np.float32(255 / max_value)
+    return _plan_region(resized, plan)
+
+@functools.lru_cache(maxsize=None)
+def _scratch_buffers():
+    return resample.ScratchBuffers(app.config['NUMPY_SCRATCH_BYTES'])
+
+def _numpy_resize(img, size, order):
+    """
+    Équivalent de skimage.transform.resize(img, ..., order, anti_aliasing=True, preserve_range=True),
+    en float32 au lieu de float64 et sans copie complète intermédiaire.
+    
+    La source est convertie une seule fois dans un tampon de travail du thread, où le flou
+    d'anti-aliasing puis le préfiltre spline sont appliqués en place ; le rééchantillonnage écrit
+    dans un second tampon. Le résultat est une vue de ce tampon, valable jusqu'au prochain appel
+    dans le même thread.
+    """
+    scratch = _scratch_buffers()
+    source = scratch.get('source', img.shape, np.float32)
+    source[...] = img
+    # skimage clips the result to the range of the input
+    low, high = float(img.min()), float(img.max())
     
-    # Convertir RGBA en RGB pour les fichiers JPEG
-    if output_path.lower().endswith(('.jpg', '.jpeg')) and len(img_result.shape) == 3 and img_result.shape[2] == 4:
-        img_result = img_result[:, :, :3]
+    width, height = size
+    factors = np.array([img.shape[0] / height, img.shape[1] / width] + [1] * (img.ndim - 2))
+    sigma = np.maximum(0, (factors - 1) / 2)
+    if sigma.any():
+        ndi.gaussian_filter(source, sigma, output=source, mode='mirror')
+    if order > 1:
+        # ndi.zoom would prefilter into a float64 copy of the whole source
+        ndi.spline_filter(source, order, output=source, mode='mirror')
     
-    iio.imwrite(output_path, img_result)
+    resized = scratch.get('resized', (height, width) + img.shape[2:], np.float32)
+    ndi.zoom(source, 1 / factors, output=resized, order=order, mode='mirror', grid_mode=True, prefilter=False)
+    np.clip(resized, low, high, out=resized)
+    return resized
 
-def process_skimage(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
-                   resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255):
-    from skimage import io, transform
-    import numpy as np
+def _numpy_to_uint8(pixels):
+    # Rounded and saturated, the float buffer is clipped in place
+    if pixels.dtype == np.uint8:
+        return pixels
+    np.clip(pixels, 0, 255, out=pixels)
+    result = np.empty(pixels.shape, dtype=np.uint8)
+    np.rint(pixels, out=result, casting='unsafe')
+    return result
+
+def _plan_region(img, plan):
+    # View of the planned region of a resized image
+    left, top, right, bottom = plan.crop
+    return img[top:bottom, left:right]
+
+def _plan_canvas(region, plan, bg, composite=None):
+    """
+    Place `region` sur un fond de la taille du plan, à la position du plan.
+    
+    Sans `composite`, seules les bandes de remplissage reçoivent la couleur de fond et la région
+    est copiée une seule fois. Avec `composite(roi, region)`, le fond est rempli puis la région
+    y est composée en place.
+    """
+    width, height = plan.size
+    channels = region.shape[2] if region.ndim == 3 else 1
+    bg = np.asarray(bg[:channels] if region.ndim == 3 else bg[0], dtype=region.dtype)
+    if region.ndim == 3 and len(bg) < channels:
+        # Opaque background for channels the color does not cover (alpha)
+        bg = np.append(bg, np.full(channels - len(bg), 255, dtype=region.dtype))
     
+    canvas = np.empty((height, width) + region.shape[2:], dtype=region.dtype)
+    x, y = plan.offset
+    roi = canvas[y:y + region.shape[0], x:x + region.shape[1]]
+    if composite is not None:
+        canvas[...] = bg
+        composite(roi, region)
+    else:
+        for x0, y0, x1, y1 in plan.pads:
+            canvas[y0:y1, x0:x1] = bg
+        roi[...] = region
+    return canvas
+
+def _numpy_background(bg_color, bg_alpha):
+    # Parse background color (named colors only for the numpy engines)
+    if bg_color == 'black':
+        return [0, 0, 0, bg_alpha]
+    return [255, 255, 255, bg_alpha]
+
+def _numpy_blend_over(roi, src):
+    # Alpha compositing in float32, rounded once when the canvas is uint8 (native and tiled paths)
+    alpha = src[:, :, 3:4].astype(np.float32) * np.float32(1 / 255)
+    color = src[:, :, :3] * alpha
+    color += roi[:, :, :3] * (1 - alpha)
+    if roi.dtype == np.uint8:
+        np.rint(color, out=color)
+    roi[:, :, :3] = color
+    roi[:, :, 3] = src[:, :, 3]
+
+def _imageio_encode_array(pixels, output_format, encoder=None):
+    # imageio writes through its Pillow plugin, which takes the Pillow writer options
+    def encode(options):
+        with metrics.stage('encode'):
+            return iio.imwrite('<bytes>', pixels, extension=f'.{output_format}',
+                               **_pillow_save_options(options, output_format))
+    return _fit_size(encode, encoder, output_format)
+
+_imageio_frame = _array_frame(_imageio_transform)
+
+ENGINES.register('imageio', _animated(_tiled(process_imageio, _imageio_encode_array, full_decode=True),
+                                      _imageio_frame),
+                 _animated_bytes(_tiled_bytes(process_imageio_bytes, _imageio_encode_array, full_decode=True),
+                                 _imageio_frame),
+                 formats=ALLOWED_EXTENSIONS, resamplers=(*SPLINE_ORDERS, *NATIVE_KERNELS),
+                 modules=('imageio.v3', 'scipy.ndimage', 'resample', 'numpy'))
+
+def process_skimage(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
+                   resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
     # Read image
-    img = io.imread(input_path)
+    with metrics.stage('decode'):
+        img = skimage_io.imread(input_path)
+    output_format = _output_format(output_path)
+    img_result = _skimage_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                                    resampling, crop_position, bg_color, bg_alpha)
     
+    # skimage.io.imsave delegates to imageio, encoded like the in-memory path to apply the encoder options
+    result = _imageio_encode_array(img_result, output_format, encoder)
+    with open(output_path, 'wb') as f:
+        f.write(result)
+
+def process_skimage_bytes(data, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                         resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # skimage.io delegates to imageio, use it directly for in-memory buffers
+    img = decode_imageio(data)
+    return render_skimage(img, output_format, width, height, resize_mode, keep_ratio,
+                          resampling, crop_position, bg_color, bg_alpha, encoder)
+
+def render_skimage(img, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                   resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    img_result = _skimage_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                                    resampling, crop_position, bg_color, bg_alpha)
+    return _imageio_encode_array(img_result, output_format, encoder)
+
+def _skimage_transform(img, output_format, width, height, resize_mode, keep_ratio, 
+                       resampling, crop_position, bg_color, bg_alpha):
     # Check if image has alpha channel
     has_alpha = img.shape[2] == 4 if len(img.shape) == 3 else False
     
-    # Map resampling mode
-    order_map = {
-        'nearest': 0,
-        'bilinear': 1,
-        'bicubic': 3,
-        'lanczos': 1,  # Not directly supported, use bilinear
-        'hanning': 1   # Not directly supported, use bilinear
-    }
-    order = order_map.get(resampling.lower(), 1)
-    
-    # Process the image based on resize mode
-    if resize_mode == 'fit' and keep_ratio:
-        # Calculate dimensions to maintain aspect ratio
-        h, w = img.shape[:2]
-        ratio = min(width/w, height/h)
-        new_h, new_w = int(h * ratio), int(w * ratio)
-        
-        # Resize image
-        img_resized = transform.resize(img, (new_h, new_w), order=order, 
-                                      anti_aliasing=True, preserve_range=True).astype(img.dtype)
-        
-        # Parse background color
-        if isinstance(bg_color, str):
-            if bg_color == 'white':
-                bg = np.array([255, 255, 255])
-            elif bg_color == 'black':
-                bg = np.array([0, 0, 0])
-            else:
-                bg = np.array([255, 255, 255])
-        else:
-            bg = np.array([255, 255, 255])
-        
-        # Create new canvas with background color
-        if has_alpha:
-            canvas = np.zeros((height, width, 4), dtype=img.dtype)
-            canvas[:, :, :3] = bg
-            canvas[:, :, 3] = bg_alpha
-        else:
-            canvas = np.zeros((height, width, 3), dtype=img.dtype)
-            canvas[:, :, :] = bg
-        
-        # Calculate position based on crop_position
-        if crop_position == 'center':
-            start_x = (width - new_w) // 2
-            start_y = (height - new_h) // 2
-        elif crop_position == 'top':
-            start_x = (width - new_w) // 2
-            start_y = 0
-        elif crop_position == 'bottom':
-            start_x = (width - new_w) // 2
-            start_y = height - new_h
-        elif crop_position == 'left':
-            start_x = 0
-            start_y = (height - new_h) // 2
-        elif crop_position == 'right':
-            start_x = width - new_w
-            start_y = (height - new_h) // 2
-        else:
-            start_x = (width - new_w) // 2
-            start_y = (height - new_h) // 2
-        
-        # Place resized image on canvas
-        end_x = start_x + new_w
-        end_y = start_y + new_h
-        
-        if has_alpha and img_resized.shape[2] == 4:
-            # Alpha compositing
-            alpha = img_resized[:, :, 3:4] / 255.0
-            canvas[start_y:end_y, start_x:end_x, :3] = (
-                img_resized[:, :, :3] * alpha + 
-                canvas[start_y:end_y, start_x:end_x, :3] * (1 - alpha)
-            )
-            canvas[start_y:end_y, start_x:end_x, 3] = img_resized[:, :, 3]
-        else:
-            canvas[start_y:end_y, start_x:end_x] = img_resized
+    plan = layout.plan(img.shape[1], img.shape[0], width, height, resize_mode, keep_ratio, crop_position)
+    with metrics.stage('resize'):
+        img_result = _numpy_engine_resize(img, plan, resampling)
+    
+    with metrics.stage('composite'):
+        if plan.padded or (plan.mode == 'fit' and has_alpha):
+            img_result = _plan_canvas(img_result, plan, _numpy_background(bg_color, bg_alpha),
+                                      _numpy_blend_over if has_alpha else None)
         
-        img_result = canvas
-    
-    elif resize_mode == 'stretch':
-        # Stretch to fit dimensions without keeping ratio
-        img_result = transform.resize(img, (height, width), order=order, 
-                                     anti_aliasing=True, preserve_range=True).astype(img.dtype)
-    
-    else:  # Default to crop (fill mode)
-        # Calculate dimensions to maintain aspect ratio
-        h, w = img.shape[:2]
-        ratio = max(width/w, height/h)
-        new_h, new_w = int(h * ratio), int(w * ratio)
+        # Convertir RGBA en RGB pour les fichiers JPEG
+        if output_format in ('jpg', 'jpeg') and len(img_result.shape) == 3 and img_result.shape[2] == 4:
+            img_result = img_result[:, :, :3]
         
-        # Resize image
-        img_resized = transform.resize(img, (new_h, new_w), order=order, 
-                                      anti_aliasing=True, preserve_range=True).astype(img.dtype)
+        # Single conversion of the float32 result to uint8
+        img_result = _numpy_to_uint8(img_result)
+    
+    return img_result
+
+_skimage_frame = _array_frame(_skimage_transform)
+
+ENGINES.register('skimage', _animated(_tiled(process_skimage, _imageio_encode_array, full_decode=True),
+                                      _skimage_frame),
+                 _animated_bytes(_tiled_bytes(process_skimage_bytes, _imageio_encode_array, full_decode=True),
+                                 _skimage_frame),
+                 formats=ALLOWED_EXTENSIONS, resamplers=(*SPLINE_ORDERS, *NATIVE_KERNELS),
+                 modules=('skimage.io', 'scipy.ndimage', 'imageio.v3', 'resample', 'numpy'))
+
+def process_native(input_path, output_path, width, height, resize_mode='fit', keep_ratio=True, 
+                   resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Decoded by Pillow (JPEG at the smallest DCT scale covering the target), resampled by resample.py
+    with metrics.stage('decode'):
+        img = Image.open(input_path)
+        _pillow_draft(img, _decode_hint(img.size, width, height, resize_mode, keep_ratio))
+        img.load()
+    result = render_native(img, _output_format(output_path), width, height, resize_mode, keep_ratio,
+                           resampling, crop_position, bg_color, bg_alpha, encoder)
+    with open(output_path, 'wb') as f:
+        f.write(result)
+
+def process_native_bytes(data, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                         resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    # Decode straight from the uploaded bytes
+    with metrics.stage('decode'):
+        img = Image.open(io.BytesIO(data))
+        _pillow_draft(img, _decode_hint(img.size, width, height, resize_mode, keep_ratio))
+        img.load()
+    return render_native(img, output_format, width, height, resize_mode, keep_ratio,
+                         resampling, crop_position, bg_color, bg_alpha, encoder)
+
+def render_native(img, output_format, width, height, resize_mode='fit', keep_ratio=True, 
+                  resampling='hanning', crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    pixels = _native_transform(img, output_format, width, height, resize_mode, keep_ratio,
+                               resampling, crop_position, bg_color, bg_alpha)
+    return _pillow_encode_array(pixels, output_format, encoder)
+
+def _native_transform(img, output_format, width, height, resize_mode, keep_ratio, 
+                      resampling, crop_position, bg_color, bg_alpha):
+    # Separable filter with cached weight tables, from the planned source box to the planned region
+    pixels = _pillow_pixels(img)
+    plan = layout.plan(pixels.shape[1], pixels.shape[0], width, height, resize_mode, keep_ratio, crop_position)
+    with metrics.stage('resize'):
+        pixels = resample.resize(pixels, plan.region, plan.src_box, _native_kernel(resampling),
+                                 max_value=_sample_ceiling(pixels))
+    return _numpy_compose(pixels, plan, output_format, bg_color, bg_alpha)
+
+def _native_frame(frame, output_format, **params):
+    return Image.fromarray(_native_transform(frame, output_format, **params))
+
+ENGINES.register('native', _animated(_tiled(process_native, _pillow_encode_array, full_decode=True), _native_frame),
+                 _animated_bytes(_tiled_bytes(process_native_bytes, _pillow_encode_array, full_decode=True),
+                                 _native_frame),
+                 formats=ALLOWED_EXTENSIONS, resamplers=(*SPLINE_ORDERS, *NATIVE_KERNELS),
+                 modules=('PIL.Image', 'resample', 'numpy'), optional_formats=PILLOW_OPTIONAL_FORMATS)
+
+# Engines able to render an already decoded source: tool -> (decoder, render function)
+SOURCE_RENDERERS = {
+    'pillow': ('pillow', render_pillow),
+    'opencv': ('opencv', render_opencv),
+    'imageio': ('imageio', render_imageio),
+    'skimage': ('imageio', render_skimage),
+    'native': ('pillow', render_native),
+}
+SOURCE_DECODERS = {
+    'pillow': decode_pillow,
+    'opencv': decode_opencv,
+    'imageio': decode_imageio,
+}
+
+def _source_entry_size(value):
+    # Memory used by a source cache entry: raw bytes, numpy array or Pillow image
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return value.width * value.height * len(value.getbands()) * (4 if value.mode in ('I', 'F') else 1)
+
+source_cache = LRUCache(app.config['SOURCE_CACHE_BYTES'], sizeof=_source_entry_size)
+job_queue = jobs.JobQueue(app.config['JOBS_DIR'], app.config['JOBS_MAX_QUEUED'])
+
+def _decoded_source(source_id, decoder, data):
+    decoded = source_cache.get((source_id, decoder))
+    if decoded is None:
+        decoded = SOURCE_DECODERS[decoder](data)
+        source_cache.put((source_id, decoder), decoded)
+    return decoded
+
+@app.route('/sources', methods=['POST'])
+def upload_source():
+    # Upload once, then render many times with /process/<tool>?source=<id>
+    if 'image' not in request.files:
+        return jsonify({"error": "No image file provided"}), 400
+    
+    file = request.files['image']
+    if file.filename == '' or not allowed_file(file.filename):
+        return jsonify({"error": f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
+    
+    data = _upload_bytes(file)
+    _guard_image(data)
+    source_id = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if not source_cache.put((source_id, 'raw'), data):
+        return jsonify({"error": "Source larger than the source cache budget"}), 413
+    
+    # Decode eagerly with the requested decoder so the first render is already warm
+    decoder = request.form.get('decoder', 'pillow')
+    if decoder in SOURCE_DECODERS:
+        try:
+            _decoded_source(source_id, decoder, data)
+        except Exception as e:
+            source_cache.pop((source_id, 'raw'))
+            return jsonify({"error": f"Decoding error: {str(e)}"}), 422
+    
+    return jsonify({"id": source_id, "bytes": len(data)}), 201
+
+@app.route('/sources/<source_id>', methods=['DELETE'])
+def delete_source(source_id):
+    found = False
+    for key in ('raw', *SOURCE_DECODERS):
+        found = source_cache.pop((source_id, key)) is not None or found
+    if not found:
+        return jsonify({"error": f"Unknown or expired source: {source_id}"}), 404
+    return jsonify({"status": "deleted"})
+
+@app.route('/sources/stats', methods=['GET'])
+def source_stats():
+    return jsonify(source_cache.stats())
+
+def _pillow_downscale(img, scale, resampling):
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, _pillow_resample(resampling))
+
+def _opencv_downscale(img, scale, resampling):
+    h, w = img.shape[:2]
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(img, size, interpolation=_opencv_interpolation(resampling))
+
+# Engines rendering renditions as a pyramid: (decoder, size, downscale, transform, encode)
+PYRAMID_ENGINES = {
+    'pillow': ('pillow', lambda img: img.size, _pillow_downscale, _pillow_transform, _pillow_encode),
+    'opencv': ('opencv', lambda img: img.shape[1::-1], _opencv_downscale, _opencv_transform, _opencv_encode),
+}
+
+_encode_pool = None
+
+def _get_encode_pool():
+    # Encoders release the GIL, a thread pool is enough to use every core
+    global _encode_pool
+    if _encode_pool is None:
+        _encode_pool = ThreadPoolExecutor(max_workers=app.config['ENCODE_THREADS'], thread_name_prefix='encode')
+    return _encode_pool
+
+_trial_pool = None
+
+def _get_trial_pool():
+    # Separate from the encode pool: the encodes running there search their own max_bytes
+    global _trial_pool
+    if _trial_pool is None:
+        _trial_pool = ThreadPoolExecutor(max_workers=app.config['ENCODE_THREADS'], thread_name_prefix='encode-trial')
+    return _trial_pool
+
+def _fit_size(encode, encoder, output_format, stage='encode'):
+    # max_bytes tries ENCODE_THREADS qualities at once, each round narrows the range that much more
+    pool = _get_trial_pool()
+    
+    def trials(function, qualities):
+        # The stage timer is per thread, the trial threads do not see it: each round is timed here
+        with metrics.stage(stage):
+            return list(pool.map(function, qualities))
+    
+    return encoding.fit_size(encode, encoder, output_format, trials, app.config['ENCODE_THREADS'])
+
+def _rendition_scale(src_size, params):
+    # Uniform scale the source needs to cover the rendition, used to pick the pyramid level
+    return layout.plan(*src_size, params['width'], params['height'], params['resize_mode'],
+                       params['keep_ratio'], params['crop_position']).scale
+
+def _render_pyramid(tool, decoded, renditions):
+    """
+    Rend toutes les déclinaisons à partir d'une seule image décodée.
+    
+    Les déclinaisons sont traitées de la plus grande à la plus petite : après chacune, l'image de
+    travail est réduite à l'échelle de cette déclinaison, avec le filtre demandé (`resampling`),
+    et sert de source à la suivante qui demande le même filtre. Les encodages sont lancés en
+    parallèle pendant que la pyramide continue.
+    """
+    _, size, downscale, transform, encode = PYRAMID_ENGINES[tool]
+    src_size = size(decoded)
+    order = sorted(range(len(renditions)), key=lambda i: _rendition_scale(src_size, renditions[i][1]), reverse=True)
+    
+    futures = [None] * len(renditions)
+    # One pyramid per filter, a nearest level never feeds a lanczos rendition
+    levels = {}
+    for index in order:
+        output_format, params = renditions[index]
+        params = dict(params)
+        encoder = params.pop('encoder')
+        resampling = params['resampling']
+        current = levels.get(resampling, decoded)
+        img = transform(current, output_format, **params)
+        futures[index] = _get_encode_pool().submit(encode, img, output_format, encoder)
         
-        # Calculate crop coordinates
-        if crop_position == 'center':
-            start_x = (new_w - width) // 2
-            start_y = (new_h - height) // 2
-        elif crop_position == 'top':
-            start_x = (new_w - width) // 2
-            start_y = 0
-        elif crop_position == 'bottom':
-            start_x = (new_w - width) // 2
-            start_y = new_h - height
-        elif crop_position == 'left':
-            start_x = 0
-            start_y = (new_h - height) // 2
-        elif crop_position == 'right':
-            start_x = new_w - width
-            start_y = (new_h - height) // 2
+        # The next (smaller) renditions start from this level instead of the full-size source
+        scale = _rendition_scale(size(current), params)
+        levels[resampling] = downscale(current, scale, resampling) if scale < 1 else current
+    
+    return [future.result() for future in futures]
+
+def _render_each(tool, data, renditions):
+    # Engines without a pyramid render every rendition independently, in parallel
+    futures = [
+        _get_encode_pool().submit(ENGINES[tool].process_bytes, data, output_format, **params)
+        for output_format, params in renditions
+    ]
+    return [future.result() for future in futures]
+
+@app.route('/renditions/<tool>', methods=['POST'])
+def create_renditions(tool):
+    if tool not in ENGINES:
+        return _unknown_tool(tool)
+    
+    data, filename, source_id = _read_source()
+    if data is None:
+        return filename
+    
+    # renditions: JSON list of {width, height, resize_mode, format, quality, ...}, other parameters
+    # of /process/<tool> (encoder options included) given in the form apply to every rendition
+    try:
+        specs = json.loads(request.form.get('renditions', '[]'))
+        if not isinstance(specs, list) or not specs:
+            raise ValueError("renditions must be a non-empty list")
+        if len(specs) > app.config['MAX_RENDITIONS']:
+            raise ValueError(f"at most {app.config['MAX_RENDITIONS']} renditions per request")
+        shared = _processing_params(request.form)
+        default_format = _output_format_param(tool, request.form.get('format', 'jpg'))
+        renditions = []
+        for spec in specs:
+            renditions.append((
+                _output_format_param(tool, spec.get('format', default_format)),
+                _processing_params(spec, shared),
+            ))
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"error": f"Invalid renditions: {str(e)}"}), 400
+    
+    logger.info(f"Rendering {len(renditions)} renditions with {tool}")
+    
+    try:
+        if tool in PYRAMID_ENGINES:
+            decoder = PYRAMID_ENGINES[tool][0]
+            if source_id:
+                decoded = _decoded_source(source_id, decoder, data)
+            else:
+                # Shrink-on-load to the smallest size covering every rendition
+                info = _probe_image(data)
+                hint = None
+                if info is not None:
+                    hints = [_decode_hint(info.size, params['width'], params['height'], params['resize_mode'],
+                                          params['keep_ratio']) for _, params in renditions]
+                    hint = (max(h[0] for h in hints), max(h[1] for h in hints))
+                decoded = SOURCE_DECODERS[decoder](data, hint)
+            results = _render_pyramid(tool, decoded, renditions)
         else:
-            start_x = (new_w - width) // 2
-            start_y = (new_h - height) // 2
+            results = _render_each(tool, data, renditions)
+    except Exception as e:
+        logger.error(f"Error rendering with {tool}: {str(e)}")
+        return jsonify({"error": f"Processing error: {str(e)}"}), 500
+    
+    names = [
+        f"{index}_{params['width']}x{params['height']}.{output_format}"
+        for index, (output_format, params) in enumerate(renditions)
+    ]
+    
+    if request.form.get('output', 'zip') == 'multipart':
+        boundary = uuid.uuid4().hex
+        body = io.BytesIO()
+        for name, result in zip(names, results):
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            body.write(f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                       f"Content-Disposition: attachment; filename=\"{name}\"\r\n\r\n".encode())
+            body.write(result)
+            body.write(b"\r\n")
+        body.write(f"--{boundary}--\r\n".encode())
+        return app.response_class(body.getvalue(), mimetype=f'multipart/mixed; boundary={boundary}')
+    
+    # Images are already compressed, store them as is
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+        for name, result in zip(names, results):
+            zf.writestr(name, result)
+    archive.seek(0)
+    return send_file(archive, mimetype='application/zip', as_attachment=True,
+                     download_name=f"{os.path.splitext(filename)[0]}_renditions.zip")
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def _get_batch_pool():
+    # spawn rather than fork: the parent runs threads (janitor, encoders) whose locks must not be inherited
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ProcessPoolExecutor(max_workers=app.config['BATCH_WORKERS'],
+                                              mp_context=multiprocessing.get_context('spawn'))
+        return _batch_pool
+
+def _reset_batch_pool():
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is not None:
+            _batch_pool.shutdown(wait=False, cancel_futures=True)
+            _batch_pool = None
+
+def _batch_worker(tool, data, output_format, params):
+    return ENGINES[tool].process_bytes(data, output_format, **params)
+
+def _archive_entry_bytes(archive, info, limit):
+    # A few KB of zeros inflate to any size: the header is checked first, then the read is capped
+    # in case the header lies
+    if info.file_size > limit:
+        raise RequestEntityTooLarge(f"Archive entry too large: {info.file_size} bytes, at most {limit}")
+    with archive.open(info) as entry:
+        data = entry.read(limit + 1)
+    if len(data) > limit:
+        raise RequestEntityTooLarge(f"Archive entry too large: more than {limit} bytes")
+    return data
+
+def _batch_items(limit):
+    # (name, read) pairs from the multipart files or a zip archive, read lazily as slots free up.
+    # Archive entries are held to `limit` bytes once inflated, like a single upload
+    for file in request.files.getlist('images'):
+        if file.filename and allowed_file(file.filename):
+            yield file.filename, functools.partial(_upload_bytes, file)
+        elif file.filename:
+            yield file.filename, None
+    
+    if 'archive' in request.files:
+        archive = zipfile.ZipFile(request.files['archive'])
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            if allowed_file(info.filename):
+                yield info.filename, functools.partial(_archive_entry_bytes, archive, info, limit)
+            else:
+                yield info.filename, None
+
+def _iter_batch(tool, items, output_format, params):
+    """
+    Répartit les images sur le pool de processus et produit (index, nom, résultat, erreur) au fur
+    et à mesure que chaque image est terminée. Au plus BATCH_MAX_IN_FLIGHT images sont en mémoire.
+    """
+    pending = {}
+    items = enumerate(items)
+    
+    def fill():
+        # Submit until BATCH_MAX_IN_FLIGHT images are in flight, rejected files are reported right away
+        rejected = []
+        while len(pending) < app.config['BATCH_MAX_IN_FLIGHT']:
+            index, (name, read) = next(items, (None, (None, None)))
+            if index is None:
+                break
+            if read is None:
+                rejected.append((index, name, None, "File type not allowed"))
+                continue
+            try:
+                # Files rejected from their header while received raise here, like unreadable ones
+                data = read()
+                _guard_image(data)
+            except HTTPException as e:
+                rejected.append((index, name, None, e.description))
+                continue
+            except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, EOFError) as e:
+                # Corrupt (bad CRC, truncated), encrypted or unsupported archive entry
+                rejected.append((index, name, None, f"Unreadable archive entry: {str(e)}"))
+                continue
+            pending[_get_batch_pool().submit(_batch_worker, tool, data, output_format, params)] = (index, name)
+        return rejected
+    
+    yield from fill()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, name = pending.pop(future)
+            try:
+                yield index, name, future.result(), None
+            except BrokenProcessPool as e:
+                # A worker died (e.g. killed by the OOM killer): later images go to a fresh pool
+                _reset_batch_pool()
+                yield index, name, None, f"Worker crashed: {str(e)}"
+            except Exception as e:
+                yield index, name, None, str(e)
+        yield from fill()
+
+class _ZipStream(io.RawIOBase):
+    # Write-only sink for zipfile, drained after each entry so the archive is streamed
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+@app.route('/batch/<tool>', methods=['POST'])
+def process_batch(tool):
+    if tool not in ENGINES:
+        return _unknown_tool(tool)
+    
+    if 'images' not in request.files and 'archive' not in request.files:
+        return jsonify({"error": "No images provided (use 'images' files or an 'archive' zip)"}), 400
+    
+    try:
+        output_format = _output_format_param(tool, request.form.get('format', 'jpg'))
+        params = _processing_params(request.form)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    
+    try:
+        limit = app.config['TOOL_MAX_CONTENT_LENGTH'].get(tool, app.config['MAX_CONTENT_LENGTH'])
+        items = list(itertools.islice(_batch_items(limit), app.config['BATCH_MAX_ITEMS'] + 1))
+    except zipfile.BadZipFile as e:
+        return jsonify({"error": f"Invalid archive: {str(e)}"}), 400
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({"error": f"Too many images, at most {app.config['BATCH_MAX_ITEMS']} per batch"}), 400
+    
+    logger.info(f"Batch of {len(items)} images with {tool}")
+    
+    def generate():
+        stream = _ZipStream()
+        manifest = []
+        with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as zf:
+            for index, name, result, error in _iter_batch(tool, items, output_format, params):
+                entry = {"index": index, "source": name}
+                if error is None:
+                    entry["file"] = f"{index:04d}_{os.path.splitext(os.path.basename(name))[0]}.{output_format}"
+                    zf.writestr(entry["file"], result)
+                else:
+                    entry["error"] = error
+                manifest.append(entry)
+                yield stream.drain()
+            
+            # Per-image errors are reported here instead of failing the whole batch
+            manifest.sort(key=lambda entry: entry["index"])
+            zf.writestr('manifest.json', json.dumps(manifest, indent=2))
+        yield stream.drain()
+    
+    response = app.response_class(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="batch_{tool}.zip"'
+    return response
+
+_job_lock_file = None
+_job_lock_checked_at = 0
+
+def _run_job(job, data, report_progress):
+    # Runs in a job worker process
+    report_progress(0.1)
+    return ENGINES[job['tool']].process_bytes(data, job['output_format'], **job['params'])
+
+def _supervise_job_workers():
+    # Keep JOB_WORKERS worker processes alive, a cancelled running job kills its worker
+    context = multiprocessing.get_context('spawn')
+    workers = []
+    while True:
+        workers = [worker for worker in workers if worker.is_alive()]
+        if len(workers) < app.config['JOB_WORKERS']:
+            job_queue.requeue_orphans()
+            while len(workers) < app.config['JOB_WORKERS']:
+                worker = context.Process(
+                    target=jobs.run_worker,
+                    args=(app.config['JOBS_DIR'], app.config['JOBS_MAX_QUEUED'], _run_job),
+                    kwargs={'result_ttl': app.config['JOBS_RESULT_TTL']},
+                    name='job-worker', daemon=True)
+                worker.start()
+                workers.append(worker)
+        time.sleep(1)
+
+@app.before_request
+def start_job_workers():
+    # Only one process (the one holding the lock) supervises the workers, the others retry every
+    # 10 seconds in case it goes away
+    global _job_lock_file, _job_lock_checked_at
+    if app.config['JOB_WORKERS'] <= 0 or _job_lock_file is not None or time.time() - _job_lock_checked_at < 10:
+        return
+    _job_lock_checked_at = time.time()
+    
+    lock_file = open(os.path.join(app.config['JOBS_DIR'], 'workers.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return
+    _job_lock_file = lock_file
+    threading.Thread(target=_supervise_job_workers, name='job-supervisor', daemon=True).start()
+
+def _job_status(job):
+    return {
+        "id": job['id'],
+        "tool": job['tool'],
+        "status": job['status'],
+        "progress": job['progress'],
+        "priority": job['priority'],
+        "error": job['error'],
+        "created": job['created'],
+        "started": job['started'],
+        "finished": job['finished'],
+        "result_url": f"/jobs/{job['id']}/result" if job['status'] == jobs.DONE else None,
+    }
+
+@app.route('/jobs/<tool>', methods=['POST'])
+def submit_job(tool):
+    if tool not in ENGINES:
+        return _unknown_tool(tool)
+    
+    data, filename, _ = _read_source()
+    if data is None:
+        return filename
+    
+    try:
+        output_format = _output_format_param(tool, request.form.get('format', 'jpg'))
+        params = _processing_params(request.form)
+        priority = request.form.get('priority', 0, type=int)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    
+    try:
+        job_id = job_queue.submit(tool, data, output_format, params, priority)
+    except jobs.QueueFull as e:
+        response = jsonify({"error": f"Job queue is full: {str(e)}"})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+    
+    logger.info(f"Queued job {job_id} with {tool} (priority {priority})")
+    response = jsonify(_job_status(job_queue.get(job_id)))
+    response.headers['Location'] = f"/jobs/{job_id}"
+    return response, 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(_job_status(job))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    if job['status'] != jobs.DONE:
+        return jsonify({"error": f"Job is {job['status']}", **_job_status(job)}), 409
+    return send_file(job_queue.result_path(job_id), as_attachment=True,
+                     download_name=f"{job_id}_output.{job['output_format']}")
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(_job_status(job))
+
+@app.route('/benchmark', methods=['POST'])
+def run_benchmark():
+    """
+    Mesure les outils sur un corpus d'images synthétiques (`sizes`, `formats`, `alpha`) et/ou
+    envoyées (`images`), avec les paramètres de /process/<tool>. Réponse JSON, ou CSV avec
+    `output=csv`.
+    """
+    try:
+        tools = [tool for tool in request.form.get('tools', '').split(',') if tool] or ENGINES.names()
+        unknown = [tool for tool in tools if tool not in ENGINES]
+        if unknown:
+            return _unknown_tool(unknown[0])
+        output_format = _output_format_param('auto', request.form.get('format', 'jpg'))
+        params = _processing_params(request.form)
+        repeat = max(1, request.form.get('repeat', 3, type=int))
+        warmup = max(0, request.form.get('warmup', 1, type=int))
+        isolate = request.form.get('isolate', 'true').lower() == 'true'
+        quality = request.form.get('quality', 'false').lower() == 'true'
         
-        # Crop the image
-        end_x = start_x + width
-        end_y = start_y + height
-        img_result = img_resized[start_y:end_y, start_x:end_x]
+        corpus = [benchmark.corpus_entry(secure_filename(file.filename) or 'image', _upload_bytes(file))
+                  for file in request.files.getlist('images') if file.filename]
+        sizes = benchmark.parse_sizes(request.form.get('sizes', '640x480,1920x1080' if not corpus else ''))
+        sizes = list(dict.fromkeys(sizes))
+        if len(sizes) > app.config['BENCHMARK_MAX_SIZES']:
+            raise ValueError(f"too many sizes, at most {app.config['BENCHMARK_MAX_SIZES']}")
+        formats = list(dict.fromkeys(f.lower() for f in request.form.get('formats', 'jpg,png').split(',') if f))
+        unsupported = [f for f in formats if f not in ALLOWED_EXTENSIONS]
+        if unsupported:
+            raise ValueError(f"cannot generate {unsupported[0]} images (supported: {', '.join(sorted(ALLOWED_EXTENSIONS))})")
+        alpha = (False, True) if request.form.get('alpha', 'true').lower() == 'true' else (False,)
+    except HTTPException:
+        # Uploads rejected from their header keep their 422/413
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
     
-    # Save the result (convert to uint8 if necessary)
-    if img_result.dtype != np.uint8:
-        img_result = np.clip(img_result, 0, 255).astype(np.uint8)
+    runs = (len(corpus) + len(sizes) * len(formats) * len(alpha)) * len(tools) * (repeat + warmup)
+    if runs > app.config['BENCHMARK_MAX_RUNS']:
+        return jsonify({"error": f"Too many runs ({runs}), at most {app.config['BENCHMARK_MAX_RUNS']} per request"}), 400
     
-    # Convertir RGBA en RGB pour les fichiers JPEG
-    if output_path.lower().endswith(('.jpg', '.jpeg')) and len(img_result.shape) == 3 and img_result.shape[2] == 4:
-        img_result = img_result[:, :, :3]
+    for image in corpus:
+        _guard_image(image['data'])
+    # Synthetic images are generated in memory: same budget as uploads, checked before allocating them
+    mode = 'RGBA' if True in alpha else 'RGB'
+    for size in sizes:
+        _check_pixel_budget(ImageInfo('synthetic', size, mode, 8, 1))
     
-    io.imsave(output_path, img_result)
+    try:
+        corpus += benchmark.synthetic_corpus(sizes, formats, alpha)
+    except Exception as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    if not corpus:
+        return jsonify({"error": "Empty corpus: send images or sizes"}), 400
+    
+    logger.info(f"Benchmarking {', '.join(tools)} on {len(corpus)} images")
+    results = benchmark.run_benchmark(corpus, ENGINES, tools, output_format, params, repeat, warmup,
+                                      isolate, app.config['IN_MEMORY_PROCESSING'], quality)
+    
+    if request.form.get('output', 'json').lower() == 'csv':
+        return benchmark.to_csv(results), 200, {'Content-Type': 'text/csv; charset=utf-8'}
+    settings = {'repeat': repeat, 'warmup': warmup, 'isolate': isolate, 'quality': quality, **params}
+    return app.response_class(benchmark.to_json(results, settings), mimetype='application/json')
+
+@app.route('/compare', methods=['POST'])
+def compare_engines():
+    """
+    Rend l'image (`image` ou `source`) avec chaque outil de `tools` (tous les outils disponibles
+    par défaut) et retourne la matrice outil / latence / taille / SSIM / PSNR. Les métriques sont
+    calculées sur la luma réduite, par rapport à un redimensionnement Lanczos en flottants.
+    """
+    data, filename, source_id = _read_source()
+    if data is None:
+        return filename
+    
+    try:
+        tools = [tool for tool in request.form.get('tools', '').split(',') if tool] or None
+        unknown = [tool for tool in tools or () if tool not in ENGINES]
+        if unknown:
+            return _unknown_tool(unknown[0])
+        output_format = _output_format_param('auto', request.form.get('format', 'jpg'))
+        params = _processing_params(request.form)
+        repeat = max(1, request.form.get('repeat', 1, type=int))
+        warmup = max(0, request.form.get('warmup', 1, type=int))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    
+    runs = len(tools or ENGINES.names()) * (repeat + warmup)
+    if runs > app.config['BENCHMARK_MAX_RUNS']:
+        return jsonify({"error": f"Too many runs ({runs}), at most {app.config['BENCHMARK_MAX_RUNS']} per request"}), 400
+    
+    try:
+        comparison = benchmark.compare_engines(data, ENGINES, tools, output_format, params, repeat, warmup)
+    except Exception as e:
+        logger.error(f"Error comparing engines: {str(e)}")
+        return jsonify({"error": "Unsupported or unreadable image"}), 422
+    return jsonify({'reference': 'lanczos (float)', 'output_format': output_format, **params, **comparison})
 
 @app.route('/cleanup', methods=['POST'])
 def cleanup():
+    # Files still used by in-flight requests are skipped, younger files may belong to another process
+    max_age = max(request.form.get('max_age', app.config['TEMP_FILE_MAX_AGE'], type=int),
+                  app.config['TEMP_FILE_MIN_AGE'])
     try:
-        for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-        return jsonify({"status": "cleanup successful"})
+        removed = sweep_temp_files(max_age)
+        return jsonify({"status": "cleanup successful", "removed": removed, "max_age": max_age})
     except Exception as e:
         return jsonify({"error": f"Cleanup error: {str(e)}"}), 500
 
 # Add some error handlers
 @app.errorhandler(413)
 def request_entity_too_large(error):
-    return jsonify({"error": "File too large"}), 413
+    # Uploads rejected from their header say why
+    return jsonify({"error": error.description if isinstance(error, ImageTooLarge) else "File too large"}), 413
+
+@app.errorhandler(422)
+def unprocessable_entity(error):
+    return jsonify({"error": error.description}), 422
 
 @app.errorhandler(500)
 def internal_server_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
+# Spawned batch and job workers import what they use on demand
+if multiprocessing.parent_process() is None:
+    ENGINES.preload(app.config['PRELOAD_ENGINES'])
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
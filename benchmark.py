@@ -0,0 +1,379 @@
+import argparse
+import csv
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+# Synthetic corpus used when no image is given
+DEFAULT_SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+DEFAULT_FORMATS = ['jpg', 'png']
+
+CSV_FIELDS = [
+    'tool', 'image', 'input_format', 'width', 'height', 'megapixels', 'alpha', 'output_format', 'runs',
+    'p50_ms', 'p95_ms', 'mean_ms', 'throughput_ips', 'megapixels_per_s', 'peak_rss_kb', 'output_bytes',
+    'ssim', 'psnr', 'error',
+]
+
+
+def synthetic_image(width, height, image_format, alpha=False):
+    """
+    Image de test reproductible : dégradés, damier et bruit, pour que les encodeurs et les
+    filtres travaillent sur autre chose qu'un aplat.
+
+    Args:
+        width (int): Largeur
+        height (int): Hauteur
+        image_format (str): Format d'encodage (jpg, png, webp...)
+        alpha (bool): Ajouter un canal alpha (ignoré pour les formats qui n'en ont pas)
+    """
+    import numpy as np
+    from PIL import Image
+
+    # Broadcast row and column indices: the noise is the only full int64 plane
+    y, x = np.ogrid[0:height, 0:width]
+    pixels = np.empty((height, width, 4 if alpha else 3), dtype=np.uint8)
+    pixels[:, :, 0] = x * 255 // max(width - 1, 1)
+    pixels[:, :, 1] = y * 255 // max(height - 1, 1)
+    noise = np.random.default_rng(width * height).integers(0, 32, (height, width), dtype=np.int64)
+    noise += ((x // 32 + y // 32) % 2) * 64
+    pixels[:, :, 2] = noise % 256
+    del noise
+    if alpha:
+        pixels[:, :, 3] = (x + y) * 255 // max(width + height - 2, 1)
+    img = Image.fromarray(pixels, 'RGBA' if alpha else 'RGB')
+
+    pil_format = Image.registered_extensions().get(f'.{image_format}', image_format.upper())
+    if pil_format == 'JPEG' and alpha:
+        img = img.convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format=pil_format)
+    return buffer.getvalue()
+
+
+def synthetic_corpus(sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, alpha=(False, True)):
+    # Every size x format x alpha combination, JPEG only without alpha
+    corpus = []
+    for width, height in sizes:
+        for image_format in formats:
+            for with_alpha in alpha:
+                if with_alpha and image_format in ('jpg', 'jpeg', 'bmp'):
+                    continue
+                name = f"synthetic_{width}x{height}{'_alpha' if with_alpha else ''}.{image_format}"
+                corpus.append(corpus_entry(name, synthetic_image(width, height, image_format, with_alpha)))
+    return corpus
+
+
+def corpus_entry(name, data):
+    # Describe an image of the corpus from its header
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        return {
+            'name': name,
+            'data': data,
+            'format': img.format,
+            'width': width,
+            'height': height,
+            'alpha': img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info,
+        }
+
+
+def load_corpus(paths):
+    # Files, or every file of the given directories
+    corpus = []
+    for path in paths:
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        for file_path in files:
+            with open(file_path, 'rb') as f:
+                corpus.append(corpus_entry(os.path.basename(file_path), f.read()))
+    return corpus
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _measure(engine, data, output_format, params, repeat, warmup, in_memory):
+    # Warmup runs (lazy imports, caches) are not timed
+    timings = []
+    output = b''
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as directory:
+        input_path = os.path.join(directory, 'input')
+        output_path = os.path.join(directory, f'output.{output_format}')
+        if not in_memory:
+            with open(input_path, 'wb') as f:
+                f.write(data)
+
+        for index in range(warmup + repeat):
+            start = time.perf_counter()
+            if in_memory:
+                output = engine.process_bytes(data, output_format, **params)
+            else:
+                engine.process(input_path, output_path, **params)
+            elapsed = time.perf_counter() - start
+            if index >= warmup:
+                timings.append(elapsed)
+
+        if not in_memory:
+            with open(output_path, 'rb') as f:
+                output = f.read()
+    return timings, output
+
+
+def _peak_rss_kb():
+    # VmHWM is the peak of this process only: on Linux ru_maxrss also counts the parent memory
+    # inherited between fork and exec. CLI engines run in (finished) child processes
+    own = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    own = int(line.split()[1])
+    except OSError:
+        pass
+    if own is None:
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children)
+
+
+def _isolated_case(tool, data, output_format, params, repeat, warmup, in_memory):
+    # Runs in a fresh process: its peak RSS belongs to this engine and this image only
+    import app
+
+    try:
+        timings, output = _measure(app.ENGINES[tool], data, output_format, params, repeat, warmup, in_memory)
+    except Exception as e:
+        return {'error': str(e)}
+    finally:
+        # Reap the gm batch workers so that their memory shows up in RUSAGE_CHILDREN
+        if app._gm_pool is not None:
+            app._gm_pool.close()
+    return {'timings': timings, 'output': output, 'peak_rss_kb': _peak_rss_kb()}
+
+
+def run_benchmark(corpus, engines, tools=None, output_format='jpg', params=None, repeat=5, warmup=1,
+                  isolate=True, in_memory=True, quality=False):
+    """
+    Passe chaque image du corpus dans chaque outil et retourne une ligne de résultats par couple.
+
+    Args:
+        corpus (list): Images (voir corpus_entry)
+        engines (EngineRegistry): Outils enregistrés
+        tools (list): Noms des outils à mesurer (tous par défaut)
+        output_format (str): Format de sortie
+        params (dict): Paramètres de redimensionnement (voir _processing_params)
+        repeat (int): Nombre d'exécutions mesurées
+        warmup (int): Nombre d'exécutions de chauffe, non mesurées
+        isolate (bool): Exécuter chaque couple dans un nouveau processus (nécessaire pour le pic de RSS)
+        in_memory (bool): Utiliser le traitement en mémoire plutôt que les fichiers
+        quality (bool): Ajouter le SSIM et le PSNR de la sortie par rapport à la référence (voir quality.py)
+    """
+    tools = tools or engines.names()
+    params = params or {}
+    context = multiprocessing.get_context('spawn')
+    references = {}
+    results = []
+    for tool in tools:
+        engine = engines[tool]
+        for index, image in enumerate(corpus):
+            row = {
+                'tool': tool,
+                'image': image['name'],
+                'input_format': image['format'],
+                'width': image['width'],
+                'height': image['height'],
+                'megapixels': round(image['width'] * image['height'] / 1e6, 3),
+                'alpha': image['alpha'],
+                'output_format': output_format,
+                'runs': 0,
+                'error': None,
+            }
+            results.append(row)
+
+            if not engine.available():
+                row['error'] = f"{engine.executable} is not installed"
+                continue
+            if not engine.writes(output_format):
+                row['error'] = f"{tool} cannot write {output_format}"
+                continue
+
+            args = (image['data'], output_format, params, repeat, warmup, in_memory)
+            if isolate:
+                with context.Pool(processes=1, maxtasksperchild=1) as pool:
+                    measured = pool.apply(_isolated_case, (tool, *args))
+            else:
+                try:
+                    timings, output = _measure(engine, *args)
+                    measured = {'timings': timings, 'output': output, 'peak_rss_kb': None}
+                except Exception as e:
+                    measured = {'error': str(e)}
+
+            if 'error' in measured:
+                row['error'] = measured['error']
+                continue
+
+            timings = measured['timings']
+            total = sum(timings)
+            row.update({
+                'runs': len(timings),
+                'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+                'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+                'mean_ms': round(total / len(timings) * 1000, 3),
+                'throughput_ips': round(len(timings) / total, 3) if total else None,
+                'megapixels_per_s': round(row['megapixels'] * len(timings) / total, 3) if total else None,
+                'peak_rss_kb': measured['peak_rss_kb'],
+                'output_bytes': len(measured['output']),
+            })
+            if quality:
+                _add_quality(row, references, index, image['data'], measured['output'], params)
+    return results
+
+
+def _add_quality(row, references, index, data, output, params):
+    # The reference of an image is shared by every tool
+    import quality
+
+    try:
+        if index not in references:
+            references[index] = quality.reference_luma(data, **params)
+        row.update(quality.compare(references[index], output))
+    except Exception as e:
+        row['error'] = f"quality: {str(e)}"
+
+
+def compare_engines(data, engines, tools=None, output_format='jpg', params=None, repeat=1, warmup=1):
+    """
+    Rend la même image avec plusieurs outils et retourne une ligne par outil : latence, taille
+    de la sortie, SSIM et PSNR par rapport à une référence Lanczos en flottants.
+
+    Args:
+        data (bytes): Image source
+        engines (EngineRegistry): Outils enregistrés
+        tools (list): Noms des outils à comparer (tous les outils disponibles par défaut)
+        output_format (str): Format de sortie
+        params (dict): Paramètres de redimensionnement (voir _processing_params)
+        repeat (int): Nombre d'exécutions mesurées, la latence est la médiane
+        warmup (int): Nombre d'exécutions de chauffe, non mesurées
+    """
+    import quality
+
+    params = params or {}
+    reference = quality.reference_luma(data, **params)
+    tools = tools or [engine.name for engine in engines if engine.available()]
+    rows = []
+    for tool in tools:
+        engine = engines[tool]
+        row = {'tool': tool, 'latency_ms': None, 'bytes': None, 'ssim': None, 'psnr': None, 'error': None}
+        rows.append(row)
+        if not engine.available():
+            row['error'] = f"{engine.executable} is not installed"
+            continue
+        if not engine.writes(output_format):
+            row['error'] = f"{tool} cannot write {output_format}"
+            continue
+        try:
+            timings, output = _measure(engine, data, output_format, params, repeat, warmup,
+                                       engine.process_bytes is not None)
+            row['latency_ms'] = round(percentile(timings, 0.5) * 1000, 3)
+            row['bytes'] = len(output)
+            row.update(quality.compare(reference, output))
+        except Exception as e:
+            row['error'] = str(e)
+    return {'metric_size': list(reference.shape[::-1]), 'results': rows}
+
+
+def environment():
+    # Context needed to compare results between releases and machines
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def to_json(results, settings=None):
+    return json.dumps({'environment': environment(), 'settings': settings or {}, 'results': results}, indent=2)
+
+
+def to_csv(results):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(results)
+    return buffer.getvalue()
+
+
+def parse_sizes(value):
+    # "640x480,1920x1080" -> [(640, 480), (1920, 1080)]
+    sizes = []
+    for size in value.split(','):
+        if not size:
+            continue
+        dimensions = tuple(int(n) for n in size.lower().split('x'))
+        if len(dimensions) != 2 or min(dimensions) <= 0:
+            raise ValueError(f"invalid size {size!r}, expected WIDTHxHEIGHT")
+        sizes.append(dimensions)
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare les outils de traitement d'image sur un corpus.")
+    parser.add_argument('images', nargs='*', help="Images ou dossiers à ajouter au corpus")
+    parser.add_argument('--tools', help="Outils à mesurer, séparés par des virgules (défaut : tous)")
+    parser.add_argument('--sizes', default=','.join(f'{w}x{h}' for w, h in DEFAULT_SIZES),
+                        help="Tailles des images synthétiques, vide pour n'utiliser que les images données")
+    parser.add_argument('--formats', default=','.join(DEFAULT_FORMATS), help="Formats des images synthétiques")
+    parser.add_argument('--no-alpha', action='store_true', help="Pas de variantes avec canal alpha")
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--height', type=int, default=1500)
+    parser.add_argument('--format', default='jpg', help="Format de sortie")
+    parser.add_argument('--resize-mode', default='fit')
+    parser.add_argument('--resampling', default='hanning')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--no-isolate', action='store_true', help="Tout exécuter dans ce processus (pas de pic de RSS)")
+    parser.add_argument('--disk', action='store_true', help="Passer par des fichiers plutôt que par la mémoire")
+    parser.add_argument('--quality', action='store_true', help="Ajouter le SSIM et le PSNR par rapport à la référence")
+    parser.add_argument('--json', help="Fichier de résultats JSON ('-' pour la sortie standard)")
+    parser.add_argument('--csv', help="Fichier de résultats CSV ('-' pour la sortie standard)")
+    args = parser.parse_args(argv)
+
+    import app
+
+    corpus = load_corpus(args.images)
+    if args.sizes:
+        corpus += synthetic_corpus(parse_sizes(args.sizes), args.formats.split(','),
+                                   (False,) if args.no_alpha else (False, True))
+    params = app._processing_params({'width': args.width, 'height': args.height,
+                                     'resize_mode': args.resize_mode, 'resampling': args.resampling})
+    settings = {'repeat': args.repeat, 'warmup': args.warmup, 'in_memory': not args.disk, 'quality': args.quality,
+                **params}
+
+    results = run_benchmark(corpus, app.ENGINES, args.tools.split(',') if args.tools else None, args.format,
+                            params, args.repeat, args.warmup, not args.no_isolate, not args.disk, args.quality)
+
+    outputs = [(args.json, to_json(results, settings)), (args.csv, to_csv(results))]
+    if not args.json and not args.csv:
+        outputs = [('-', to_csv(results))]
+    for path, content in outputs:
+        if path == '-':
+            sys.stdout.write(content)
+        elif path:
+            with open(path, 'w', newline='') as f:
+                f.write(content)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import math
+import threading
+import time
+
+
+def megapixel_bucket(width, height):
+    # Power-of-two buckets: 0 below 0.5 MP, 1 for 0.5-1 MP, 2 for 1-2 MP, 3 for 2-4 MP...
+    megapixels = width * height / 1e6
+    if megapixels <= 0:
+        return 0
+    return max(0, math.floor(math.log2(megapixels * 2)) + 1)
+
+
+class CostModel:
+    """
+    Temps de traitement mesurés par forme d'entrée, pour choisir l'outil le plus rapide.
+
+    Chaque clé (format d'entrée, tranche de mégapixels, alpha, mode, rééchantillonnage, format de
+    sortie) garde, par outil, une moyenne mobile exponentielle des durées. Un outil jamais mesuré
+    pour une clé est essayé avant de comparer, et toutes les explore_every requêtes la mesure la
+    plus ancienne est rafraîchie pour suivre l'évolution de la charge.
+
+    Args:
+        smoothing (float): Poids d'une nouvelle mesure dans la moyenne (entre 0 et 1)
+        explore_every (int): Fréquence de rafraîchissement des mesures (0 pour ne jamais explorer)
+    """
+
+    def __init__(self, smoothing=0.3, explore_every=50):
+        self.smoothing = smoothing
+        self.explore_every = explore_every
+        self._timings = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, engine, seconds):
+        with self._lock:
+            timings = self._timings.setdefault(key, {})
+            entry = timings.get(engine)
+            if entry is None:
+                timings[engine] = [seconds, 1, time.monotonic()]
+            else:
+                entry[0] += self.smoothing * (seconds - entry[0])
+                entry[1] += 1
+                entry[2] = time.monotonic()
+
+    def choose(self, key, candidates):
+        """
+        Retourne (outil, raison) parmi `candidates` pour la clé donnée.
+        """
+        with self._lock:
+            timings = self._timings.get(key, {})
+            count = self._requests[key] = self._requests.get(key, 0) + 1
+
+            for engine in candidates:
+                if engine not in timings:
+                    return engine, "exploring: no timing yet for this input shape"
+
+            if len(candidates) > 1 and self.explore_every and count % self.explore_every == 0:
+                engine = min(candidates, key=lambda name: timings[name][2])
+                return engine, "exploring: refreshing the oldest timing"
+
+            engine = min(candidates, key=lambda name: timings[name][0])
+            average, samples, _ = timings[engine]
+            return engine, f"fastest: {average * 1000:.1f} ms average over {samples} samples"
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {
+                    "key": list(key),
+                    "engines": {
+                        engine: {"average_ms": round(average * 1000, 3), "samples": samples}
+                        for engine, (average, samples, _) in timings.items()
+                    },
+                }
+                for key, timings in self._timings.items()
+            ]
@@ -0,0 +1,131 @@
+# Encoder options shared by every engine, each engine maps them to the flags of its own library
+QUALITY_FORMATS = {'jpg', 'jpeg', 'webp', 'avif', 'jxl'}
+SUBSAMPLINGS = ('4:4:4', '4:2:2', '4:2:0')
+# Quality range explored by max_bytes, below MIN_QUALITY artifacts are not worth the bytes saved
+MIN_QUALITY = 10
+MAX_QUALITY = 95
+
+# Options that can change the output of each format, the others are dropped
+FORMAT_OPTIONS = {
+    'jpg': ('quality', 'progressive', 'subsampling', 'strip_metadata', 'max_bytes'),
+    'jpeg': ('quality', 'progressive', 'subsampling', 'strip_metadata', 'max_bytes'),
+    'webp': ('quality', 'webp_method', 'strip_metadata', 'max_bytes'),
+    'png': ('compress_level', 'strip_metadata'),
+    'avif': ('quality', 'subsampling', 'avif_speed', 'strip_metadata', 'max_bytes'),
+    'jxl': ('quality', 'jxl_effort', 'strip_metadata', 'max_bytes'),
+}
+OTHER_FORMAT_OPTIONS = ('strip_metadata',)
+
+
+def _bool(value):
+    return str(value).lower() == 'true'
+
+
+def _bounded(name, low, high):
+    def parse(value):
+        value = int(value)
+        if not low <= value <= high:
+            raise ValueError(f"{name} must be between {low} and {high}")
+        return value
+    return parse
+
+
+def _subsampling(value):
+    if value not in SUBSAMPLINGS:
+        raise ValueError(f"subsampling must be one of {', '.join(SUBSAMPLINGS)}")
+    return value
+
+
+def _positive(name):
+    def parse(value):
+        value = int(value)
+        if value <= 0:
+            raise ValueError(f"{name} must be positive")
+        return value
+    return parse
+
+
+PARSERS = {
+    'quality': _bounded('quality', 1, 100),
+    'progressive': _bool,
+    'subsampling': _subsampling,
+    'compress_level': _bounded('compress_level', 0, 9),
+    'webp_method': _bounded('webp_method', 0, 6),
+    # libavif speed: 0 (slowest, smallest) to 10; libjxl effort: 1 (fastest) to 9
+    'avif_speed': _bounded('avif_speed', 0, 10),
+    'jxl_effort': _bounded('jxl_effort', 1, 9),
+    'strip_metadata': _bool,
+    'max_bytes': _positive('max_bytes'),
+}
+
+
+def parse(values, defaults=None):
+    """
+    Options d'encodage d'une requête : celles de `values` (formulaire ou déclinaison), complétées
+    par `defaults`. Seules les options données figurent dans le résultat, les autres restent aux
+    valeurs par défaut de chaque bibliothèque. Lève ValueError pour une valeur invalide.
+
+    Args:
+        values (dict): Paramètres de la requête
+        defaults (dict): Options déjà choisies (valeurs par défaut du serveur, options communes)
+    """
+    options = dict(defaults or {})
+    for name, parser in PARSERS.items():
+        value = values.get(name)
+        if value is not None and value != '':
+            options[name] = parser(value)
+    return options
+
+
+def for_format(options, output_format):
+    # Only the options that apply to the output format, for the engine mappings and the cache keys
+    names = FORMAT_OPTIONS.get(output_format, OTHER_FORMAT_OPTIONS)
+    return {name: value for name, value in (options or {}).items() if name in names}
+
+
+def target_size(options, output_format):
+    # max_bytes when it applies to the output format (lossy formats only), None otherwise
+    if output_format not in QUALITY_FORMATS:
+        return None
+    return for_format(options, output_format).get('max_bytes')
+
+
+def fit_size(encode, options, output_format, map=map, parallelism=1):
+    """
+    Encode avec `encode(options)`. Avec max_bytes (formats avec perte), cherche par dichotomie la
+    plus haute qualité (au plus celle demandée, MAX_QUALITY sinon) dont le résultat tient dans
+    max_bytes octets ; si même MIN_QUALITY ne suffit pas, c'est ce résultat, le plus petit, qui
+    est retourné.
+
+    Chaque essai est un encodage complet en mémoire : l'image n'est redimensionnée qu'une fois.
+    Avec `parallelism` > 1, chaque tour essaie autant de qualités à la fois (réparties sur
+    l'intervalle restant) avec `map`, par exemple celui d'un pool de threads.
+    """
+    max_bytes = target_size(options, output_format)
+    options = for_format(options, output_format)
+    if max_bytes is None:
+        return encode(options)
+
+    high = options.get('quality', MAX_QUALITY)
+    result = encode(dict(options, quality=high))
+    if len(result) <= max_bytes:
+        return result
+
+    low, high = max(1, min(MIN_QUALITY, high - 1)), high - 1
+    best, smallest = None, result
+    while low <= high:
+        # Qualities splitting [low, high] in equal parts, the middle one for a plain dichotomy
+        count = min(parallelism, high - low + 1)
+        qualities = sorted({low + (high - low + 1) * (i + 1) // (count + 1) for i in range(count)})
+        candidates = list(map(lambda quality: encode(dict(options, quality=quality)), qualities))
+        # Sizes grow with the quality: keep the highest one that fits, search above it and below
+        # the lowest one that does not
+        fitting = [i for i, candidate in enumerate(candidates) if len(candidate) <= max_bytes]
+        last = fitting[-1] if fitting else -1
+        if last >= 0:
+            best = candidates[last]
+            low = qualities[last] + 1
+        if last + 1 < len(qualities):
+            smallest = candidates[last + 1]
+            high = qualities[last + 1] - 1
+    return best if best is not None else smallest
@@ -0,0 +1,138 @@
+import functools
+import importlib
+import logging
+import shutil
+import sys
+import time
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """
+    Module importé au premier accès à l'un de ses attributs. L'import n'a lieu qu'une fois par
+    processus, les accès suivants passent par le module mis en cache.
+
+    Args:
+        name (str): Nom complet du module ('cv2', 'skimage.transform'...)
+        on_load (callable): Appelé avec le module à son premier accès (configuration)
+    """
+
+    def __init__(self, name, on_load=None):
+        self.__dict__['_name'] = name
+        self.__dict__['_on_load'] = on_load
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self._name)
+            if self._on_load is not None:
+                self._on_load(module)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name, on_load=None):
+    return LazyModule(name, on_load)
+
+
+class Engine(namedtuple('Engine', ['name', 'process', 'process_bytes', 'formats', 'alpha', 'resamplers',
+                                   'modules', 'executable', 'optional_formats'])):
+    __slots__ = ()
+
+    def available(self):
+        # CLI engines need their binary on the PATH
+        return self.executable is None or _which(self.executable) is not None
+
+    def writes(self, output_format):
+        # Formats of an optional encoder (plugin, delegate library) are only written when it is installed
+        check = self.optional_formats.get(output_format)
+        if check is not None:
+            return self.available() and check()
+        return output_format in self.formats
+
+    def writable_formats(self):
+        return self.formats | {output_format for output_format in self.optional_formats if self.writes(output_format)}
+
+
+@functools.lru_cache(maxsize=None)
+def _which(executable):
+    return shutil.which(executable)
+
+
+class EngineRegistry:
+    """
+    Registre des outils de traitement et de leurs capacités.
+
+    Chaque outil s'enregistre avec ses fonctions de traitement (fichiers et, s'il en a une, en
+    mémoire), les formats qu'il sait écrire, s'il conserve la transparence, les méthodes de
+    rééchantillonnage qu'il applique sans approximation, les modules Python lourds qu'il utilise
+    et, pour les outils en ligne de commande, le binaire à trouver dans le PATH. Les formats dont
+    l'encodeur est optionnel (AVIF, JPEG XL) sont donnés avec la fonction qui vérifie sa présence.
+    """
+
+    def __init__(self):
+        self._engines = OrderedDict()
+
+    def register(self, name, process, process_bytes=None, formats=(), alpha=True, resamplers=(), modules=(),
+                 executable=None, optional_formats=None):
+        self._engines[name] = Engine(name, process, process_bytes, frozenset(formats), alpha,
+                                     tuple(resamplers), tuple(modules), executable, dict(optional_formats or {}))
+        return self._engines[name]
+
+    def __getitem__(self, name):
+        return self._engines[name]
+
+    def __contains__(self, name):
+        return name in self._engines
+
+    def __iter__(self):
+        return iter(self._engines.values())
+
+    def names(self):
+        return list(self._engines)
+
+    def preload(self, names):
+        """
+        Importe les modules des outils donnés (tous avec 'all'). Appelé au chargement de
+        l'application, les workers gunicorn lancés avec --preload partagent ces modules.
+        Retourne le temps d'import en secondes par module.
+        """
+        if names == ['all']:
+            names = self.names()
+        timings = {}
+        for name in names:
+            if name not in self._engines:
+                logger.warning(f"Cannot preload unknown engine: {name}")
+                continue
+            for module in self._engines[name].modules:
+                if module in timings:
+                    continue
+                start = time.perf_counter()
+                importlib.import_module(module)
+                timings[module] = time.perf_counter() - start
+        if timings:
+            logger.info("Preloaded " + ", ".join(f"{m} ({t:.2f}s)" for m, t in timings.items()))
+        return timings
+
+    def capabilities(self):
+        return {
+            engine.name: {
+                "formats": sorted(engine.writable_formats()),
+                "alpha": engine.alpha,
+                "resamplers": list(engine.resamplers),
+                "in_memory": engine.process_bytes is not None,
+                "available": engine.available(),
+                "loaded": all(module in sys.modules for module in engine.modules),
+            }
+            for engine in self
+        }
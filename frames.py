@@ -0,0 +1,74 @@
+import itertools
+from collections import deque
+
+from PIL import ImageSequence, TiffImagePlugin
+
+
+def windowed_map(function, items, pool, window):
+    """
+    Résultats de function(item) dans l'ordre des éléments, calculés par `pool`.
+
+    Au plus `window` éléments sont soumis sans que leur résultat ait été consommé : les éléments
+    sont lus au fur et à mesure, la mémoire ne dépend pas de la longueur de la séquence.
+    """
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(function, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Consumer gone (encoder error): the frames still queued are not rendered
+        for future in pending:
+            future.cancel()
+
+
+def decoded_frames(img, durations, disposals):
+    """
+    Images successives d'une animation ou pages d'un TIFF, chacune copiée dans un mode que tous
+    les outils traitent (gris, RGB ou RGBA).
+
+    Les durées (ms) et modes de disposition sont ajoutés à `durations` et `disposals` à mesure
+    que les images sont lues : les writers de Pillow les lisent par indice au moment d'écrire
+    chaque image, qui a forcément déjà été lue.
+    """
+    for frame in ImageSequence.Iterator(img):
+        # The WebP reader sets the duration of a frame when it is decoded
+        frame.load()
+        durations.append(frame.info.get('duration', 0))
+        disposals.append(getattr(frame, 'disposal_method', 0))
+        if frame.mode in ('L', 'RGB', 'RGBA'):
+            yield frame.copy()
+        else:
+            yield frame.convert('RGBA' if frame.mode in ('LA', 'PA') or 'transparency' in frame.info else 'RGB')
+
+
+def save_frames(frames, fp, format, **options):
+    """
+    Écrit les images `frames` (itérateur d'images Pillow, dans l'ordre) dans une seule sortie
+    animée ou à plusieurs pages.
+
+    Un TIFF est écrit page par page. Les images suivantes de GIF et WebP passent par
+    append_images : le writer GIF de Pillow les lit au fur et à mesure mais garde chacune en
+    palette jusqu'à la dernière, celui de WebP en fait une liste avant d'encoder.
+
+    Args:
+        frames (iterator): Images (Pillow) dans l'ordre
+        fp (file): Fichier de sortie
+        format (str): Format Pillow (GIF, WEBP, TIFF)
+        **options: Options du writer (durées, boucle, disposition, qualité...)
+    """
+    frames = iter(frames)
+    try:
+        first = next(frames)
+    except StopIteration:
+        raise EOFError("no frames to save")
+    if format == 'TIFF':
+        with TiffImagePlugin.AppendingTiffWriter(fp) as tiff:
+            for frame in itertools.chain([first], frames):
+                frame.save(tiff, format, **options)
+                tiff.newFrame()
+    else:
+        first.save(fp, format, save_all=True, append_images=frames, **options)
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import signal
+import sqlite3
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    File d'attente de traitements persistante, stockée dans une base SQLite.
+
+    Les images envoyées et les résultats sont des fichiers du même dossier, la base ne contient
+    que l'état des jobs. Plusieurs processus (workers gunicorn et workers de jobs) peuvent
+    l'utiliser en même temps.
+
+    Args:
+        directory (str): Dossier de la base, des entrées et des résultats
+        max_queued (int): Nombre maximal de jobs en attente
+    """
+
+    def __init__(self, directory, max_queued):
+        self.directory = directory
+        self.max_queued = max_queued
+        self.db_path = os.path.join(directory, 'jobs.sqlite3')
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    output_format TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    error TEXT,
+                    worker_pid INTEGER,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created)')
+
+    def _connect(self):
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def input_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.input')
+
+    def result_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.result')
+
+    def submit(self, tool, data, output_format, params, priority=0):
+        job_id = uuid.uuid4().hex
+        with open(self.input_path(job_id), 'wb') as f:
+            f.write(data)
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            queued = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()[0]
+            if queued >= self.max_queued:
+                conn.execute('ROLLBACK')
+                os.remove(self.input_path(job_id))
+                raise QueueFull(f"{queued} jobs already queued")
+            conn.execute(
+                'INSERT INTO jobs (id, tool, output_format, params, priority, status, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, tool, output_format, json.dumps(params), priority, QUEUED, time.time()))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return job_id
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def claim(self, worker_pid):
+        # Highest priority first, then oldest; the transaction makes the claim atomic across workers
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, created LIMIT 1',
+                (QUEUED,)).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, worker_pid = ?, started = ?, progress = 0 WHERE id = ?',
+                (RUNNING, worker_pid, time.time(), row['id']))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return self.get(row['id'])
+
+    def set_progress(self, job_id, progress):
+        self._update(job_id, 'UPDATE jobs SET progress = ? WHERE id = ? AND status = ?',
+                     (progress, job_id, RUNNING))
+
+    def complete(self, job_id, result):
+        # Write then rename, the result only becomes visible once complete
+        tmp_path = f'{self.result_path(job_id)}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(result)
+        os.replace(tmp_path, self.result_path(job_id))
+
+        if not self._update(job_id, 'UPDATE jobs SET status = ?, progress = 1, finished = ? WHERE id = ? AND status = ?',
+                            (DONE, time.time(), job_id, RUNNING)):
+            # Cancelled while running
+            self._remove_files(job_id)
+            return
+        self._remove_input(job_id)
+
+    def fail(self, job_id, error):
+        self._update(job_id, 'UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ? AND status = ?',
+                     (FAILED, error, time.time(), job_id, RUNNING))
+        self._remove_input(job_id)
+
+    def cancel(self, job_id):
+        """
+        Annule un job en attente ou en cours. Un job en cours est interrompu en arrêtant son
+        worker, qui est relancé par le superviseur. Retourne le job après annulation.
+        """
+        job = self.get(job_id)
+        if job is None or job['status'] in FINISHED_STATUSES:
+            return job
+
+        if self._update(job_id, 'UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ?',
+                        (CANCELLED, time.time(), job_id, job['status'])):
+            if job['status'] == RUNNING and job['worker_pid']:
+                try:
+                    os.kill(job['worker_pid'], signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            self._remove_files(job_id)
+        return self.get(job_id)
+
+    def requeue_orphans(self):
+        # Jobs left running by a worker that no longer exists go back to the queue
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT id, worker_pid FROM jobs WHERE status = ?', (RUNNING,)).fetchall()
+        finally:
+            conn.close()
+        for row in rows:
+            if not _pid_alive(row['worker_pid']):
+                self._update(row['id'], 'UPDATE jobs SET status = ?, worker_pid = NULL, progress = 0 '
+                                        'WHERE id = ? AND status = ?', (QUEUED, row['id'], RUNNING))
+
+    def purge(self, max_age):
+        # Forget finished jobs (and their results) older than max_age seconds
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT id FROM jobs WHERE status IN (?, ?, ?) AND finished < ?',
+                                (*FINISHED_STATUSES, time.time() - max_age)).fetchall()
+            for row in rows:
+                conn.execute('DELETE FROM jobs WHERE id = ?', (row['id'],))
+                self._remove_files(row['id'])
+        finally:
+            conn.close()
+        return len(rows)
+
+    def counts(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        return {row['status']: row['n'] for row in rows}
+
+    def _update(self, job_id, query, args):
+        conn = self._connect()
+        try:
+            return conn.execute(query, args).rowcount > 0
+        finally:
+            conn.close()
+
+    def _remove_input(self, job_id):
+        try:
+            os.remove(self.input_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _remove_files(self, job_id):
+        self._remove_input(job_id)
+        try:
+            os.remove(self.result_path(job_id))
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def run_worker(directory, max_queued, handler, poll_interval=0.5, result_ttl=3600):
+    """
+    Boucle d'un worker de jobs : prend le job le plus prioritaire, l'exécute avec
+    handler(job, data, report_progress) et enregistre le résultat ou l'erreur.
+    Le worker s'arrête quand son processus parent disparaît.
+    """
+    queue = JobQueue(directory, max_queued)
+    parent_pid = os.getppid()
+    pid = os.getpid()
+    last_purge = 0
+
+    while os.getppid() == parent_pid:
+        if time.time() - last_purge > 60:
+            queue.purge(result_ttl)
+            last_purge = time.time()
+
+        job = queue.claim(pid)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        try:
+            with open(queue.input_path(job['id']), 'rb') as f:
+                data = f.read()
+            result = handler(job, data, lambda progress: queue.set_progress(job['id'], progress))
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            queue.fail(job['id'], str(e))
+        else:
+            queue.complete(job['id'], result)
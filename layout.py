@@ -0,0 +1,128 @@
+import functools
+from collections import namedtuple
+
+# Anchor of each gravity on both axes, in halves of the free space (0: start, 1: middle, 2: end)
+GRAVITIES = {
+    'center': (1, 1),
+    'top': (1, 0),
+    'bottom': (1, 2),
+    'left': (0, 1),
+    'right': (2, 1),
+    'top-left': (0, 0),
+    'top-right': (2, 0),
+    'bottom-left': (0, 2),
+    'bottom-right': (2, 2),
+}
+
+
+def normalize_gravity(crop_position):
+    """
+    Nom canonique d'une position de recadrage : 'left-top', 'top_left' ou 'topleft' deviennent
+    'top-left'. Une position inconnue retombe sur 'center'.
+    """
+    name = str(crop_position).lower().replace('_', '-').replace(' ', '-')
+    if name in GRAVITIES:
+        return name
+    for vertical in ('top', 'bottom'):
+        for horizontal in ('left', 'right'):
+            if name in (f'{horizontal}-{vertical}', f'{vertical}{horizontal}', f'{horizontal}{vertical}'):
+                return f'{vertical}-{horizontal}'
+    return 'center'
+
+
+def normalize_mode(resize_mode, keep_ratio=True):
+    # 'fit' without keeping the ratio has always been handled as 'fill' (cover then crop)
+    if resize_mode == 'stretch':
+        return 'stretch'
+    if resize_mode == 'fit' and keep_ratio:
+        return 'fit'
+    return 'fill'
+
+
+class Layout(namedtuple('Layout', ['mode', 'size', 'scale', 'resize', 'crop', 'offset', 'src_box', 'pads'])):
+    """
+    Plan de redimensionnement, identique pour tous les moteurs.
+
+    Attributes:
+        mode (str): 'fit', 'fill' ou 'stretch'
+        size (tuple): Dimensions (largeur, hauteur) de l'image finale
+        scale (float): Facteur d'échelle uniforme appliqué à la source
+        resize (tuple): Dimensions de la source entière une fois redimensionnée
+        crop (tuple): Zone (gauche, haut, droite, bas) de l'image redimensionnée à garder
+        offset (tuple): Position (x, y) de cette zone dans l'image finale
+        src_box (tuple): La même zone en coordonnées de la source (flottants)
+        pads (tuple): Rectangles (x0, y0, x1, y1) de l'image finale à remplir avec le fond
+    """
+
+    __slots__ = ()
+
+    @property
+    def region(self):
+        # Size of the kept part of the resized image
+        left, top, right, bottom = self.crop
+        return right - left, bottom - top
+
+    @property
+    def cropped(self):
+        return self.region != self.resize
+
+    @property
+    def padded(self):
+        return bool(self.pads)
+
+
+@functools.lru_cache(maxsize=4096)
+def plan(src_width, src_height, width, height, resize_mode='fit', keep_ratio=True, crop_position='center'):
+    """
+    Calcule le plan de redimensionnement d'une source src_width x src_height vers width x height.
+
+    Les dimensions sont arrondies au plus proche (et non tronquées) et les décalages sont des
+    entiers, si bien que tous les moteurs placent les pixels au même endroit. Le résultat est
+    mémoïsé : les paramètres d'une même requête donnent toujours le même plan.
+
+    Args:
+        src_width (int): Largeur de la source
+        src_height (int): Hauteur de la source
+        width (int): Largeur finale
+        height (int): Hauteur finale
+        resize_mode (str): 'fit', 'fill' ou 'stretch'
+        keep_ratio (bool): Conserver le ratio en mode 'fit'
+        crop_position (str): Gravité du recadrage ou du placement ('center', 'top-left'...)
+    """
+    mode = normalize_mode(resize_mode, keep_ratio)
+    ratios = (width / src_width, height / src_height)
+
+    if mode == 'stretch':
+        scale = max(ratios)
+        resized = (width, height)
+    elif mode == 'fit':
+        scale = min(ratios)
+        resized = (min(width, max(1, round(src_width * scale))), min(height, max(1, round(src_height * scale))))
+    else:
+        scale = max(ratios)
+        resized = (max(width, round(src_width * scale)), max(height, round(src_height * scale)))
+
+    # The kept region is cropped out of the resized image (fill) or placed on the canvas (fit)
+    anchor_x, anchor_y = GRAVITIES[normalize_gravity(crop_position)]
+    region_w, region_h = min(resized[0], width), min(resized[1], height)
+    left = (resized[0] - region_w) * anchor_x // 2
+    top = (resized[1] - region_h) * anchor_y // 2
+    x = (width - region_w) * anchor_x // 2
+    y = (height - region_h) * anchor_y // 2
+
+    src_box = (
+        left * src_width / resized[0],
+        top * src_height / resized[1],
+        (left + region_w) * src_width / resized[0],
+        (top + region_h) * src_height / resized[1],
+    )
+
+    pads = tuple(box for box in (
+        (0, 0, width, y),
+        (0, y + region_h, width, height),
+        (0, y, x, y + region_h),
+        (x + region_w, y, width, y + region_h),
+    ) if box[0] < box[2] and box[1] < box[3])
+
+    return Layout(mode, (width, height), scale, resized, (left, top, left + region_w, top + region_h),
+                  (x, y), src_box, pads)
@@ -0,0 +1,176 @@
+import collections
+import queue
+import subprocess
+import threading
+import time
+import uuid
+
+
+class _BatchWorker:
+    # One long-lived `gm batch` process reading one command per line on stdin
+
+    def __init__(self, argv, pass_token, fail_token):
+        self.pass_token = pass_token
+        self.fail_token = fail_token
+        self.jobs = 0
+        self.last_used = time.monotonic()
+        self.process = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, bufsize=0)
+        self._lines = queue.Queue()
+        self._stderr = collections.deque(maxlen=20)
+        threading.Thread(target=self._read, args=(self.process.stdout, self._lines.put),
+                         name='gm-batch-stdout', daemon=True).start()
+        threading.Thread(target=self._read, args=(self.process.stderr, self._stderr.append),
+                         name='gm-batch-stderr', daemon=True).start()
+
+    @staticmethod
+    def _read(stream, sink):
+        for line in iter(stream.readline, b''):
+            sink(line.decode('utf-8', errors='replace').rstrip('\n'))
+        sink(None)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, line, timeout):
+        # Send a command and wait for its feedback line; returns the error output on failure
+        self._stderr.clear()
+        self.process.stdin.write(line.encode() + b'\n')
+        self.jobs += 1
+        self.last_used = time.monotonic()
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            try:
+                output = self._lines.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError
+            if output is None:
+                raise BrokenPipeError("gm batch exited")
+            if output == self.pass_token:
+                return None
+            if output == self.fail_token:
+                # stderr is read by another thread, give it a moment to catch up
+                time.sleep(0.01)
+                return '\n'.join(line for line in self._stderr if line) or 'command failed'
+
+    def close(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class MagickBatchPool:
+    """
+    Pool de processus `gm batch` persistants : chaque commande GraphicsMagick est envoyée à un
+    processus déjà lancé au lieu de payer un fork/exec et le chargement de la configuration.
+
+    Un worker mort ou inactif depuis plus de health_check_interval secondes est vérifié avant
+    d'être utilisé, il est relancé après max_jobs commandes ou en cas d'erreur de protocole
+    (délai dépassé, pipe fermé).
+
+    Args:
+        size (int): Nombre maximal de processus, et donc de commandes simultanées
+        max_jobs (int): Nombre de commandes avant de relancer un processus
+        timeout (float): Délai maximal d'une commande en secondes
+        health_check_interval (float): Inactivité après laquelle un worker est vérifié
+        executable (str): Binaire GraphicsMagick
+    """
+
+    def __init__(self, size, max_jobs=500, timeout=60, health_check_interval=30, executable='gm'):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pass_token = f'PASS-{uuid.uuid4().hex}'
+        self.fail_token = f'FAIL-{uuid.uuid4().hex}'
+        self.argv = [executable, 'batch', '-echo', 'off', '-feedback', 'on', '-stop-on-error', 'off',
+                     '-pass', self.pass_token, '-fail', self.fail_token, '-']
+        self.started = 0
+        self.restarts = 0
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def run(self, args):
+        """
+        Exécute une commande (arguments de `gm`, sans le `gm` initial) et lève RuntimeError si
+        elle échoue ou dépasse le délai.
+        """
+        line = _batch_line(args)
+        with self._slots:
+            worker = self._checkout()
+            try:
+                error = worker.run(line, self.timeout)
+            except TimeoutError:
+                self._discard(worker)
+                raise RuntimeError(f"graphicsmagick timed out after {self.timeout}s")
+            except (BrokenPipeError, OSError) as e:
+                self._discard(worker)
+                raise RuntimeError(f"graphicsmagick batch worker failed: {str(e)}")
+            self._checkin(worker)
+        if error is not None:
+            raise RuntimeError(f"graphicsmagick failed: {error}")
+
+    def _checkout(self):
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+        if worker is not None and time.monotonic() - worker.last_used > self.health_check_interval:
+            # Health check: the worker must still answer a no-op command
+            try:
+                healthy = worker.run('version', self.timeout) is None
+            except (TimeoutError, BrokenPipeError, OSError):
+                healthy = False
+            if not healthy:
+                self._discard(worker)
+                worker = None
+        if worker is None or not worker.alive():
+            if worker is not None:
+                self._discard(worker)
+            worker = _BatchWorker(self.argv, self.pass_token, self.fail_token)
+            with self._lock:
+                self.started += 1
+        return worker
+
+    def _checkin(self, worker):
+        if worker.jobs >= self.max_jobs or not worker.alive():
+            # Recycle long-running workers, GraphicsMagick caches grow with use
+            self._discard(worker)
+            return
+        with self._lock:
+            if not self._closed:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def _discard(self, worker):
+        with self._lock:
+            self.restarts += 1
+        worker.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "started": self.started,
+            "restarts": self.restarts,
+        }
+
+
+def _batch_line(args):
+    # gm batch splits lines like a shell, every argument is double quoted
+    for arg in args:
+        if any(c in arg for c in '"\\\n\r'):
+            raise ValueError(f"Unsupported character in graphicsmagick argument: {arg!r}")
+    return ' '.join(f'"{arg}"' for arg in args)
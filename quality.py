@@ -0,0 +1,120 @@
+import io
+import math
+
+import numpy as np
+from PIL import Image, ImageColor
+
+import layout
+
+# Metrics are computed on luma box-downsampled so that its longest side is at most this size
+METRIC_MAX_SIDE = 512
+SSIM_WINDOW = 7
+# BT.601 luma weights
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _background(bg_color):
+    try:
+        return ImageColor.getrgb(bg_color)[:3]
+    except (ValueError, AttributeError):
+        return 255, 255, 255
+
+
+def _luma(img, background=None):
+    # Float luma of the color channels, with background: transparency composited over it first
+    if background is not None and (img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info):
+        rgba = np.asarray(img.convert('RGBA'), dtype=np.float32)
+        alpha = rgba[:, :, 3:4] / 255
+        rgb = rgba[:, :, :3] * alpha + np.asarray(background, dtype=np.float32) * (1 - alpha)
+    else:
+        rgb = np.asarray(img.convert('RGB'), dtype=np.float32)
+    return rgb @ LUMA_WEIGHTS
+
+
+def reference_luma(data, width, height, resize_mode='fit', keep_ratio=True, resampling='hanning',
+                   crop_position='center', bg_color='white', bg_alpha=255, encoder=None):
+    """
+    Luma de référence : la source décodée en entier (sans réduction DCT), redimensionnée en
+    flottants avec Lanczos selon le même plan que les outils.
+
+    Le redimensionnement étant linéaire, il est appliqué directement à la luma. Comme les outils,
+    la transparence est composée sur le fond en mode fit uniquement. La référence n'est pas
+    encodée, les options d'encodage (`encoder`) sont ignorées.
+    """
+    background = _background(bg_color)
+    fit = layout.normalize_mode(resize_mode, keep_ratio) == 'fit'
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        luma = _luma(img, background if fit else None)
+
+    src_h, src_w = luma.shape
+    plan = layout.plan(src_w, src_h, width, height, resize_mode, keep_ratio, crop_position)
+    resized = Image.fromarray(luma, 'F').resize(plan.region, Image.LANCZOS, box=plan.src_box)
+
+    canvas = np.full((height, width), float(np.dot(background, LUMA_WEIGHTS)), dtype=np.float32)
+    x, y = plan.offset
+    region_w, region_h = plan.region
+    canvas[y:y + region_h, x:x + region_w] = np.asarray(resized)
+    return _downsample(np.clip(canvas, 0, 255))
+
+
+def output_luma(data):
+    # Engines composite over the background themselves, the alpha channel of the output is ignored
+    with Image.open(io.BytesIO(data)) as img:
+        return _downsample(_luma(img))
+
+
+def _downsample(luma):
+    # Integer box downsampling: averages factor x factor blocks
+    factor = math.ceil(max(luma.shape) / METRIC_MAX_SIDE)
+    if factor <= 1:
+        return luma
+    h, w = luma.shape[0] // factor * factor, luma.shape[1] // factor * factor
+    return luma[:h, :w].reshape(h // factor, factor, w // factor, factor).mean(axis=(1, 3))
+
+
+def _box_mean(x, size):
+    # Mean over every size x size window ('valid' mode) from a summed-area table
+    table = np.zeros((x.shape[0] + 1, x.shape[1] + 1))
+    table[1:, 1:] = x.cumsum(axis=0).cumsum(axis=1)
+    sums = table[size:, size:] - table[:-size, size:] - table[size:, :-size] + table[:-size, :-size]
+    return sums / (size * size)
+
+
+def ssim(a, b):
+    # Mean SSIM with a uniform window, on 0-255 luma
+    size = min(SSIM_WINDOW, *a.shape)
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    mu_a = _box_mean(a, size)
+    mu_b = _box_mean(b, size)
+    var_a = _box_mean(a * a, size) - mu_a * mu_a
+    var_b = _box_mean(b * b, size) - mu_b * mu_b
+    covariance = _box_mean(a * b, size) - mu_a * mu_b
+
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / (
+        (mu_a * mu_a + mu_b * mu_b + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def psnr(a, b):
+    # Capped at 100 dB for identical images (JSON has no infinity)
+    mse = float(np.mean((a.astype(np.float64) - b) ** 2))
+    if mse == 0:
+        return 100.0
+    return min(100.0, 10 * math.log10(255 ** 2 / mse))
+
+
+def compare(reference, data):
+    """
+    Compare une sortie encodée à la luma de référence. Retourne {'ssim', 'psnr'}, lève
+    ValueError si la sortie n'a pas les dimensions attendues.
+    """
+    luma = output_luma(data)
+    if luma.shape != reference.shape:
+        raise ValueError(f"output luma is {luma.shape[1]}x{luma.shape[0]}, "
+                         f"expected {reference.shape[1]}x{reference.shape[0]}")
+    return {'ssim': round(ssim(reference, luma), 5), 'psnr': round(psnr(reference, luma), 3)}
@@ -0,0 +1,27 @@
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+# The modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def encode(img, fmt='PNG', **options):
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def png():
+    return encode(Image.effect_mandelbrot((320, 240), (-2, -1.5, 1, 1.5), 64).convert('RGB'))
@@ -0,0 +1,80 @@
+import io
+
+import pytest
+from PIL import Image, ImageSequence
+
+from conftest import encode
+
+ENGINES = ('pillow', 'opencv', 'imageio', 'skimage', 'native')
+DURATIONS = [40, 80, 120, 160]
+
+
+def _frames():
+    return [Image.new('RGB', (64, 48), color) for color in ('red', 'green', 'blue', 'white')]
+
+
+def _animation(fmt):
+    first, *rest = _frames()
+    return encode(first, fmt, save_all=True, append_images=rest, duration=DURATIONS, loop=0)
+
+
+def _process(client, tool, source, name, output_format, width=32, height=24):
+    return client.post(f'/process/{tool}', content_type='multipart/form-data', data={
+        'image': (io.BytesIO(source), name), 'width': str(width), 'height': str(height), 'format': output_format,
+    })
+
+
+@pytest.mark.parametrize('tool', ENGINES)
+@pytest.mark.parametrize('source_format, output_format', [('GIF', 'gif'), ('GIF', 'webp'), ('WEBP', 'gif'),
+                                                          ('WEBP', 'webp')])
+def test_animation_round_trip(client, tool, source_format, output_format):
+    if tool == 'opencv' and output_format == 'gif':
+        pytest.skip("OpenCV has no GIF encoder")
+    response = _process(client, tool, _animation(source_format), f'a.{source_format.lower()}', output_format)
+    assert response.status_code == 200, response.data
+    with Image.open(io.BytesIO(response.data)) as img:
+        assert img.n_frames == len(DURATIONS)
+        assert img.info.get('loop') == 0
+        durations = []
+        for frame in ImageSequence.Iterator(img):
+            frame.load()
+            assert frame.size == (32, 24)
+            durations.append(frame.info['duration'])
+        assert durations == DURATIONS
+
+
+@pytest.mark.parametrize('tool', ENGINES)
+def test_multipage_tiff(client, tool):
+    if tool in ('imageio', 'skimage'):
+        pytest.skip("imageio cannot read multipage TIFF from memory")
+    first, *rest = _frames()
+    response = _process(client, tool, encode(first, 'TIFF', save_all=True, append_images=rest), 'a.tiff', 'tiff')
+    assert response.status_code == 200, response.data
+    with Image.open(io.BytesIO(response.data)) as img:
+        assert img.n_frames == 4
+        assert img.size == (32, 24)
+
+
+def test_first_frame_only_for_single_image_formats(client):
+    response = _process(client, 'pillow', _animation('GIF'), 'a.gif', 'png')
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(response.data)) as img:
+        assert getattr(img, 'n_frames', 1) == 1
+
+
+@pytest.mark.parametrize('output_format', ['gif', 'webp'])
+def test_retained_frames_over_memory_budget(client, monkeypatch, output_format):
+    # Pillow's GIF and WebP writers keep every frame: 4 frames of 200x200 pixels, palette or RGBA
+    monkeypatch.setitem(client.application.config, 'MAX_IMAGE_MEMORY', 100_000)
+    source = _animation('GIF')
+    response = _process(client, 'pillow', source, 'a.gif', output_format, 200, 200)
+    assert response.status_code == 413
+    assert 'Animation too large' in response.get_json()['error']
+
+
+def test_tiff_pages_are_written_one_by_one(client, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'MAX_IMAGE_MEMORY', 100_000)
+    response = _process(client, 'pillow', _animation('GIF'), 'a.gif', 'tiff', 200, 200)
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(response.data)) as img:
+        assert img.n_frames == 4
@@ -0,0 +1,121 @@
+import io
+import json
+import zipfile
+
+
+def _manifest(response):
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    return archive, json.loads(archive.read('manifest.json'))
+
+
+def test_bad_part_is_reported_in_the_manifest(client, png):
+    response = client.post('/batch/pillow', content_type='multipart/form-data', data={
+        'images': [(io.BytesIO(png), 'a.png'), (io.BytesIO(b'garbage' * 100), 'b.png'), (io.BytesIO(png), 'c.png')],
+        'width': '64', 'height': '64',
+    })
+    assert response.status_code == 200
+    archive, manifest = _manifest(response)
+    assert [entry['source'] for entry in manifest] == ['a.png', 'b.png', 'c.png']
+    assert manifest[1] == {'index': 1, 'source': 'b.png', 'error': 'Unsupported image format'}
+    assert sorted(archive.namelist()) == ['0000_a.jpg', '0002_c.jpg', 'manifest.json']
+
+
+def test_bad_spooled_part_is_reported_in_the_manifest(client, png, monkeypatch):
+    # Parts over the spool size are written to disk as they arrive
+    monkeypatch.setitem(client.application.config, 'UPLOAD_SPOOL_SIZE', 16)
+    response = client.post('/batch/pillow', content_type='multipart/form-data', data={
+        'images': [(io.BytesIO(b'garbage' * 20000), 'b.png'), (io.BytesIO(png), 'a.png')],
+        'width': '64', 'height': '64',
+    })
+    assert response.status_code == 200
+    _, manifest = _manifest(response)
+    assert 'error' in manifest[0] and 'file' in manifest[1]
+
+
+def test_single_upload_is_still_rejected(client):
+    response = client.post('/process/pillow', content_type='multipart/form-data',
+                           data={'image': (io.BytesIO(b'garbage' * 100), 'b.png')})
+    assert response.status_code == 422
+    assert response.get_json() == {'error': 'Unsupported image format'}
+
+
+def test_archive_entries_are_reported_one_by_one(client, png):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('a.png', png)
+        zf.writestr('notes.txt', b'not an image')
+        zf.writestr('bad.png', b'\x89PNG\r\n\x1a\n' + b'truncated')
+    archive.seek(0)
+    response = client.post('/batch/pillow', content_type='multipart/form-data', data={
+        'archive': (archive, 'images.zip'), 'width': '64', 'height': '64', 'format': 'png',
+    })
+    assert response.status_code == 200
+    archive, manifest = _manifest(response)
+    assert manifest[0] == {'index': 0, 'source': 'a.png', 'file': '0000_a.png'}
+    assert manifest[1]['error'] == 'File type not allowed'
+    assert manifest[2]['error'] == 'Unsupported or unreadable image'
+    assert sorted(archive.namelist()) == ['0000_a.png', 'manifest.json']
+
+
+def test_too_many_images(client, png, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'BATCH_MAX_ITEMS', 2)
+    response = client.post('/batch/pillow', content_type='multipart/form-data', data={
+        'images': [(io.BytesIO(png), f'{name}.png') for name in 'abc'],
+    })
+    assert response.status_code == 400
+
+
+def test_invalid_archive(client):
+    response = client.post('/batch/pillow', content_type='multipart/form-data',
+                           data={'archive': (io.BytesIO(b'not a zip'), 'images.zip')})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Invalid archive')
+
+
+def _archive_upload(zf_bytes):
+    return {'archive': (io.BytesIO(zf_bytes), 'images.zip'), 'width': '64', 'height': '64', 'format': 'png'}
+
+
+def test_corrupt_archive_entry_is_reported_per_item(client, png):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('a.png', png)
+        zf.writestr('b.png', png)
+        offset = zf.getinfo('b.png').header_offset + 30 + len('b.png') + 100
+    data = bytearray(buffer.getvalue())
+    data[offset] ^= 0xFF
+    response = client.post('/batch/pillow', content_type='multipart/form-data', data=_archive_upload(bytes(data)))
+    assert response.status_code == 200
+    archive, manifest = _manifest(response)
+    assert manifest[0] == {'index': 0, 'source': 'a.png', 'file': '0000_a.png'}
+    assert manifest[1]['error'].startswith('Unreadable archive entry: Bad CRC-32')
+    assert sorted(archive.namelist()) == ['0000_a.png', 'manifest.json']
+
+
+def test_oversized_archive_entry_is_not_inflated(client, png, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'MAX_CONTENT_LENGTH', 1 << 20)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('bomb.png', b'\0' * (8 << 20))
+        zf.writestr('a.png', png)
+    response = client.post('/batch/pillow', content_type='multipart/form-data', data=_archive_upload(buffer.getvalue()))
+    assert response.status_code == 200
+    _, manifest = _manifest(response)
+    assert manifest[0]['error'] == f"Archive entry too large: {8 << 20} bytes, at most {1 << 20}"
+    assert manifest[1]['file'] == '0001_a.png'
+
+
+def test_archive_entry_with_a_lying_size_is_capped(client, png, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'MAX_CONTENT_LENGTH', 1 << 20)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('bomb.png', b'\0' * (8 << 20))
+    # Rewrite the uncompressed size in the central directory, which infolist() reads
+    data = buffer.getvalue()
+    central = data.rindex(b'PK\x01\x02')
+    data = data[:central + 24] + (1000).to_bytes(4, 'little') + data[central + 28:]
+    response = client.post('/batch/pillow', content_type='multipart/form-data', data=_archive_upload(data))
+    assert response.status_code == 200
+    _, manifest = _manifest(response)
+    # zipfile stops at the declared size, whose CRC does not match
+    assert manifest[0]['error'] == "Unreadable archive entry: Bad CRC-32 for file 'bomb.png'"
@@ -0,0 +1,32 @@
+import pytest
+
+import benchmark
+
+
+@pytest.mark.parametrize('form, status', [
+    ({'sizes': '50000x50000'}, 413),
+    ({'sizes': ','.join(f'{n}x{n}' for n in range(10, 30))}, 400),
+    ({'sizes': '0x10'}, 400),
+    ({'sizes': '64'}, 400),
+    ({'formats': 'exe'}, 400),
+    ({'format': 'exe'}, 400),
+])
+def test_rejected_before_generating_the_corpus(client, form, status):
+    response = client.post('/benchmark', data={'tools': 'pillow', 'repeat': '1', 'warmup': '0', **form})
+    assert response.status_code == status, response.data
+
+
+def test_small_synthetic_run(client):
+    response = client.post('/benchmark', data={
+        'tools': 'pillow', 'sizes': '64x48,64x48', 'formats': 'png', 'alpha': 'false', 'repeat': '1',
+        'warmup': '0', 'isolate': 'false', 'width': '32', 'height': '32',
+    })
+    assert response.status_code == 200, response.data
+    results = response.get_json()['results']
+    assert [(row['tool'], row['width'], row['height'], row['error']) for row in results] == [('pillow', 64, 48, None)]
+
+
+def test_parse_sizes():
+    assert benchmark.parse_sizes('640x480,,1920X1080') == [(640, 480), (1920, 1080)]
+    with pytest.raises(ValueError):
+        benchmark.parse_sizes('640x480x3')
@@ -0,0 +1,39 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import encode
+
+
+@pytest.fixture
+def gray16():
+    # Horizontal 16 bits ramp, 8 bits mean about 127
+    ramp = np.linspace(0, 65535, 256).astype(np.uint16)
+    return encode(Image.fromarray(np.tile(ramp, (128, 1))))
+
+
+@pytest.mark.parametrize('tool', ['native', 'imageio', 'skimage'])
+@pytest.mark.parametrize('resampling', ['lanczos', 'hanning', 'bilinear', 'bicubic'])
+def test_16_bit_gray_keeps_its_levels(client, gray16, tool, resampling):
+    response = client.post(f'/process/{tool}', content_type='multipart/form-data', data={
+        'image': (io.BytesIO(gray16), 'ramp.png'), 'width': '64', 'height': '32',
+        'format': 'png', 'resampling': resampling,
+    })
+    assert response.status_code == 200
+    pixels = np.asarray(Image.open(io.BytesIO(response.data)).convert('L'), dtype=np.float64)
+    assert pixels.shape == (32, 64)
+    assert abs(pixels.mean() - 127.5) < 3
+    assert pixels[:, 0].mean() < 10 and pixels[:, -1].mean() > 245
+
+
+@pytest.mark.parametrize('tool', ['native', 'imageio'])
+def test_16_bit_gray_strip_by_strip(client, gray16, tool, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'TILED_RESIZE_PIXELS', 1)
+    response = client.post(f'/process/{tool}', content_type='multipart/form-data', data={
+        'image': (io.BytesIO(gray16), 'ramp.png'), 'width': '64', 'height': '32', 'format': 'png',
+    })
+    assert response.status_code == 200
+    pixels = np.asarray(Image.open(io.BytesIO(response.data)).convert('L'), dtype=np.float64)
+    assert abs(pixels.mean() - 127.5) < 3
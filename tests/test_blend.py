@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+import app as app_module
+
+
+def _pixels(seed, dtype=np.uint8):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (32, 48, 4)).astype(dtype)
+
+
+def _reference(roi, src):
+    alpha = src[:, :, 3:4].astype(np.float64) / 255
+    expected = roi.copy()
+    expected[:, :, :3] = np.rint(src[:, :, :3] * alpha + roi[:, :, :3] * (1 - alpha))
+    expected[:, :, 3] = src[:, :, 3]
+    return expected
+
+
+@pytest.mark.parametrize('blend', [app_module._numpy_blend_over, app_module._blend_over])
+def test_uint8_blend_is_rounded(blend):
+    roi, src = _pixels(0), _pixels(1)
+    expected = _reference(roi, src)
+    blend(roi, src)
+    np.testing.assert_array_equal(roi, expected)
+
+
+def test_float_blend_stays_in_float32():
+    roi, src = _pixels(0, np.float32), _pixels(1, np.float32)
+    expected = _reference(roi, src)
+    app_module._numpy_blend_over(roi, src)
+    assert roi.dtype == np.float32
+    np.testing.assert_allclose(roi, expected, atol=0.5)
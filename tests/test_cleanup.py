@@ -0,0 +1,28 @@
+import os
+import time
+
+
+def _temp_file(directory, name, age):
+    path = directory / name
+    path.write_bytes(b'data')
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_cleanup_keeps_files_other_processes_may_use(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'UPLOAD_FOLDER', str(tmp_path))
+    recent = _temp_file(tmp_path, 'recent_input', 10)
+    orphan = _temp_file(tmp_path, 'orphan_input', 3600)
+
+    response = client.post('/cleanup', data={'max_age': '0'})
+    assert response.get_json() == {'status': 'cleanup successful', 'removed': 1,
+                                   'max_age': client.application.config['TEMP_FILE_MIN_AGE']}
+    assert recent.exists() and not orphan.exists()
+
+
+def test_cleanup_defaults_to_the_janitor_age(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'UPLOAD_FOLDER', str(tmp_path))
+    kept = _temp_file(tmp_path, 'input', client.application.config['TEMP_FILE_MAX_AGE'] - 60)
+    assert client.post('/cleanup').get_json()['removed'] == 0
+    assert kept.exists()
@@ -0,0 +1,65 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import app as app_module
+import encoding
+import metrics
+
+
+def _sized(quality):
+    # Output size growing with the quality, like a real lossy encoder
+    return b'x' * (quality * 100)
+
+
+@pytest.mark.parametrize('parallelism', [1, 2, 4, 7])
+@pytest.mark.parametrize('max_bytes, quality, expected', [
+    (5000, None, 50), (5050, None, 50), (20000, None, 95), (5000, 40, 40), (500, None, 10), (450, 5, 4),
+])
+def test_fit_size_finds_the_highest_fitting_quality(parallelism, max_bytes, quality, expected):
+    options = {'max_bytes': max_bytes} if quality is None else {'max_bytes': max_bytes, 'quality': quality}
+    with ThreadPoolExecutor(4) as pool:
+        result = encoding.fit_size(lambda o: _sized(o['quality']), options, 'jpg', pool.map, parallelism)
+    assert result == _sized(expected)
+
+
+def test_fit_size_ignores_max_bytes_for_lossless_formats():
+    calls = []
+    encoding.fit_size(lambda options: calls.append(options) or b'', {'max_bytes': 10, 'compress_level': 9}, 'png')
+    assert calls == [{'compress_level': 9}]
+
+
+@pytest.mark.parametrize('tool', ['pillow', 'opencv', 'native', 'imageio'])
+@pytest.mark.parametrize('output_format', ['jpg', 'webp'])
+def test_max_bytes_over_http(client, png, tool, output_format):
+    if tool == 'imageio' and output_format == 'webp':
+        pytest.skip("imageio writes WebP through Pillow, covered by pillow")
+    response = client.post(f'/process/{tool}', content_type='multipart/form-data', data={
+        'image': (io.BytesIO(png), 'a.png'), 'width': '320', 'height': '240', 'format': output_format,
+        'max_bytes': '6000',
+    })
+    assert response.status_code == 200, response.data
+    assert len(response.data) <= 6000
+    assert Image.open(io.BytesIO(response.data)).size == (320, 240)
+    assert 'encode;dur=' in response.headers['Server-Timing']
+
+
+def test_parallel_trials_are_timed_in_the_request(monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'ENCODE_THREADS', 2)
+    monkeypatch.setattr(app_module, '_trial_pool', None)
+
+    def encode(options):
+        with metrics.stage('encode'):
+            time.sleep(0.02)
+        return _sized(options['quality'])
+
+    timer = metrics.start_request()
+    try:
+        app_module._fit_size(encode, {'max_bytes': 5000}, 'jpg')
+    finally:
+        metrics.finish_request()
+    # First encode in this thread, then rounds of two trials in parallel until the range is empty
+    assert timer.stages['encode'] >= 0.02 * 4
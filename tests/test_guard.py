@@ -0,0 +1,75 @@
+import io
+import json
+import struct
+import zipfile
+import zlib
+
+import pytest
+from PIL import Image
+
+from conftest import encode
+
+
+def _png_claiming(width, height):
+    # Valid signature and IHDR announcing width x height, with almost no pixel data behind it
+    png = bytearray(encode(Image.new('RGB', (1, 1))))
+    ihdr = struct.pack('>II', width, height) + bytes(png[24:29])
+    png[16:29] = ihdr
+    png[29:33] = struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+    return bytes(png)
+
+
+def _process(client, source, name='a.png', tool='pillow'):
+    return client.post(f'/process/{tool}', content_type='multipart/form-data',
+                       data={'image': (io.BytesIO(source), name), 'width': '32', 'height': '32'})
+
+
+@pytest.mark.filterwarnings('ignore::PIL.Image.DecompressionBombWarning')
+@pytest.mark.parametrize('tool', ['pillow', 'opencv', 'imagemagick'])
+@pytest.mark.parametrize('size, message', [
+    # Over MAX_IMAGE_PIXELS, then over twice as much, where Pillow's own bomb check fires first
+    (12000, '12000x12000 pixels'), (20000, 'decompression bomb'),
+])
+def test_header_over_pixel_budget(client, tool, size, message):
+    response = _process(client, _png_claiming(size, size), tool=tool)
+    assert response.status_code == 413
+    assert message in response.get_json()['error']
+
+
+def test_spooled_header_over_pixel_budget(client, monkeypatch):
+    # Rejected while the upload is received, before it is written to disk in full
+    monkeypatch.setitem(client.application.config, 'UPLOAD_SPOOL_SIZE', 16)
+    response = _process(client, _png_claiming(20000, 20000) + bytes(200_000))
+    assert response.status_code == 413
+
+
+def test_frames_over_memory_budget(client, monkeypatch):
+    frames = [Image.new('RGB', (100, 100), color) for color in ('red', 'green', 'blue')]
+    source = encode(frames[0], 'GIF', save_all=True, append_images=frames[1:])
+    # Palette frames count as RGBA: 3 x 100 x 100 x 4 bytes
+    monkeypatch.setitem(client.application.config, 'MAX_IMAGE_MEMORY', 100_000)
+    response = _process(client, source, 'a.gif')
+    assert response.status_code == 413
+    assert '3 frame(s)' in response.get_json()['error']
+
+
+def test_within_budget(client, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'MAX_IMAGE_PIXELS', 100 * 100)
+    assert _process(client, encode(Image.new('RGB', (100, 100)))).status_code == 200
+    assert _process(client, encode(Image.new('RGB', (101, 100)))).status_code == 413
+
+
+def test_unreadable_image(client):
+    response = _process(client, b'\x89PNG\r\n\x1a\n' + b'\x00' * 64)
+    assert response.status_code == 422
+
+
+def test_batch_item_over_budget(client):
+    response = client.post('/batch/pillow', content_type='multipart/form-data', data={
+        'images': [(io.BytesIO(_png_claiming(20000, 20000)), 'big.png'),
+                   (io.BytesIO(encode(Image.new('RGB', (64, 64)))), 'small.png')],
+    })
+    assert response.status_code == 200
+    manifest = json.loads(zipfile.ZipFile(io.BytesIO(response.data)).read('manifest.json'))
+    assert 'Image too large' in manifest[0]['error']
+    assert 'file' in manifest[1]
@@ -0,0 +1,80 @@
+import pytest
+from PIL import Image
+
+import app as app_module
+import layout
+from conftest import encode
+
+GRAVITIES = list(layout.GRAVITIES)
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    # Commands are recorded instead of run, the tools do not need to be installed
+    recorded = []
+
+    def run(tool, cmd, input_data=None):
+        recorded.append((tool, cmd))
+        return b'output'
+
+    monkeypatch.setattr(app_module, '_run_command', run)
+    monkeypatch.setattr(app_module, '_get_gm_pool', lambda: None)
+    return recorded
+
+
+def _source(width=300, height=200):
+    return encode(Image.new('RGB', (width, height), 'red'))
+
+
+def _place(args, repage):
+    # Position and canvas size of the resized image after the -border / -crop padding options
+    border = args[args.index('-border') + 1]
+    border_x, border_y = (int(n) for n in border.split('x'))
+    crop = args[args.index('-crop') + 1]
+    size, x, y = crop.split('+')
+    assert args[args.index('-crop') + 2] == repage
+    return (border_x - int(x), border_y - int(y)), tuple(int(n) for n in size.split('x'))
+
+
+@pytest.mark.parametrize('tool, process, repage', [
+    ('imagemagick', app_module.process_imagemagick_bytes, '+repage'),
+    ('graphicsmagick', app_module.process_graphicsmagick_bytes, '+page'),
+])
+@pytest.mark.parametrize('crop_position', GRAVITIES)
+def test_fit_padding(commands, tool, process, repage, crop_position):
+    process(_source(), 'png', 100, 100, resize_mode='fit', crop_position=crop_position, bg_color='blue')
+    [(ran, cmd)] = commands
+    assert ran == tool
+    assert '-splice' not in cmd and '-extent' not in cmd
+    assert cmd[cmd.index('-resize') + 1] == '100x67!'
+    assert cmd[cmd.index('-bordercolor') + 1] == 'blue'
+    plan = layout.plan(300, 200, 100, 100, 'fit', True, crop_position)
+    assert _place(cmd, repage) == (plan.offset, plan.size)
+    assert cmd[-1] == 'png:-'
+
+
+@pytest.mark.parametrize('process', [app_module.process_imagemagick_bytes, app_module.process_graphicsmagick_bytes])
+def test_fill_crops_without_padding(commands, process):
+    process(_source(), 'jpg', 100, 100, resize_mode='fill')
+    [(_, cmd)] = commands
+    assert cmd[cmd.index('-resize') + 1] == '150x100!'
+    assert cmd[cmd.index('-crop') + 1] == '100x100+25+0'
+    assert '-border' not in cmd
+
+
+def test_graphicsmagick_file_command(commands, tmp_path):
+    source = tmp_path / 'in.png'
+    source.write_bytes(_source())
+    output = str(tmp_path / 'out.webp')
+    app_module.process_graphicsmagick(str(source), output, 100, 100, encoder={'quality': 70, 'webp_method': 4})
+    [(tool, cmd)] = commands
+    assert cmd[:2] == ['gm', 'convert'] and cmd[-1] == output
+    assert cmd[cmd.index('-quality') + 1] == '70'
+    assert cmd[cmd.index('-define') + 1] == 'webp:method=4'
+
+
+def test_imagemagick_target_size(commands):
+    app_module.process_imagemagick_bytes(_source(), 'jpg', 100, 100, encoder={'quality': 90, 'max_bytes': 5000})
+    [(_, cmd)] = commands
+    assert cmd[0] == 'convert'
+    assert 'jpeg:extent=5000' in cmd
@@ -0,0 +1,79 @@
+import os
+import stat
+import sys
+import textwrap
+
+import pytest
+
+from magick_pool import MagickBatchPool, _batch_line
+
+# Stand-in for `gm batch -feedback on`: one feedback line (pass or fail token) per command read on stdin
+FAKE_GM = textwrap.dedent('''\
+    import sys, time
+    argv = sys.argv[1:]
+    pass_token = argv[argv.index('-pass') + 1]
+    fail_token = argv[argv.index('-fail') + 1]
+    for line in sys.stdin:
+        if '"fail"' in line:
+            print('gm convert: unable to open image', file=sys.stderr, flush=True)
+            print(fail_token, flush=True)
+        elif '"hang"' in line:
+            time.sleep(10)
+        elif '"exit"' in line:
+            sys.exit(1)
+        else:
+            print(pass_token, flush=True)
+''')
+
+
+@pytest.fixture
+def executable(tmp_path):
+    path = tmp_path / 'gm'
+    path.write_text(f'#!{sys.executable}\n{FAKE_GM}')
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+@pytest.fixture
+def pool(executable):
+    pool = MagickBatchPool(2, max_jobs=3, timeout=1, executable=executable)
+    yield pool
+    pool.close()
+
+
+def test_workers_are_reused(pool):
+    for _ in range(3):
+        pool.run(['convert', 'in.png', 'out.jpg'])
+    assert pool.stats() == {'size': 2, 'idle': 0, 'started': 1, 'restarts': 1}
+    # Recycled after max_jobs commands
+    pool.run(['convert', 'in.png', 'out.jpg'])
+    assert pool.started == 2
+
+
+def test_failure_reports_stderr(pool):
+    with pytest.raises(RuntimeError, match='unable to open image'):
+        pool.run(['fail'])
+    # The worker is still usable
+    pool.run(['convert', 'in.png', 'out.jpg'])
+    assert pool.started == 1
+
+
+@pytest.mark.parametrize('command, message', [('hang', 'timed out'), ('exit', 'batch worker failed')])
+def test_broken_worker_is_replaced(pool, command, message):
+    with pytest.raises(RuntimeError, match=message):
+        pool.run([command])
+    assert pool.restarts == 1
+    pool.run(['convert', 'in.png', 'out.jpg'])
+    assert pool.started == 2
+
+
+def test_batch_line_quotes_every_argument():
+    assert _batch_line(['convert', 'in put.png', '-resize', '10x10!']) == '"convert" "in put.png" "-resize" "10x10!"'
+    with pytest.raises(ValueError):
+        _batch_line(['convert', 'a"b.png'])
+
+
+def test_executable_is_absent(tmp_path):
+    pool = MagickBatchPool(1, executable=os.path.join(str(tmp_path), 'missing-gm'))
+    with pytest.raises(OSError):
+        pool.run(['convert', 'in.png', 'out.jpg'])
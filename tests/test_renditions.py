@@ -0,0 +1,50 @@
+import io
+import json
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import encode
+
+
+@pytest.fixture
+def binary():
+    # Only black and white pixels: nearest neighbour never produces anything else
+    pixels = np.random.default_rng(0).integers(0, 2, (300, 400), dtype=np.uint8) * 255
+    return encode(Image.fromarray(pixels).convert('RGB'))
+
+
+def _renditions(client, tool, data, sizes, **form):
+    response = client.post(f'/renditions/{tool}', content_type='multipart/form-data', data={
+        'image': (io.BytesIO(data), 'binary.png'), 'format': 'png',
+        'renditions': json.dumps([{'width': w, 'height': h} for w, h in sizes]), **form,
+    })
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    return [np.asarray(Image.open(io.BytesIO(archive.read(name)))) for name in sorted(archive.namelist())]
+
+
+@pytest.mark.parametrize('tool', ['pillow', 'opencv'])
+def test_every_level_uses_the_requested_filter(client, binary, tool):
+    for pixels in _renditions(client, tool, binary, [(200, 150), (100, 75), (50, 37)], resampling='nearest'):
+        assert set(np.unique(pixels)) <= {0, 255}
+
+
+@pytest.mark.parametrize('tool', ['pillow', 'opencv'])
+def test_levels_are_not_shared_between_filters(client, binary, tool):
+    response = client.post(f'/renditions/{tool}', content_type='multipart/form-data', data={
+        'image': (io.BytesIO(binary), 'binary.png'), 'format': 'png', 'resampling': 'lanczos',
+        'renditions': json.dumps([{'width': 200, 'height': 150, 'resampling': 'nearest'},
+                                  {'width': 100, 'height': 75}]),
+    })
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    small = np.asarray(Image.open(io.BytesIO(archive.read('1_100x75.png'))))
+    direct = client.post(f'/process/{tool}', content_type='multipart/form-data', data={
+        'image': (io.BytesIO(binary), 'binary.png'), 'format': 'png', 'resampling': 'lanczos',
+        'width': '100', 'height': '75',
+    })
+    # The lanczos rendition starts from the source, not from the nearest level
+    np.testing.assert_array_equal(small, np.asarray(Image.open(io.BytesIO(direct.data))))
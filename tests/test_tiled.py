@@ -0,0 +1,68 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import resample
+from conftest import encode
+
+ENGINES = ('pillow', 'opencv', 'imageio', 'skimage', 'native')
+
+
+@pytest.fixture
+def tiled(monkeypatch, client):
+    # Every source of the tests goes through the strip path
+    monkeypatch.setitem(client.application.config, 'TILED_RESIZE_PIXELS', 10_000)
+
+
+def _tiff(compression):
+    img = Image.effect_mandelbrot((400, 300), (-2, -1.5, 1, 1.5), 64).convert('RGB')
+    return encode(img, 'TIFF', compression=compression)
+
+
+@pytest.mark.parametrize('compression, strips', [('raw', True), ('tiff_adobe_deflate', True), ('packbits', True),
+                                                 ('tiff_lzw', False), ('jpeg', False)])
+def test_tiff_bands_only_for_compressions_tifffile_decodes(compression, strips):
+    reader = resample.tiff_bands(io.BytesIO(_tiff(compression)))
+    assert (reader is not None) == strips
+    if strips:
+        shape, dtype, bands = reader
+        assert shape == (300, 400, 3)
+        assert sum(band.shape[0] for _, band in bands) == 300
+
+
+@pytest.mark.parametrize('tool', ENGINES)
+@pytest.mark.parametrize('compression', ['tiff_lzw', 'tiff_adobe_deflate'])
+def test_large_compressed_tiff(client, tiled, tool, compression):
+    response = client.post(f'/process/{tool}', content_type='multipart/form-data', data={
+        'image': (io.BytesIO(_tiff(compression)), 'big.tiff'), 'width': '200', 'height': '200', 'format': 'png',
+    })
+    assert response.status_code == 200, response.data
+    assert Image.open(io.BytesIO(response.data)).size == (200, 200)
+
+
+def _layouts():
+    for shape, dtype in (((70, 90), 'uint8'), ((70, 90, 3), 'uint16'), ((70, 90, 4), 'uint8')):
+        for layout in ({'rowsperstrip': 16}, {'tile': (32, 32)}):
+            for compression in (None, 'zlib'):
+                yield shape, dtype, layout, compression
+
+
+@pytest.mark.parametrize('shape, dtype, layout, compression', list(_layouts()))
+def test_tiff_bands_match_the_decoded_image(shape, dtype, layout, compression):
+    # Strips and tiles stop short of the image edges, tiles are padded on the right and bottom
+    tifffile = pytest.importorskip('tifffile')
+    expected = np.random.default_rng(0).integers(0, np.iinfo(dtype).max, shape, dtype=dtype)
+    buffer = io.BytesIO()
+    extrasamples = ('unassalpha',) if shape[-1] == 4 else None
+    tifffile.imwrite(buffer, expected, photometric='rgb' if len(shape) == 3 else 'minisblack',
+                     compression=compression, extrasamples=extrasamples, **layout)
+    buffer.seek(0)
+    reader = resample.tiff_bands(buffer)
+    assert reader is not None
+    read_shape, read_dtype, bands = reader
+    assert read_shape == shape and read_dtype == expected.dtype
+    bands = list(bands)
+    assert [y for y, _ in bands] == list(range(0, shape[0], bands[0][1].shape[0]))
+    np.testing.assert_array_equal(np.concatenate([band for _, band in bands]), expected)
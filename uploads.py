@@ -0,0 +1,118 @@
+import hashlib
+import io
+import os
+import uuid
+import weakref
+
+# Bytes of the upload handed to the header sniffer: enough for the header of every supported format,
+# JPEG files with large EXIF/ICC segments may need more and are then only checked after decoding
+SNIFF_SIZE = 64 * 1024
+
+
+class SpooledUpload:
+    """
+    Fichier d'un envoi multipart, écrit au fil de la réception par le parseur de Werkzeug.
+
+    Les premiers spool_size octets restent en mémoire, au-delà tout est écrit dans un fichier de
+    `directory` : la mémoire utilisée par la requête ne dépend pas de la taille de l'envoi. Le hash
+    du contenu est calculé à l'écriture, et `sniff(head)` est appelé dès que les SNIFF_SIZE premiers
+    octets sont là (ou à la fin d'un fichier plus petit). S'il lève une exception, elle est gardée
+    dans `rejection` et la suite de l'envoi est ignorée : les autres fichiers du formulaire restent
+    lisibles, c'est à l'endpoint de refuser la requête ou seulement ce fichier.
+
+    Args:
+        directory (str): Dossier des fichiers temporaires
+        spool_size (int): Taille maximale gardée en mémoire
+        sniff (callable): Vérification de l'en-tête, lève une exception pour refuser le fichier
+        track (callable): Appelé avec le chemin du fichier créé (protection contre le nettoyage)
+        remove (callable): Appelé avec le chemin du fichier à la fermeture, pour le supprimer
+    """
+
+    def __init__(self, directory, spool_size, sniff=None, track=None, remove=None):
+        self.directory = directory
+        self.spool_size = spool_size
+        self.path = None
+        self.size = 0
+        self.hash = hashlib.blake2b(digest_size=20)
+        self.rejection = None
+        self._sniff = sniff
+        self._head = bytearray() if sniff is not None else None
+        self._track = track
+        self._remove = remove
+        self._file = io.BytesIO()
+        self._cleanup = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.rejection is not None:
+            return len(data)
+        self.hash.update(data)
+        if self._head is not None:
+            self._head += data[:SNIFF_SIZE - len(self._head)]
+            if len(self._head) >= SNIFF_SIZE:
+                self._sniff_head()
+                if self.rejection is not None:
+                    return len(data)
+
+        if self.path is None and self.size > self.spool_size:
+            # Roll over to disk, the buffered part is written once
+            self.path = os.path.join(self.directory, f"{uuid.uuid4()}_upload")
+            if self._track is not None:
+                self._track(self.path)
+            spooled = self._file.getvalue()
+            self._file = open(self.path, 'w+b')
+            if self._remove is not None:
+                # Also removed if the parser drops the upload (client disconnect) without closing it
+                self._cleanup = weakref.finalize(self, self._remove, self.path)
+            self._file.write(spooled)
+        return self._file.write(data)
+
+    def _sniff_head(self):
+        head, self._head = bytes(self._head), None
+        try:
+            self._sniff(head)
+        except Exception as e:
+            # The rest of the part is dropped as it arrives, the parser goes on with the next parts
+            self.rejection = e
+            self.close()
+            self.path = None
+            self._file = io.BytesIO()
+
+    def seek(self, offset, whence=0):
+        # The parser seeks back to the start once the part is complete
+        if self._head is not None:
+            self._sniff_head()
+        return self._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def __iter__(self):
+        return iter(self._file)
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        self._file.close()
+        if self._cleanup is not None:
+            self._cleanup()